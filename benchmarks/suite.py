@@ -0,0 +1,219 @@
+"""
+Provena benchmark suite.
+
+Measures wall time and peak memory of each auditing component on synthetic
+datasets built from Groceries_dataset.csv:
+
+    transform      the bare transformation (reference point)
+    audit_trail    the same transformation under @audit_trail, end to end
+    diff           ProvenaLogger._find_changed_rows, positional
+    diff_keyed     ProvenaLogger._find_changed_rows, keyed on row_id
+    hash           ProvenaLogger._compute_hash of the output
+    export         ProvenaLogger.export_json of a pipeline's trail
+
+Results can be written as JSON and compared against a stored baseline; the
+exit status is 1 when any component got slower than the tolerance allows.
+
+Usage:
+    python benchmarks/suite.py --rows 10k 100k 1M --output results.json
+    python benchmarks/suite.py --rows 10k 100k --baseline results.json
+"""
+
+import argparse
+import gc
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import provena
+from provena import ProvenaLogger, audit_trail
+
+from synth import DEFAULT_CSV, load_scaled, parse_count, transform
+
+COMPONENTS = ("transform", "audit_trail", "diff", "diff_keyed", "hash", "export")
+
+# Steps in the exported trail - enough records to make export cost visible
+EXPORT_STEPS = 20
+
+
+def measure(func, repeat, trace_memory=True):
+    """
+    Run func `repeat` times; return (best wall time, peak bytes).
+
+    Peak memory comes from one extra run under tracemalloc, so tracing
+    never inflates the timings.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    peak = None
+    if trace_memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return best, peak
+
+
+def case_name(n_rows, change_ratio, row_delta, n_columns):
+    return f"rows={n_rows},change={change_ratio:g},delta={row_delta:g},cols={n_columns}"
+
+
+def run_case(args, n_rows, change_ratio, row_delta, n_columns):
+    """Benchmark every selected component on one dataset."""
+    before = load_scaled(args.csv, n_rows, n_columns)
+    after = transform(before, change_ratio, row_delta)
+    logger = ProvenaLogger("benchmark")
+
+    @audit_trail(rule_id="BENCHMARK", snapshot=args.snapshot)
+    def audited(data):
+        return transform(data, change_ratio, row_delta)
+
+    export_logger = ProvenaLogger("benchmark_export")
+    export_path = None
+    if "export" in args.components:
+        # Same record repeated: only the serialization cost is measured
+        record = export_logger.log_transformation("step", before, after)
+        export_logger.records.extend([record] * (EXPORT_STEPS - 1))
+        handle, export_path = tempfile.mkstemp(suffix=".json")
+        os.close(handle)
+
+    funcs = {
+        "transform": lambda: transform(before, change_ratio, row_delta),
+        "audit_trail": lambda: audited(before, provena_logger=ProvenaLogger("benchmark")),
+        "diff": lambda: logger._find_changed_rows(before, after),
+        "diff_keyed": lambda: logger._find_changed_rows(before, after, 'row_id'),
+        "hash": lambda: logger._compute_hash(after),
+        "export": lambda: export_logger.export_json(export_path),
+    }
+
+    name = case_name(n_rows, change_ratio, row_delta, n_columns)
+    results = []
+    for component in args.components:
+        wall, peak = measure(funcs[component], args.repeat, not args.no_memory)
+        result = {
+            "case": name,
+            "component": component,
+            "rows": n_rows,
+            "change_ratio": change_ratio,
+            "row_delta": row_delta,
+            "columns": n_columns,
+            "wall_s": round(wall, 6),
+            "rows_per_s": round(n_rows / wall) if wall else None,
+            "peak_bytes": peak,
+        }
+        results.append(result)
+        _print_result(result)
+
+    if export_path:
+        os.remove(export_path)
+    return results
+
+
+def _print_result(result):
+    peak = result["peak_bytes"]
+    peak_text = f"{peak / 1048576:9.1f} MB" if peak is not None else "        -"
+    print(f"{result['case']:<44} {result['component']:<12} {result['wall_s']:9.4f}s "
+          f"{result['rows_per_s'] or 0:>13,} rows/s {peak_text}")
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print how every result moved against the baseline.
+
+    Returns the (case, component) pairs that got slower than 1 + tolerance
+    times their baseline.
+    """
+    previous = {(r["case"], r["component"]): r for r in baseline.get("results", [])}
+    regressions = []
+    print(f"\nComparison with baseline (tolerance {tolerance:.0%})")
+    for result in results:
+        key = (result["case"], result["component"])
+        old = previous.get(key)
+        if old is None or not old.get("wall_s"):
+            print(f"  {key[0]:<44} {key[1]:<12} no baseline")
+            continue
+        ratio = result["wall_s"] / old["wall_s"]
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "  REGRESSION"
+            regressions.append(key)
+        elif ratio < 1 - tolerance:
+            flag = "  faster"
+        print(f"  {key[0]:<44} {key[1]:<12} {ratio:6.2f}x{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--csv", default=DEFAULT_CSV, help="Source CSV file")
+    parser.add_argument("--rows", nargs="+", default=["10k", "100k"],
+                        help="Dataset sizes, e.g. 10k 1M 10M")
+    parser.add_argument("--change-ratio", type=float, nargs="+", default=[0.1],
+                        help="Fractions of rows the transformation modifies")
+    parser.add_argument("--row-delta", type=float, nargs="+", default=[0.0],
+                        help="Fractions of rows deleted (<0) or appended (>0)")
+    parser.add_argument("--columns", type=int, nargs="+", default=[4],
+                        help="Columns per row, row_id included")
+    parser.add_argument("--components", nargs="+", choices=COMPONENTS,
+                        default=list(COMPONENTS), help="Components to measure")
+    parser.add_argument("--snapshot", default="auto",
+                        help="audit_trail snapshot mode (strict, cow, auto)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement (best is kept)")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="Skip the tracemalloc run (much faster on large datasets)")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against a previous --output file")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed slowdown against the baseline (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    results = []
+    for n_rows, change_ratio, row_delta, n_columns in itertools.product(
+            [parse_count(r) for r in args.rows], args.change_ratio,
+            args.row_delta, args.columns):
+        results.extend(run_case(args, n_rows, change_ratio, row_delta, n_columns))
+
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(),
+            "provena_version": provena.__version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "snapshot": args.snapshot,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) found")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
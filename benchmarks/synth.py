@@ -0,0 +1,105 @@
+"""
+Synthetic datasets for the benchmarks.
+
+Every dataset is Groceries_dataset.csv repeated until it holds the requested
+number of rows, with a unique row_id and optional padding columns. The
+matching transformation modifies, deletes or appends a controlled fraction
+of rows, so diff and hash costs can be measured against known answers.
+"""
+
+import csv
+import os
+
+DEFAULT_CSV = os.path.join(os.path.dirname(__file__), "..", "Groceries_dataset.csv")
+
+_base_cache = {}
+
+
+def parse_count(text):
+    """Parse a row count such as '10000', '10k' or '1.5M'."""
+    text = str(text).strip().lower().replace("_", "")
+    factor = {"k": 1000, "m": 1000000}.get(text[-1:], 1)
+    if factor != 1:
+        text = text[:-1]
+    return int(float(text) * factor)
+
+
+def _base_rows(filepath):
+    if filepath not in _base_cache:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            _base_cache[filepath] = list(csv.DictReader(f))
+    return _base_cache[filepath]
+
+
+def load_scaled(filepath, n_rows, n_columns=None):
+    """
+    Repeat the CSV until it holds n_rows rows, keeping a unique row_id.
+
+    With n_columns, rows are padded with extra_<k> columns (or the CSV
+    columns are cut) so that every row has exactly n_columns columns,
+    row_id included.
+    """
+    base = _base_rows(filepath)
+    columns = list(base[0].keys())
+    if n_columns is not None:
+        if n_columns < 2:
+            raise ValueError("n_columns must be at least 2")
+        columns = columns[:n_columns - 1]
+    extra = max(0, (n_columns or 0) - len(columns) - 1)
+
+    rows = []
+    for i in range(n_rows):
+        source = base[i % len(base)]
+        row = {name: source[name] for name in columns}
+        row['row_id'] = i
+        for k in range(extra):
+            row[f'extra_{k}'] = (i * 31 + k) % 997
+        rows.append(row)
+    return rows
+
+
+def _every(ratio):
+    """Stride that touches an evenly spread `ratio` of the rows (0 = none)."""
+    if ratio <= 0:
+        return 0
+    return max(1, int(round(1 / ratio)))
+
+
+def _text_column(row):
+    if 'itemDescription' in row:
+        return 'itemDescription'
+    return next((name for name, value in row.items() if isinstance(value, str)), None)
+
+
+def transform(rows, change_ratio=0.1, row_delta=0.0):
+    """
+    Change an evenly spread fraction of rows.
+
+    Args:
+        rows: Input rows (left untouched)
+        change_ratio: Fraction of rows whose itemDescription (or first text
+            column) is upper-cased
+        row_delta: Fraction of rows removed (negative) or appended (positive)
+    """
+    column = _text_column(rows[0]) if rows else None
+    change_step = _every(change_ratio) if column else 0
+    drop_step = _every(-row_delta)
+
+    result = []
+    for i, row in enumerate(rows):
+        if drop_step and i % drop_step == drop_step - 1:
+            continue
+        if change_step and i % change_step == 0:
+            row = dict(row)
+            value = row[column]
+            row[column] = value.upper() if value != value.upper() else value + "*"
+        result.append(row)
+
+    if row_delta > 0:
+        n_new = int(len(rows) * row_delta)
+        next_id = len(rows)
+        for i in range(n_new):
+            row = dict(rows[i % len(rows)])
+            row['row_id'] = next_id + i
+            result.append(row)
+    return result
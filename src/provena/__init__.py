@@ -3,18 +3,48 @@ Provena - A dependency-free audit trail system for data transformations.
 Track every change, know which rows were affected, and why.
 """
 
-from .audit import audit_trail, audit_pipeline
+from .audit import audit_trail, audit_stream, audit_rows, audit_pipeline
 from .logger import ProvenaLogger, AuditRecord
-from .reporter import generate_terminal_report, generate_json_report
+from .context import ContextThreadPoolExecutor, bind_context, current_logger, use_logger
+from .sinks import AuditSink, JsonlSink
+from .collector import AuditCollector, ShardAudit
+from .cache import ResultCache
+from .reader import TrailFile, filter_records
+from .compare import TrailComparison, compare_trails
+from .segments import SegmentedSink, SegmentedTrail
+from .store import AuditStore, StoreSink
+from .reporter import (generate_terminal_report, generate_json_report, write_terminal_report,
+                       write_json_report)
 from .cli import main
 
 __version__ = "0.1.0"
 __all__ = [
     'audit_trail', 
+    'audit_stream',
+    'audit_rows',
     'audit_pipeline', 
     'ProvenaLogger', 
     'AuditRecord',
+    'current_logger',
+    'use_logger',
+    'bind_context',
+    'ContextThreadPoolExecutor',
+    'AuditSink',
+    'JsonlSink',
+    'SegmentedSink',
+    'SegmentedTrail',
+    'AuditCollector',
+    'ShardAudit',
+    'ResultCache',
+    'TrailFile',
+    'filter_records',
+    'TrailComparison',
+    'compare_trails',
+    'AuditStore',
+    'StoreSink',
     'generate_terminal_report',
     'generate_json_report',
+    'write_terminal_report',
+    'write_json_report',
     'main'
 ]
\ No newline at end of file
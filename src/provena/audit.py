@@ -2,17 +2,75 @@
 The @audit_trail decorator - adds automatic logging to any function.
 """
 
+import asyncio
 import functools
 import copy
-from typing import Callable, Any, Optional, List, Dict
-from .logger import ProvenaLogger
+import inspect
+from itertools import islice
+from datetime import datetime
+from typing import Callable, Any, Optional, List, Dict, Iterable, Iterator, Tuple
+from .cache import ResultCache, input_digest
+from .columnar import column_length, copy_columns, is_columnar
+from .context import _current_logger, current_logger
+from .diff import KeyColumns
+from .levels import SampledCheck
+from .logger import AuditRecord, ProvenaLogger
+from .profiling import StepProfile, measure
+from .sinks import AuditSink
+from .snapshot import (CopyOnWriteRow, fingerprint_rows, resolve_snapshot_mode,
+                       unwrap_rows, wrap_rows)
+from .streaming import DEFAULT_WINDOW, RowDiffer, StreamDiffer, track_input
 
-def audit_trail(rule_id: Optional[str] = None):
+# Rows handed to a row function per micro-batch
+DEFAULT_ROW_BATCH = 10000
+
+# One AuditRecord per run of the function, or per micro-batch
+ROW_RECORD_MODES = ("run", "batch")
+
+def audit_trail(rule_id: Optional[str] = None,
+                snapshot: str = "strict",
+                key_column: Optional[KeyColumns] = None,
+                profile: bool = False,
+                cache: Optional[ResultCache] = None,
+                audit_level: Optional[str] = None):
     """
     Decorator that automatically logs data transformations.
     
     Args:
         rule_id: Business rule identifier (e.g., 'GDPR_MASKING_v1')
+        snapshot: How the input is preserved for the diff:
+            'strict' - deep copy the input (the function gets its own
+                       copy); the default
+            'cow'    - no copy; fingerprint each row and pass copy-on-write
+                       row proxies, so only rows the function writes to are
+                       copied
+            'auto'   - 'strict' below 10,000 rows, 'cow' from there on
+            'strict' stays the default, although large inputs are then
+            deep-copied, because proxies change what the function sees:
+            they are mappings but not dicts (isinstance(row, dict) and
+            json.dumps(row) fail; use row.copy()), and nested values are
+            shared with the caller's rows. Opt in to 'cow' or 'auto' for
+            functions that assign values instead of editing them in place
+        key_column: Column (or list of columns) identifying a row, so that
+            filters, dedups and reorderings are diffed by key
+        profile: Record wall time, CPU time and peak allocation of the
+            function and of the audit overhead in AuditRecord.performance
+            (peak allocation is None for phases that overlapped another
+            step or awaited)
+        cache: ResultCache to reuse the output of an earlier successful
+            call with the same input, code, rule_id and arguments; a hit
+            skips the function and the diff and is logged as CACHED
+        audit_level: 'counts', 'hash', 'sample' or 'full' (see
+            provena.levels); None uses the logger's level. The logger's
+            overhead budget may lower it, see AuditRecord.audit_level
+    
+    The decorated function may also take a dict of columns (lists,
+    array.array or NumPy arrays); it is then audited with the columnar diff
+    and each column is copied shallowly instead of deep-copying rows.
+    Columnar steps are always audited at the 'full' level.
+    
+    `async def` functions are awaited, and the snapshot, diff and hashing
+    run in the event loop's default executor so they don't block it.
     
     Example:
         @audit_trail(rule_id='EMAIL_VALIDATION')
@@ -21,62 +79,597 @@ def audit_trail(rule_id: Optional[str] = None):
             return data
     """
     def decorator(func: Callable):
+        if inspect.iscoroutinefunction(func):
+            return _async_audit_wrapper(func, rule_id, snapshot, key_column, profile, cache,
+                                        audit_level)
+        
         @functools.wraps(func)
         def wrapper(data: List[Dict], *args, **kwargs):
-            # Extract logger from kwargs or create default
-            logger = kwargs.pop('provena_logger', None)
-            if logger is None:
-                logger = ProvenaLogger(pipeline_name=func.__name__)
+            logger = _resolve_logger(func, kwargs)
+            last_output = logger.last_output_state(data)
+            
+            cache_key = None
+            if cache is not None:
+                cache_key, hit, last_output = _cache_lookup(
+                    cache, logger, func, data, rule_id, args, kwargs, key_column, last_output)
+                if hit is not None:
+                    return _log_cached(logger, hit, cache_key)
             
-            # Make a DEEP copy of the data before transformation
-            data_before = copy.deepcopy(data)  # CRITICAL: Deep copy!
+            requested, level = _choose_level(logger, func, data, audit_level)
+            step_profile = _step_profile(logger, profile)
+            with measure(step_profile, "audit"):
+                step = _prepare_step(data, snapshot, last_output, level, key_column,
+                                     logger._compute_hash)
             
             # Execute the transformation
+            with measure(step_profile, "function"):
+                try:
+                    # Pass a COPY (or proxies) to the function, not the original
+                    data_after = unwrap_rows(func(step.data_in, *args, **kwargs))
+                    status = "SUCCESS"
+                    message = None
+                except Exception as e:
+                    # If transformation fails, log the error
+                    data_after = step.data_before
+                    status = "ERROR"
+                    message = f"Transformation failed: {str(e)}"
+            
+            # Log the transformation
+            message = _level_note(message, requested, step.level, logger)
+            with measure(None if profile else step_profile, "audit"):
+                record = _log_step(logger, func, step, data_after, rule_id, key_column,
+                                   status, message, step_profile if profile else None)
+            _observe_cost(logger, func, step, data, step_profile)
+            if cache_key is not None and status == "SUCCESS":
+                cache.put(cache_key, data_after, record.to_dict())
+            
+            # Return the result
+            return data_after
+        return wrapper
+    return decorator
+
+def _async_audit_wrapper(func: Callable,
+                         rule_id: Optional[str],
+                         snapshot: str,
+                         key_column: Optional[KeyColumns],
+                         profile: bool,
+                         cache: Optional[ResultCache],
+                         audit_level: Optional[str]) -> Callable:
+    """audit_trail for coroutine functions."""
+    @functools.wraps(func)
+    async def wrapper(data: List[Dict], *args, **kwargs):
+        logger = _resolve_logger(func, kwargs)
+        loop = asyncio.get_running_loop()
+        last_output = logger.last_output_state(data)
+        
+        cache_key = None
+        if cache is not None:
+            cache_key, hit, last_output = await loop.run_in_executor(None, functools.partial(
+                _cache_lookup, cache, logger, func, data, rule_id, args, kwargs, key_column,
+                last_output))
+            if hit is not None:
+                return _log_cached(logger, hit, cache_key)
+        
+        requested, level = _choose_level(logger, func, data, audit_level)
+        step_profile = _step_profile(logger, profile)
+        # Audit work is measured in the executor thread that does it
+        step = await loop.run_in_executor(None, functools.partial(
+            _measured, step_profile, _prepare_step, data, snapshot, last_output, level,
+            key_column, logger._compute_hash))
+        
+        # Await the transformation on the event loop
+        with measure(step_profile, "function", awaits=True):
             try:
-                # Pass a COPY to the function, not the original
-                data_after = func(copy.deepcopy(data), *args, **kwargs)
+                data_after = unwrap_rows(await func(step.data_in, *args, **kwargs))
                 status = "SUCCESS"
                 message = None
             except Exception as e:
-                # If transformation fails, log the error
-                data_after = data_before
+                data_after = step.data_before
                 status = "ERROR"
                 message = f"Transformation failed: {str(e)}"
+        
+        # Diff, hash and log off the event loop
+        message = _level_note(message, requested, step.level, logger)
+        record = await loop.run_in_executor(None, functools.partial(
+            _measured, None if profile else step_profile, _log_step, logger, func, step,
+            data_after, rule_id, key_column, status, message,
+            step_profile if profile else None))
+        _observe_cost(logger, func, step, data, step_profile)
+        if cache_key is not None and status == "SUCCESS":
+            await loop.run_in_executor(None, cache.put, cache_key, data_after, record.to_dict())
+        
+        return data_after
+    return wrapper
+
+def _measured(profile: Optional[StepProfile], func: Callable, *args) -> Any:
+    """func(*args), measured as the audit phase of profile."""
+    with measure(profile, "audit"):
+        return func(*args)
+
+def _resolve_logger(func: Callable, kwargs: dict) -> ProvenaLogger:
+    """The provena_logger argument, else the current pipeline's logger, else a new one."""
+    logger = kwargs.pop('provena_logger', None)
+    if logger is None:
+        logger = current_logger()
+    if logger is None:
+        logger = ProvenaLogger(pipeline_name=func.__name__)
+    return logger
+
+def _row_count(data: Any) -> int:
+    if is_columnar(data):
+        return column_length(data) if data else 0
+    return len(data)
+
+def _choose_level(logger: ProvenaLogger,
+                  func: Callable,
+                  data: Any,
+                  audit_level: Optional[str]) -> Tuple[str, str]:
+    """(requested level, level the step is audited at)."""
+    requested = audit_level or logger.audit_level
+    if is_columnar(data):
+        return requested, "full"
+    return requested, logger.choose_audit_level(func.__name__, requested, len(data))
+
+def _step_profile(logger: ProvenaLogger, profile: bool) -> Optional[StepProfile]:
+    """StepProfile for the record, or a time-only one for the overhead budget."""
+    if profile:
+        return StepProfile()
+    if logger.overhead_budget:
+        return StepProfile(trace_memory=False)
+    return None
+
+def _level_note(message: Optional[str], requested: str, level: str,
+                logger: ProvenaLogger) -> Optional[str]:
+    """Add a note to the record's message when the budget lowered the level."""
+    if level == requested:
+        return message
+    note = (f"Audit level lowered from '{requested}' to '{level}' to stay within"
+            f" the {logger.overhead_budget:.0%} overhead budget")
+    return f"{message}; {note}" if message else note
+
+def _observe_cost(logger: ProvenaLogger, func: Callable, step: "_PreparedStep",
+                  data: Any, profile: Optional[StepProfile]):
+    if profile is not None and not step.columnar:
+        logger.observe_step_cost(func.__name__, step.level, _row_count(data), profile)
+
+class _PreparedStep:
+    """Input of one audited call: what the function gets and what it is diffed against."""
+    
+    __slots__ = ("columnar", "data_before", "data_in", "fingerprints_before", "hash_before",
+                 "level", "sampled")
+    
+    def __init__(self, columnar, data_before, data_in, fingerprints_before=None, hash_before=None,
+                 level="full", sampled=None):
+        self.columnar = columnar
+        self.data_before = data_before
+        self.data_in = data_in
+        self.fingerprints_before = fingerprints_before
+        self.hash_before = hash_before
+        self.level = level
+        self.sampled = sampled
+
+def _prepare_step(data: Any,
+                  snapshot: str,
+                  last_output: Optional[Tuple[str, Any]] = None,
+                  level: str = "full",
+                  key_column: Optional[KeyColumns] = None,
+                  compute_hash: Optional[Callable[[List[Dict]], str]] = None) -> _PreparedStep:
+    """
+    Snapshot the input according to the snapshot mode and audit level.
+    
+    last_output is the logger's (digest, fingerprints) of data when data
+    is the previous step's output; they are reused instead of recomputed.
+    """
+    if is_columnar(data):
+        # Dict of columns: the function gets a shallow copy of each
+        # column (a memcpy for arrays), the caller's columns stay as-is
+        return _PreparedStep(True, data, copy_columns(data))
+    
+    hash_before, fingerprints = last_output or (None, None)
+    mode = resolve_snapshot_mode(snapshot, data)
+    if level != "full":
+        # Below 'full' the input is neither kept as a second copy nor
+        # fingerprinted: whatever the level needs of it (its digest, the
+        # sampled rows) is taken before the function runs. The function
+        # still gets what the snapshot mode promises
+        if level != "counts" and hash_before is None:
+            hash_before = compute_hash(data)
+        sampled = SampledCheck(data, key_column) if level == "sample" else None
+        data_in = copy.deepcopy(data) if mode == "strict" else wrap_rows(data)
+        return _PreparedStep(False, data, data_in, None, hash_before, level, sampled)
+    
+    if mode == "strict":
+        # Make a DEEP copy of the data before transformation
+        data_before = copy.deepcopy(data)  # CRITICAL: Deep copy!
+        return _PreparedStep(False, data_before, copy.deepcopy(data), None, hash_before)
+    
+    # Copy-free: the input stays untouched because the function
+    # only sees proxies, and fingerprints catch nested mutations
+    if fingerprints is None:
+        fingerprints = fingerprint_rows(data)
+    return _PreparedStep(False, data, wrap_rows(data), fingerprints, hash_before)
+
+def _log_step(logger: ProvenaLogger,
+              func: Callable,
+              step: _PreparedStep,
+              data_after: Any,
+              rule_id: Optional[str],
+              key_column: Optional[KeyColumns],
+              status: str,
+              message: Optional[str],
+              profile: Optional[StepProfile]) -> AuditRecord:
+    """Diff the step's output against its input and log the record."""
+    if step.columnar:
+        return logger.log_columnar_transformation(
+            function_name=func.__name__,
+            columns_before=step.data_before,
+            columns_after=data_after,
+            rule_id=rule_id,
+            status=status,
+            message=message,
+            profile=profile
+        )
+    
+    if step.level != "full":
+        return logger.log_partial_transformation(
+            function_name=func.__name__,
+            data_before=step.data_before,
+            data_after=data_after,
+            audit_level=step.level,
+            rule_id=rule_id,
+            key_column=key_column,
+            status=status,
+            message=message,
+            hash_before=step.hash_before,
+            sampled=step.sampled,
+            profile=profile
+        )
+    
+    return logger.log_transformation(
+        function_name=func.__name__,
+        data_before=step.data_before,  # Original unchanged data
+        data_after=data_after,         # Result after transformation
+        rule_id=rule_id,
+        key_column=key_column,
+        status=status,
+        message=message,
+        fingerprints_before=step.fingerprints_before,
+        profile=profile,
+        hash_before=step.hash_before
+    )
+
+def _cache_lookup(cache: ResultCache,
+                  logger: ProvenaLogger,
+                  func: Callable,
+                  data: Any,
+                  rule_id: Optional[str],
+                  args: tuple,
+                  kwargs: dict,
+                  key_column: Optional[KeyColumns],
+                  last_output: Optional[Tuple[str, Any]]
+                  ) -> Tuple[Optional[str], Optional[Tuple[Any, Dict]],
+                             Optional[Tuple[str, Any]]]:
+    """
+    (cache key, cached entry or None, last_output) of a call.
+    
+    The key is None when the function can't be cached reliably; the call
+    then runs and is logged as if there were no cache.
+    
+    With ordered hashing the cache's input digest is the step's
+    hash_before, so the input is hashed once: a known hash_before becomes
+    the input digest, or the input digest becomes the hash_before.
+    """
+    data_digest = None
+    if logger.hash_mode == "ordered" and not is_columnar(data):
+        data_digest = last_output[0] if last_output else input_digest(data)
+        if last_output is None:
+            last_output = (data_digest, None)
+    cache_key = cache.key(func, data, rule_id, args, kwargs, key_column, data_digest)
+    if cache_key is None:
+        return None, None, last_output
+    return cache_key, cache.get(cache_key), last_output
+
+def _log_cached(logger: ProvenaLogger, hit: Tuple[Any, Dict], cache_key: str) -> Any:
+    """Log a cache hit as a CACHED copy of the original run's record."""
+    output, record_data = hit
+    record = AuditRecord.from_dict(record_data)
+    record.timestamp = datetime.now().isoformat()
+    record.status = "CACHED"
+    record.message = f"Result reused from cache (key {cache_key[:12]})"
+    record.performance = None
+    logger.append_record(record)
+    # The next step can take over the output's digest from the record
+    logger.remember_output(output, record.hash_after)
+    return output
+
+def audit_stream(rule_id: Optional[str] = None,
+                 key_column: Optional[KeyColumns] = None,
+                 window: int = DEFAULT_WINDOW):
+    """
+    Decorator that audits a transformation over a stream of rows.
+    
+    The decorated function takes an iterable of rows and returns (or yields)
+    rows. Nothing is materialized: input rows are diffed against output rows
+    as they flow through, and the AuditRecord is logged once the output has
+    been fully consumed.
+    
+    Args:
+        rule_id: Business rule identifier (e.g., 'GDPR_MASKING_v1')
+        key_column: Column (or list of columns) identifying a row. Output
+            rows are matched by key against pending input rows; otherwise
+            by position
+        window: Maximum number of input rows held while waiting for their
+            output row; older ones are counted as deleted
+    
+    Example:
+        @audit_stream(rule_id='DROP_EMPTY', key_column='id')
+        def drop_empty(rows):
+            for row in rows:
+                if row['email']:
+                    yield row
+        
+        with open('in.csv') as f:
+            for row in drop_empty(csv.DictReader(f), provena_logger=logger):
+                writer.writerow(row)
+    """
+    def decorator(func: Callable):
+        @functools.wraps(func)
+        def wrapper(rows: Iterable[Dict], *args, **kwargs) -> Iterator[Dict]:
+            logger = _resolve_logger(func, kwargs)
             
-            # Log the transformation
-            logger.log_transformation(
-                function_name=func.__name__,
-                data_before=data_before,  # Original unchanged data
-                data_after=data_after,    # Result after transformation
-                rule_id=rule_id,
-                status=status,
-                message=message
-            )
+            differ = StreamDiffer(key_column, window, logger.hash_mode,
+                                  logger.change_samples)
+            return _audited_stream(func, rows, args, kwargs, logger, differ, rule_id)
+        return wrapper
+    return decorator
+
+def _audited_stream(func: Callable,
+                    rows: Iterable[Dict],
+                    args: tuple,
+                    kwargs: dict,
+                    logger: ProvenaLogger,
+                    differ: StreamDiffer,
+                    rule_id: Optional[str]) -> Iterator[Dict]:
+    """Run a streaming transformation and log it when the stream ends."""
+    status = "SUCCESS"
+    message = None
+    try:
+        for row in func(track_input(rows, differ), *args, **kwargs):
+            if isinstance(row, CopyOnWriteRow):
+                row = row.unwrap()
+            differ.add_output(row)
+            yield row
+    except GeneratorExit:
+        status = "WARNING"
+        message = "Stream closed before it was exhausted"
+        raise
+    except Exception as e:
+        # A stream cannot be rewound, so log the error and re-raise
+        status = "ERROR"
+        message = f"Transformation failed: {str(e)}"
+        raise
+    finally:
+        logger.log_stream(
+            function_name=func.__name__,
+            differ=differ,
+            rule_id=rule_id,
+            status=status,
+            message=message
+        )
+
+def audit_rows(rule_id: Optional[str] = None,
+               batch_size: int = DEFAULT_ROW_BATCH,
+               record_per: str = "run"):
+    """
+    Decorator that audits a row -> row function over a whole dataset or
+    stream.
+    
+    The decorated function takes one row and returns the cleaned row (the
+    same row edited in place, or a new dict), or None to drop it. Called
+    with a list of rows it returns the list of output rows; called with
+    any other iterable it returns an iterator, and rows are pulled and
+    processed batch_size at a time.
+    
+    Each row is handed over as a copy-on-write proxy and compared only with
+    its own input row: rows the function doesn't write to cost no copy and
+    no comparison. A row whose call raises passes through unchanged and
+    the record gets the ERROR status.
+    
+    Args:
+        rule_id: Business rule identifier (e.g., 'PHONE_NORMALIZATION')
+        batch_size: Rows per micro-batch
+        record_per: 'run' (one AuditRecord per call, logged once every row
+            is processed) or 'batch' (one per micro-batch, positions within
+            the batch)
+    
+    Example:
+        @audit_rows(rule_id='TRIM_NAMES')
+        def trim_name(row):
+            row['name'] = row['name'].strip()
+            return row
+        
+        data = trim_name(data)                   # List[Dict] -> List[Dict]
+        for row in trim_name(csv.DictReader(f)):  # streams batch by batch
+            writer.writerow(row)
+    
+    The undecorated row function stays available as trim_name.__wrapped__.
+    """
+    if record_per not in ROW_RECORD_MODES:
+        raise ValueError(f"Unknown record_per '{record_per}', expected one of {ROW_RECORD_MODES}")
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    
+    def decorator(func: Callable):
+        @functools.wraps(func)
+        def wrapper(rows: Iterable[Dict], *args, **kwargs):
+            logger = _resolve_logger(func, kwargs)
             
-            # Return the result
-            return data_after
+            run = _RowRun(func, args, kwargs, logger, rule_id, record_per == "batch")
+            if not isinstance(rows, list):
+                return _audited_rows(run, rows, batch_size)
+            output = []
+            for start in range(0, len(rows), batch_size):
+                output.extend(run.process(rows[start:start + batch_size]))
+            run.finish()
+            return output
         return wrapper
     return decorator
 
-def audit_pipeline(pipeline_name: str = "Data_Pipeline"):
+class _RowRun:
+    """One call of an @audit_rows function: applies it and logs the records."""
+    
+    def __init__(self, func: Callable, args: tuple, kwargs: dict, logger: ProvenaLogger,
+                 rule_id: Optional[str], per_batch: bool):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.logger = logger
+        self.rule_id = rule_id
+        self.per_batch = per_batch
+        self.differ = RowDiffer(logger.hash_mode, logger.change_samples)
+        self.batch_start = 0
+        self.failed = 0
+        self.first_failure: Optional[str] = None
+    
+    def process(self, batch: List[Dict]) -> List[Dict]:
+        """Apply the function to a batch of rows and diff them; returns the output rows."""
+        func, args, kwargs = self.func, self.args, self.kwargs
+        offset = self.batch_start + self.differ.rows_before
+        results = []
+        append = results.append
+        for position, row in enumerate(batch, offset):
+            proxy = CopyOnWriteRow(row)
+            try:
+                append(func(proxy, *args, **kwargs))
+            except Exception as e:
+                # The row is kept as it was
+                if self.first_failure is None:
+                    self.first_failure = f"row {position}: {e}"
+                self.failed += 1
+                append(row)
+        output = self.differ.add_batch(batch, results)
+        if self.per_batch:
+            self.log()
+        return output
+    
+    def log(self, status: Optional[str] = None, message: Optional[str] = None):
+        """Log the rows diffed since the last record."""
+        differ = self.differ
+        if message is None and self.failed:
+            message = (f"Transformation failed on {self.failed} rows, which were kept "
+                       f"unchanged (first: {self.first_failure})")
+        if self.per_batch and differ.rows_before:
+            rows = f"Input rows {self.batch_start}-{self.batch_start + differ.rows_before - 1}"
+            message = f"{rows}; {message}" if message else rows
+        self.logger.log_stream(
+            function_name=self.func.__name__,
+            differ=differ,
+            rule_id=self.rule_id,
+            status=status or ("ERROR" if self.failed else "SUCCESS"),
+            message=message
+        )
+        self.batch_start += differ.rows_before
+        self.differ = RowDiffer(self.logger.hash_mode, self.logger.change_samples)
+        self.failed = 0
+        self.first_failure = None
+    
+    def finish(self, status: Optional[str] = None, message: Optional[str] = None):
+        """Log what is left: the whole run, or the rows of an unfinished batch."""
+        if not self.per_batch or self.differ.rows_before or (status and not self.batch_start):
+            self.log(status, message)
+
+def _audited_rows(run: _RowRun, rows: Iterable[Dict], batch_size: int) -> Iterator[Dict]:
+    """Pull a stream batch by batch through an @audit_rows function."""
+    source = iter(rows)
+    status = None
+    message = None
+    try:
+        while True:
+            batch = list(islice(source, batch_size))
+            if not batch:
+                break
+            yield from run.process(batch)
+    except GeneratorExit:
+        status = "WARNING"
+        message = "Stream closed before it was exhausted"
+        raise
+    except Exception as e:
+        # The input stream itself failed
+        status = "ERROR"
+        message = f"Transformation failed: {str(e)}"
+        raise
+    finally:
+        run.finish(status, message)
+
+def audit_pipeline(pipeline_name: str = "Data_Pipeline",
+                   sink: Optional[AuditSink] = None,
+                   keep_records: bool = True,
+                   reuse_last_output: bool = True,
+                   audit_level: str = "full",
+                   overhead_budget: Optional[float] = None):
     """
     Context manager for running multiple transformations in a pipeline.
     
+    Args:
+        pipeline_name: Name of the pipeline
+        sink: Optional AuditSink (e.g. JsonlSink) that receives every record
+            as it is logged; it is finalized on exit instead of writing
+            {pipeline_name}_audit.json
+        keep_records: Keep records in memory (logger.records) as well
+        reuse_last_output: Hand each step's output digest and row
+            fingerprints to the next step instead of recomputing them
+            (see ProvenaLogger.last_output_state)
+        audit_level: Level of steps that don't set their own (see
+            provena.levels)
+        overhead_budget: Allowed audit time as a fraction of each step's
+            own time (e.g. 0.05 = 5%); steps expected to exceed it are
+            audited at a lower level
+    
+    The logger is also made the current one (see provena.context), so
+    steps inside the block - including steps in asyncio tasks and in
+    ContextThreadPoolExecutor threads - don't need provena_logger=.
+    
     Example:
         with audit_pipeline("Customer_Cleaning") as logger:
-            data = step1(data, provena_logger=logger)
-            data = step2(data, provena_logger=logger)
+            data = step1(data)
+            data = step2(data, provena_logger=logger)  # explicit also works
         # logger contains full audit trail
+        
+        async with audit_pipeline("Ingestion") as logger:
+            data = await async_step(data)
     """
     class PipelineContext:
         def __init__(self, name):
-            self.logger = ProvenaLogger(name)
+            self.logger = ProvenaLogger(name, sink=sink, keep_records=keep_records,
+                                        reuse_last_output=reuse_last_output,
+                                        audit_level=audit_level,
+                                        overhead_budget=overhead_budget)
             self.data = None
+            self._token = None
         
         def __enter__(self):
+            # Steps called without provena_logger= log here
+            self._token = _current_logger.set(self.logger)
             return self.logger
         
         def __exit__(self, exc_type, exc_val, exc_tb):
+            _current_logger.reset(self._token)
+            self._finish()
+        
+        async def __aenter__(self):
+            return self.__enter__()
+        
+        async def __aexit__(self, exc_type, exc_val, exc_tb):
+            _current_logger.reset(self._token)
+            # Export (or sink flush) happens off the event loop
+            await asyncio.get_running_loop().run_in_executor(None, self._finish)
+        
+        def _finish(self):
+            if self.logger.sink is not None:
+                # Records are already on their way - just finalize the sink
+                self.logger.close()
+                return
+            
             # Export audit trail automatically
             if self.logger.records:
                 filename = f"{self.logger.pipeline_name}_audit.json"
@@ -0,0 +1,274 @@
+"""
+Content-addressed cache of audited step results.
+
+A step's result is looked up by the digest of its full input, a hash of
+the function's code, its rule_id and its extra arguments. On a hit the
+cached output is returned without running the function or the diff, and
+the step is logged with status CACHED and the counts of the original run.
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+import types
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .columnar import column_length, is_columnar
+from .hashing import digest_columns, digest_rows
+
+# Default size limit of the cache directory
+DEFAULT_CACHE_BYTES = 1 << 30
+
+_ENTRY_SUFFIX = ".pkl"
+
+
+def _code_parts(code: types.CodeType):
+    """Everything that defines what a code object does, minus line numbers."""
+    yield code.co_code
+    yield repr(code.co_names).encode()
+    yield repr(code.co_varnames).encode()
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            # Nested functions, lambdas and comprehensions
+            yield from _code_parts(const)
+        else:
+            yield repr(const).encode()
+
+
+class _Unstable(Exception):
+    """A value whose repr differs between runs (e.g. it contains an address)."""
+
+
+def _global_names(code: types.CodeType):
+    """Names a code object and its nested code objects may load as globals."""
+    yield from code.co_names
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            yield from _global_names(const)
+
+
+class _Seen(set):
+    """Ids of the functions being hashed, and the module they come from."""
+
+    def __init__(self, module: Optional[str]):
+        super().__init__()
+        self.module = module
+
+
+def _stable_repr(value: Any, seen: _Seen) -> str:
+    """repr of a value that is the same in every run, or raise _Unstable."""
+    if value is None or isinstance(value, (bool, int, float, complex, str, bytes)):
+        return repr(value)
+    if isinstance(value, (tuple, list)):
+        items = ", ".join(_stable_repr(item, seen) for item in value)
+        return f"{type(value).__name__}({items})"
+    if isinstance(value, (set, frozenset)):
+        items = ", ".join(sorted(_stable_repr(item, seen) for item in value))
+        return f"{type(value).__name__}({items})"
+    if isinstance(value, dict):
+        items = sorted(f"{_stable_repr(k, seen)}: {_stable_repr(v, seen)}"
+                       for k, v in value.items())
+        return "{" + ", ".join(items) + "}"
+    value = getattr(value, "__wrapped__", value)
+    if isinstance(value, types.FunctionType) and value.__module__ == seen.module:
+        return "function " + _function_hash(value, seen)
+    if isinstance(value, types.ModuleType):
+        return "module " + value.__name__
+    if isinstance(value, (type, types.FunctionType, types.BuiltinFunctionType)):
+        # Code from other modules is identified by name
+        return f"{getattr(value, '__module__', None)}.{value.__qualname__}"
+    text = repr(value)
+    if " at 0x" in text:
+        raise _Unstable(text)
+    return text
+
+
+def _function_hash(func: types.FunctionType, seen: _Seen) -> str:
+    """Hash of a function's code and of the values it closes over."""
+    digest = hashlib.sha256(func.__qualname__.encode())
+    if id(func) in seen:
+        # Recursion - the function is already being hashed
+        return digest.hexdigest()
+    seen.add(id(func))
+    code = func.__code__
+    for part in _code_parts(code):
+        digest.update(part)
+    cells = []
+    for cell in func.__closure__ or ():
+        try:
+            cells.append(cell.cell_contents)
+        except ValueError:
+            cells.append("<empty cell>")
+    global_values = {name: func.__globals__[name] for name in set(_global_names(code))
+                     if name in func.__globals__}
+    for value in (func.__defaults__, func.__kwdefaults__, cells, global_values):
+        digest.update(_stable_repr(value, seen).encode("utf-8", "surrogatepass"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def code_hash(func: Callable) -> Optional[str]:
+    """
+    Hash of a function's code and of the values it depends on.
+
+    Covers the bytecode, constants and names, the default arguments, the
+    contents of closure cells and the globals the function refers to
+    (functions of the same module by their code, other functions and
+    classes by name). Moving the function or editing comments keeps the
+    hash; changing what it does changes it.
+
+    Returns None when one of those values has no repr that is stable
+    between runs (e.g. an object printed with its address), as such a
+    function can't be cached reliably.
+    """
+    func = getattr(func, "__wrapped__", func)
+    if not isinstance(func, types.FunctionType):
+        text = repr(func)
+        if " at 0x" in text:
+            return None
+        name = getattr(func, "__qualname__", type(func).__qualname__)
+        return hashlib.sha256(f"{name}:{text}".encode()).hexdigest()
+    try:
+        return _function_hash(func, _Seen(func.__module__))
+    except (_Unstable, RecursionError):
+        return None
+
+
+def input_digest(data: Any) -> str:
+    """Order-sensitive digest of a step's whole input (rows or columns)."""
+    if is_columnar(data):
+        return digest_columns(data, column_length(data)).root
+    return digest_rows(data).root
+
+
+class ResultCache:
+    """
+    On-disk cache of step outputs and their AuditRecords.
+
+    Each entry is one pickle file named after its key. When the directory
+    grows past max_bytes, the least recently used entries are evicted
+    (a hit refreshes an entry's modification time).
+
+    Args:
+        directory: Where entries are stored (created if missing)
+        max_bytes: Size limit of all entries together
+
+    Example:
+        cache = ResultCache(".provena_cache")
+
+        @audit_trail(rule_id='DEDUP', cache=cache)
+        def dedup(data):
+            ...
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_CACHE_BYTES):
+        if max_bytes < 1:
+            raise ValueError("max_bytes must be positive")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self,
+            func: Callable,
+            data: Any,
+            rule_id: Optional[str],
+            args: Tuple = (),
+            kwargs: Optional[Dict[str, Any]] = None,
+            key_column: Any = None,
+            data_digest: Optional[str] = None) -> Optional[str]:
+        """
+        Cache key of one call; values in args must have a deterministic repr.
+
+        data_digest is input_digest(data) when the caller already has it.
+        None when the function can't be cached (see code_hash).
+        """
+        func_hash = code_hash(func)
+        if func_hash is None:
+            return None
+        if data_digest is None:
+            data_digest = input_digest(data)
+        digest = hashlib.sha256()
+        for part in (data_digest, func_hash, repr(rule_id), repr(key_column),
+                     repr(args), repr(sorted((kwargs or {}).items()))):
+            digest.update(part.encode("utf-8", "surrogatepass"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + _ENTRY_SUFFIX)
+
+    def get(self, key: str) -> Optional[Tuple[Any, Dict[str, Any]]]:
+        """(output, record dict) for a key, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            # Corrupt or stale entry - treat as a miss
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)  # Most recently used
+        except OSError:
+            pass
+        return entry["output"], entry["record"]
+
+    def put(self, key: str, output: Any, record: Dict[str, Any]) -> bool:
+        """
+        Store an entry; returns False if the output can't be pickled.
+
+        The file is written under a temporary name and renamed, so readers
+        never see a partial entry.
+        """
+        try:
+            payload = pickle.dumps({"output": output, "record": record},
+                                   protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return False
+        if len(payload) > self.max_bytes:
+            return False
+
+        handle, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        self._evict()
+        return True
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(_ENTRY_SUFFIX):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue  # Removed by another process meanwhile
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def clear(self):
+        """Remove every entry."""
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(_ENTRY_SUFFIX):
+                self._remove(entry.path)
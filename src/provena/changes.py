@@ -0,0 +1,168 @@
+"""
+Per-column change statistics and a representative sample of changed rows,
+collected while the diff runs.
+
+Only modified rows reach ChangeStats, so unchanged rows cost nothing extra,
+and memory stays fixed: one set of counters per column plus at most
+sample_size row pairs.
+"""
+
+import heapq
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Changed row pairs kept per step
+DEFAULT_CHANGE_SAMPLES = 5
+
+COUNTERS = ("changed", "nulled", "filled", "type_changed")
+
+# Fibonacci hashing: spreads consecutive positions over the 64-bit range
+_MIX = 0x9E3779B97F4A7C15
+_MASK_64 = (1 << 64) - 1
+
+
+def _is_null(value: Any) -> bool:
+    """None, an empty string (CSV) or NaN."""
+    return value is None or value == "" or (isinstance(value, float) and value != value)
+
+
+def _same(val_before: Any, val_after: Any) -> bool:
+    """Values that compare unequal but are no change (NaN -> NaN, same object)."""
+    return val_before is val_after or (
+        _is_null(val_before) and _is_null(val_after) and type(val_before) is type(val_after))
+
+
+def sample_priority(position: int) -> int:
+    """Pseudo-random but fixed rank of an output row in the sample."""
+    return ((position + 1) * _MIX) & _MASK_64
+
+
+class ChangeStats:
+    """
+    Column counters and a bottom-k sample of the modified rows of a step.
+
+    For every column: how many rows changed it, and of those how many went
+    from a value to null ('nulled'), from null to a value ('filled') or to a
+    value of another type ('type_changed'). Null is None, '' or NaN; a
+    missing column reads as None.
+
+    The sample keeps the k rows with the lowest sample_priority(output
+    position): a uniform pick over the whole output that, unlike a
+    random-replacement reservoir, does not depend on the order rows arrive
+    in, so stats built per shard and merged hold the same sample as stats
+    built in one pass.
+
+    Args:
+        sample_size: Changed row pairs to keep (0 = counters only)
+    """
+
+    __slots__ = ("sample_size", "columns", "_heap")
+
+    def __init__(self, sample_size: int = DEFAULT_CHANGE_SAMPLES):
+        if sample_size < 0:
+            raise ValueError("sample_size must not be negative")
+        self.sample_size = sample_size
+        self.columns: Dict[Any, List[int]] = {}
+        # Max-heap on priority (negated) of (priority, j, i, changes)
+        self._heap: List[Tuple[int, int, int, Dict[Any, Tuple[Any, Any]]]] = []
+
+    def add(self, i: int, j: int, row_before: Dict, row_after: Dict):
+        """Count the changes between input row i and output row j."""
+        # The changed values are only kept for rows that make the sample
+        neg_priority = -sample_priority(j)
+        heap = self._heap
+        sampled = self.sample_size and (len(heap) < self.sample_size
+                                        or neg_priority > heap[0][0])
+        changes = {} if sampled else None
+        found = False
+
+        get = row_after.get
+        for column, val_before in row_before.items():
+            val_after = get(column)
+            if val_before == val_after or _same(val_before, val_after):
+                continue
+            self._count(column, val_before, val_after)
+            found = True
+            if sampled:
+                changes[column] = (val_before, val_after)
+        if row_after.keys() != row_before.keys():
+            for column in row_after.keys() - row_before.keys():
+                val_after = row_after[column]
+                if not _is_null(val_after):
+                    self._count(column, None, val_after)
+                    found = True
+                    if sampled:
+                        changes[column] = (None, val_after)
+
+        # Rows that differ only inside a shared nested object (caught by
+        # fingerprints) show no column change and are not sampled
+        if found and sampled:
+            self._offer(neg_priority, j, i, changes)
+
+    def _count(self, column: Any, val_before: Any, val_after: Any):
+        counters = self.columns.get(column)
+        if counters is None:
+            counters = self.columns[column] = [0, 0, 0, 0]
+        counters[0] += 1
+        null_before = _is_null(val_before)
+        null_after = _is_null(val_after)
+        if null_after and not null_before:
+            counters[1] += 1
+        elif null_before and not null_after:
+            counters[2] += 1
+        elif type(val_before) is not type(val_after):
+            counters[3] += 1
+
+    def _offer(self, neg_priority: int, j: int, i: int, changes: Dict):
+        heap = self._heap
+        if len(heap) < self.sample_size:
+            heapq.heappush(heap, (neg_priority, j, i, changes))
+        elif neg_priority > heap[0][0]:
+            heapq.heapreplace(heap, (neg_priority, j, i, changes))
+
+    def merge(self, other: "ChangeStats"):
+        """Add the stats of another part of the same step (e.g. a shard)."""
+        for column, counts in other.columns.items():
+            counters = self.columns.setdefault(column, [0, 0, 0, 0])
+            for n, count in enumerate(counts):
+                counters[n] += count
+        for entry in other._heap:
+            self._offer(*entry)
+
+    def column_stats(self) -> Dict[str, Dict[str, int]]:
+        """{column: {'changed': n, 'nulled': n, 'filled': n, 'type_changed': n}}."""
+        return {str(column): dict(zip(COUNTERS, counters))
+                for column, counters in sorted(self.columns.items(),
+                                               key=lambda item: (-item[1][0], str(item[0])))}
+
+    def samples(self) -> List[Dict[str, Any]]:
+        """Sampled row pairs in output order, with only their changed columns."""
+        return [{"row": j, "input_row": i,
+                 "changes": {str(column): list(values) for column, values in changes.items()}}
+                for _, j, i, changes in sorted(self._heap, key=lambda entry: entry[1])]
+
+
+def merge_column_stats(parts: Iterable[Optional[Dict[str, Dict[str, int]]]]
+                       ) -> Optional[Dict[str, Dict[str, int]]]:
+    """Sum the column_stats of several records (e.g. shards of one step)."""
+    merged: Dict[str, Dict[str, int]] = {}
+    found = False
+    for part in parts:
+        if part is None:
+            continue
+        found = True
+        for column, counts in part.items():
+            totals = merged.setdefault(column, dict.fromkeys(COUNTERS, 0))
+            for name in COUNTERS:
+                totals[name] += counts.get(name, 0)
+    if not found:
+        return None
+    return dict(sorted(merged.items(), key=lambda item: (-item[1]["changed"], item[0])))
+
+
+def pick_samples(samples: Iterable[Dict[str, Any]], sample_size: int) -> List[Dict[str, Any]]:
+    """
+    Keep sample_size of several records' samples, by the priority of their
+    (already shifted) output row, in output order.
+    """
+    chosen = heapq.nsmallest(sample_size, samples, key=lambda s: sample_priority(s["row"]))
+    return sorted(chosen, key=lambda s: s["row"])
@@ -2,12 +2,215 @@
 Command-line interface for Provena.
 """
 
+import os
 import sys
 import json
+import sqlite3
 import argparse
-from typing import List
-from .logger import ProvenaLogger
-from .reporter import generate_terminal_report, generate_json_report
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+from .logger import AuditRecord
+from .reader import record_filter, summarize
+from .segments import SegmentedTrail, open_trail
+from .compare import DIVERGENCE_KINDS, TrailComparison
+from .reporter import write_json_report, write_terminal_report
+from .store import RANGE_KINDS, AuditStore
+
+def _report(parsed_args) -> int:
+    """provena report: render an audit file without loading it into memory."""
+    trail = open_trail(parsed_args.json_file)
+    where = record_filter(statuses=parsed_args.status, rule_ids=parsed_args.rule,
+                          functions=parsed_args.function, since=parsed_args.since,
+                          until=parsed_args.until)
+    
+    run = parsed_args.run
+    
+    # The stored summary covers the whole trail; a filtered selection or a
+    # single run (or a JSON Lines trail, which stores none, or an export
+    # older than the inserted/deleted totals) is summarized in a first pass
+    summary = trail.summary
+    if (summary is None or "total_inserted" not in summary or where is not None
+            or run is not None):
+        records = trail.records(run=run)
+        if where is not None:
+            records = filter(where, records)
+        summary = summarize(trail.pipeline_name, records)
+    
+    args = (trail.pipeline_name, summary, trail.records(run=run))
+    options = dict(page=parsed_args.page, page_size=parsed_args.page_size,
+                   top=parsed_args.top, where=where)
+    if parsed_args.format == "terminal":
+        write_terminal_report(sys.stdout, *args, **options)
+        sys.stdout.write("\n")
+    elif parsed_args.output:
+        with open(parsed_args.output, 'w', encoding='utf-8') as f:
+            write_json_report(f, *args, **options)
+    else:
+        write_json_report(sys.stdout, *args, **options)
+    return 0
+
+def _describe_divergence(divergence: Dict[str, Any]) -> str:
+    kind = divergence["kind"]
+    rule = f" [{divergence['rule_id']}]" if divergence["rule_id"] else ""
+    step = f"{divergence['function_name']}{rule}"
+    if kind == "missing":
+        return f"missing: {step} ({divergence['baseline_step']} has no counterpart)"
+    if kind == "new":
+        return f"new: {step} ({divergence['candidate_step']} has no counterpart)"
+    return (f"{kind}: {step} {divergence['baseline_step']} → {divergence['candidate_step']}: "
+            f"{divergence['baseline']} → {divergence['candidate']}")
+
+def _run_records(path: str, run: Optional[int]) -> Iterator[AuditRecord]:
+    """Records of one run of a trail, by default its last one."""
+    trail = open_trail(path)
+    runs = trail.runs
+    if run is None and runs:
+        run = runs[-1]
+    elif run is not None and run not in runs:
+        raise ValueError(f"'{path}' has no run {run} (runs: {runs})")
+    return trail.records(run=run)
+
+def _compare(parsed_args) -> int:
+    """provena compare: exit 1 when the candidate trail diverges from the baseline."""
+    comparison = TrailComparison(
+        _run_records(parsed_args.baseline, parsed_args.baseline_run),
+        _run_records(parsed_args.candidate, parsed_args.candidate_run),
+        count_tolerance=parsed_args.count_tolerance,
+        duration_tolerance=parsed_args.duration_tolerance,
+        min_duration_s=parsed_args.min_duration, check_hashes=not parsed_args.no_hashes,
+        window=parsed_args.window)
+    shown = 0
+    for divergence in comparison:
+        if parsed_args.json:
+            print(json.dumps(divergence, default=str))
+        elif parsed_args.max_shown is None or shown < parsed_args.max_shown:
+            print(f"❌ {_describe_divergence(divergence)}")
+        shown += 1
+    
+    stats = comparison.stats
+    if not parsed_args.json:
+        print(f"\n📊 {stats['baseline_steps']} baseline steps, {stats['candidate_steps']} "
+              f"candidate steps, {stats['matched_steps']} matched")
+        if comparison.divergent:
+            counts = ", ".join(f"{kind}: {stats[kind]}" for kind in DIVERGENCE_KINDS
+                               if stats[kind])
+            print(f"⚠️  {shown} divergences ({counts})")
+        else:
+            print("✅ No divergences")
+    return 1 if comparison.divergent else 0
+
+def _segments(parsed_args) -> int:
+    """provena segments: list (and verify) the segments of a segmented trail."""
+    trail = SegmentedTrail(parsed_args.directory)
+    rows = trail.select(run=parsed_args.run, since=parsed_args.since, until=parsed_args.until)
+    _print_table(rows, ("number", "run", "pipeline", "records", "first_timestamp",
+                        "last_timestamp", "size", "name"))
+    if parsed_args.verify:
+        problems = trail.verify()
+        for problem in problems:
+            print(f"❌ {problem}")
+        if problems:
+            return 1
+        print(f"✅ {len(trail.segments)} segments match their digests")
+    return 0
+
+def _print_table(rows: List[Dict[str, Any]], columns: Sequence[str]):
+    """Rows as aligned text columns."""
+    if not rows:
+        print("(no matches)")
+        return
+    cells = [[("" if row[c] is None else str(row[c])) for c in columns] for row in rows]
+    widths = [max(len(c), *(len(line[n]) for line in cells)) for n, c in enumerate(columns)]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)).rstrip())
+    for line in cells:
+        print("  ".join(cell.ljust(w) for cell, w in zip(line, widths)).rstrip())
+
+def _ingest(parsed_args) -> int:
+    """provena ingest: add audit files to a store, one run per run in each file."""
+    with AuditStore(parsed_args.database) as store:
+        for filepath in parsed_args.files:
+            run_ids = store.ingest(filepath)
+            label = "run" if len(run_ids) == 1 else "runs"
+            print(f"{filepath}: {label} {', '.join(map(str, run_ids))}")
+    return 0
+
+def _query(parsed_args) -> int:
+    """provena query: answer lineage and rule-impact questions from a store."""
+    if not os.path.exists(parsed_args.database):
+        raise FileNotFoundError(parsed_args.database)
+    with AuditStore(parsed_args.database) as store:
+        query = parsed_args.query
+        if query == "runs":
+            rows = store.runs(pipeline=parsed_args.pipeline, limit=parsed_args.limit)
+            columns = ("run_id", "pipeline", "started_at", "steps", "source")
+        elif query == "lineage":
+            rows = store.lineage(parsed_args.row, pipeline=parsed_args.pipeline,
+                                 kind=parsed_args.kind, run_id=parsed_args.run,
+                                 since=parsed_args.since, until=parsed_args.until)
+            columns = ("timestamp", "pipeline", "run_id", "step_id", "function_name",
+                       "rule_id", "status", "kind")
+        elif query == "rules":
+            rows = store.rule_impact(rule_ids=parsed_args.rule, pipeline=parsed_args.pipeline,
+                                     since=parsed_args.since, until=parsed_args.until)
+            columns = ("rule_id", "steps", "runs", "rows_affected", "rows_inserted",
+                       "rows_deleted", "rows_modified", "warnings", "errors", "last_seen")
+        else:
+            records = store.steps(pipeline=parsed_args.pipeline, run_id=parsed_args.run,
+                                  rule_ids=parsed_args.rule, statuses=parsed_args.status,
+                                  functions=parsed_args.function, since=parsed_args.since,
+                                  until=parsed_args.until, limit=parsed_args.limit)
+            if parsed_args.json:
+                for record in records:
+                    print(json.dumps(record.to_dict(), default=str))
+                return 0
+            rows = [dict(timestamp=r.timestamp, step_id=r.step_id,
+                         function_name=r.function_name, rule_id=r.rule_id, status=r.status,
+                         affected=r.affected_row_count, message=r.message) for r in records]
+            columns = ("timestamp", "step_id", "function_name", "rule_id", "status",
+                       "affected", "message")
+        if parsed_args.json:
+            for row in rows:
+                print(json.dumps(row, default=str))
+        else:
+            _print_table(rows, columns)
+    return 0
+
+def _add_query_parsers(subparsers):
+    query_parser = subparsers.add_parser(
+        "query", help="Answer lineage and rule-impact questions from an audit store")
+    query_parser.add_argument("database", help="Audit store (see provena ingest / StoreSink)")
+    queries = query_parser.add_subparsers(dest="query", help="Queries")
+    queries.required = True
+    
+    def add_query(name, help, filters=("pipeline", "since", "until")):
+        parser = queries.add_parser(name, help=help)
+        parser.add_argument("--json", action="store_true", help="One JSON object per line")
+        if "pipeline" in filters:
+            parser.add_argument("--pipeline", help="Only this pipeline")
+        if "run" in filters:
+            parser.add_argument("--run", type=int, help="Only this run_id")
+        if "since" in filters:
+            parser.add_argument("--since", help="Only steps at or after this ISO timestamp")
+            parser.add_argument("--until", help="Only steps before this ISO timestamp")
+        if "limit" in filters:
+            parser.add_argument("--limit", type=int, help="Show at most N results")
+        return parser
+    
+    add_query("runs", "List the stored runs, newest first", filters=("pipeline", "limit"))
+    lineage = add_query("lineage", "Steps that touched a row, across runs",
+                        filters=("pipeline", "run", "since"))
+    lineage.add_argument("row", type=int,
+                         help="Row position in the steps' output (or input, for deletions); "
+                              "key values are not indexed")
+    lineage.add_argument("--kind", choices=RANGE_KINDS,
+                         help="Only steps that modified/inserted ('affected') or "
+                              "deleted ('deleted') the row")
+    rules = add_query("rules", "Rows affected, runs and errors per rule_id")
+    rules.add_argument("--rule", action="append", help="Only this rule_id (repeatable)")
+    steps = add_query("steps", "Stored steps matching the filters",
+                      filters=("pipeline", "run", "since", "limit"))
+    steps.add_argument("--rule", action="append", help="Only this rule_id (repeatable)")
+    steps.add_argument("--status", action="append", help="Only this status (repeatable)")
+    steps.add_argument("--function", action="append", help="Only this function (repeatable)")
 
 def main(args: List[str] = None):
     """Main CLI entry point."""
@@ -20,10 +223,70 @@ def main(args: List[str] = None):
     
     # Report command
     report_parser = subparsers.add_parser("report", help="Generate audit report")
-    report_parser.add_argument("json_file", help="Input JSON audit file")
+    report_parser.add_argument("json_file",
+                               help="Audit file (export_json output or JSON Lines trail, "
+                                    "optionally .gz / .xz) or segmented trail directory")
     report_parser.add_argument("--format", choices=["terminal", "json"], 
                               default="terminal", help="Output format")
     report_parser.add_argument("-o", "--output", help="Output file (for JSON format)")
+    report_parser.add_argument("--status", action="append",
+                               help="Only steps with this status (repeatable)")
+    report_parser.add_argument("--rule", action="append",
+                               help="Only steps with this rule_id (repeatable)")
+    report_parser.add_argument("--function", action="append",
+                               help="Only steps of this function (repeatable)")
+    report_parser.add_argument("--run", type=int,
+                               help="Only this run (JSON Lines files and segmented trails hold "
+                                    "one per pipeline run, numbered from 1)")
+    report_parser.add_argument("--since", help="Only steps at or after this ISO timestamp")
+    report_parser.add_argument("--until", help="Only steps before this ISO timestamp")
+    report_parser.add_argument("--page", type=int, default=1, help="Page to show (with --page-size)")
+    report_parser.add_argument("--page-size", type=int, help="Steps per page")
+    report_parser.add_argument("--top", type=int, default=0,
+                               help="List the N steps that affected the most rows")
+    
+    # Compare command
+    compare_parser = subparsers.add_parser(
+        "compare", help="Compare two runs' audit trails (exit 1 on divergence)")
+    compare_parser.add_argument("baseline",
+                                help="Audit file or segment directory of the reference run")
+    compare_parser.add_argument("candidate",
+                                help="Audit file or segment directory of the run to check")
+    compare_parser.add_argument("--baseline-run", type=int,
+                                help="Run of the baseline trail to compare (default: its last)")
+    compare_parser.add_argument("--candidate-run", type=int,
+                                help="Run of the candidate trail to compare (default: its last)")
+    compare_parser.add_argument("--count-tolerance", type=float, default=0.0,
+                                help="Allowed relative change of affected rows (0.1 = 10%%)")
+    compare_parser.add_argument("--duration-tolerance", type=float, default=0.5,
+                                help="Allowed relative slowdown of profiled steps (0.5 = 50%%)")
+    compare_parser.add_argument("--min-duration", type=float, default=0.05,
+                                help="Ignore slowdowns under this many seconds")
+    compare_parser.add_argument("--no-hashes", action="store_true",
+                                help="Don't compare hash_before / hash_after")
+    compare_parser.add_argument("--window", type=int, default=1000,
+                                help="Unmatched steps held per trail while aligning")
+    compare_parser.add_argument("--max-shown", type=int, help="Print at most N divergences")
+    compare_parser.add_argument("--json", action="store_true",
+                                help="One JSON object per divergence")
+    
+    # Segmented trail command
+    segments_parser = subparsers.add_parser("segments", help="List a segmented trail")
+    segments_parser.add_argument("directory", help="Directory written by a SegmentedSink")
+    segments_parser.add_argument("--run", type=int, help="Only segments of this run")
+    segments_parser.add_argument("--since",
+                                 help="Only segments with steps at or after this ISO timestamp")
+    segments_parser.add_argument("--until",
+                                 help="Only segments with steps before this ISO timestamp")
+    segments_parser.add_argument("--verify", action="store_true",
+                                 help="Check every segment against its digest")
+    
+    # Audit store commands
+    ingest_parser = subparsers.add_parser("ingest", help="Add audit files to an audit store")
+    ingest_parser.add_argument("database", help="Audit store (created if missing)")
+    ingest_parser.add_argument("files", nargs="+",
+                               help="Audit files (export_json output or JSON Lines trails)")
+    _add_query_parsers(subparsers)
     
     # Version command
     subparsers.add_parser("version", help="Show version")
@@ -38,35 +301,35 @@ def main(args: List[str] = None):
     
     elif parsed_args.command == "report":
         try:
-            with open(parsed_args.json_file, 'r', encoding='utf-8') as f:
-                audit_data = json.load(f)
-            
-            # Reconstruct logger from JSON
-            logger = ProvenaLogger(audit_data.get("pipeline", "Unknown"))
-            
-            # Recreate records (simplified - in reality you'd need proper deserialization)
-            print("Note: Full CLI reconstruction from JSON requires additional implementation.")
-            print("For now, use the Python API directly.")
-            
-            if parsed_args.format == "terminal":
-                print(generate_terminal_report(logger))
-            elif parsed_args.format == "json":
-                result = generate_json_report(logger, parsed_args.output)
-                if not parsed_args.output:
-                    print(result)
-            
-            return 0
-            
+            return _report(parsed_args)
         except FileNotFoundError:
             print(f"Error: File '{parsed_args.json_file}' not found.", file=sys.stderr)
             return 1
         except json.JSONDecodeError:
             print(f"Error: Invalid JSON in '{parsed_args.json_file}'.", file=sys.stderr)
             return 1
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+    
+    elif parsed_args.command in ("compare", "segments", "ingest", "query"):
+        handler = {"compare": _compare, "segments": _segments, "ingest": _ingest,
+                   "query": _query}[parsed_args.command]
+        try:
+            return handler(parsed_args)
+        except FileNotFoundError as e:
+            print(f"Error: File '{e.filename or e}' not found.", file=sys.stderr)
+            return 1
+        except json.JSONDecodeError as e:
+            print(f"Error: Invalid JSON in audit file: {e}", file=sys.stderr)
+            return 1
+        except (ValueError, sqlite3.Error) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
     
     else:
         parser.print_help()
         return 0
 
 if __name__ == "__main__":
-    sys.exit(main())
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,332 @@
+"""
+Audit collection for steps fanned out to worker processes.
+
+A worker process gets a pickled copy of whatever it is handed, so a
+ProvenaLogger passed to it keeps its records to itself. Instead, the
+parent creates an AuditCollector and hands each worker a ShardAudit; the
+worker's records travel back over a queue and the parent writes them into
+its own trail, in a deterministic order, once the fan-out is done.
+
+Example:
+    def clean_shard(rows, audit):
+        with audit:                     # steps inside log to the parent
+            return clean_emails(rows)
+
+    with audit_pipeline("Heavy") as logger:
+        with AuditCollector(logger) as collector:
+            with ProcessPoolExecutor() as pool:
+                futures = [pool.submit(clean_shard, shard, collector.shard(i))
+                           for i, shard in enumerate(shards)]
+                results = [f.result() for f in futures]
+"""
+
+import math
+import multiprocessing
+import threading
+from typing import Any, Dict, List, Optional, Set
+
+from .changes import DEFAULT_CHANGE_SAMPLES, merge_column_stats, pick_samples
+from .context import _current_logger
+from .hashing import combine_digests
+from .indexset import RowIndexSet
+from .levels import AUDIT_LEVELS
+from .logger import AuditRecord, ProvenaLogger
+from .sinks import AuditSink
+
+_STATUS_RANK = {"SUCCESS": 0, "WARNING": 1, "ERROR": 2}
+
+_STOP = None
+
+# Ordinal of the message a shard sends when it is done
+_END = None
+
+
+class _QueueSink(AuditSink):
+    """Worker-side sink: sends each record (as a dict) to the collector."""
+
+    def __init__(self, queue: Any, shard_id: int):
+        self.queue = queue
+        self.shard_id = shard_id
+        self._ordinal = 0
+
+    def write(self, record: AuditRecord):
+        self.queue.put((self.shard_id, self._ordinal, record.to_dict()))
+        self._ordinal += 1
+
+
+class ShardAudit:
+    """
+    Picklable handle a worker uses to log to the parent's collector.
+
+    Use it as a context manager inside the worker: it yields a logger and
+    makes it the current one, so decorated steps need no provena_logger=.
+    Leaving the block tells the collector that the shard is done.
+    """
+
+    def __init__(self, queue: Any, shard_id: int, pipeline_name: str,
+                 change_samples: Optional[int] = DEFAULT_CHANGE_SAMPLES):
+        self.queue = queue
+        self.shard_id = shard_id
+        self.pipeline_name = pipeline_name
+        self.change_samples = change_samples
+        self._logger: Optional[ProvenaLogger] = None
+        self._token = None
+
+    def logger(self) -> ProvenaLogger:
+        """The worker-side logger (created on first use, in the worker)."""
+        if self._logger is None:
+            self._logger = ProvenaLogger(
+                f"{self.pipeline_name}[shard {self.shard_id}]",
+                sink=_QueueSink(self.queue, self.shard_id),
+                keep_records=False,
+                change_samples=self.change_samples)
+        return self._logger
+
+    def __enter__(self) -> ProvenaLogger:
+        logger = self.logger()
+        self._token = _current_logger.set(logger)
+        return logger
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _current_logger.reset(self._token)
+        # Sent after the shard's records, so the collector knows it has them all
+        self.queue.put((self.shard_id, _END, None))
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Only the queue and the settings cross the process boundary
+        return {"queue": self.queue, "shard_id": self.shard_id,
+                "pipeline_name": self.pipeline_name,
+                "change_samples": self.change_samples}
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__init__(state["queue"], state["shard_id"], state["pipeline_name"],
+                      state["change_samples"])
+
+
+class AuditCollector:
+    """
+    Parent-side collector of the records logged by worker processes.
+
+    Records stream back over a multiprocessing.Manager queue (which, unlike
+    a plain multiprocessing.Queue, can be passed to Pool and
+    ProcessPoolExecutor tasks) and are buffered by a background thread.
+    close() waits until every shard handed out has left its `with` block,
+    then the n-th record of every shard is grouped into step n and
+    written to the parent logger in step order (shards are expected to run
+    the same sequence of steps; a group mixing functions is not merged):
+
+    - merge_shards=True: one record per step covering all shards. Row
+      indices are translated to positions in the shards' inputs and outputs
+      concatenated in shard-id order, counts are summed, and the digests
+      are combined (see provena.hashing.combine_digests).
+    - merge_shards=False: one record per shard, in shard-id order, with
+      shard-local row indices.
+
+    Either way each record lists the shards it came from in shard_ids.
+
+    Args:
+        logger: The parent logger that receives the records
+        merge_shards: Merge the shards' records of a step into one record
+        queue: Queue to use instead of a Manager queue (anything with
+            put/get that the workers can reach, e.g. an inherited
+            multiprocessing.Queue with fork)
+    """
+
+    def __init__(self,
+                 logger: ProvenaLogger,
+                 merge_shards: bool = True,
+                 queue: Any = None):
+        self.logger = logger
+        self.merge_shards = merge_shards
+        self._manager = None
+        if queue is None:
+            self._manager = multiprocessing.Manager()
+            queue = self._manager.Queue()
+        self.queue = queue
+        self._records: Dict[int, Dict[int, AuditRecord]] = {}
+        self._next_shard = 0
+        self._issued: Set[int] = set()
+        self._finished: Set[int] = set()
+        self._done = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._drain, name="provena-collector", daemon=True)
+        self._thread.start()
+
+    def shard(self, shard_id: Optional[int] = None) -> ShardAudit:
+        """Handle for one worker; shard ids default to 0, 1, 2, ..."""
+        if shard_id is None:
+            shard_id = self._next_shard
+        self._next_shard = max(self._next_shard, shard_id + 1)
+        with self._done:
+            self._issued.add(shard_id)
+        return ShardAudit(self.queue, shard_id, self.logger.pipeline_name,
+                          self.logger.change_samples)
+
+    def _drain(self):
+        while True:
+            message = self.queue.get()
+            if message is _STOP:
+                return
+            shard_id, ordinal, data = message
+            if ordinal is _END:
+                with self._done:
+                    self._finished.add(shard_id)
+                    self._done.notify_all()
+                continue
+            self._records.setdefault(ordinal, {})[shard_id] = AuditRecord.from_dict(data)
+
+    def close(self, timeout: Optional[float] = None):
+        """
+        Wait until every shard handed out by shard() is done, then write
+        every collected record to the parent logger.
+
+        Args:
+            timeout: Seconds to wait for the shards (None = no limit). If
+                some are not done by then, the records collected so far
+                are written and TimeoutError is raised
+        """
+        if self._closed:
+            return
+        self._closed = True
+        with self._done:
+            self._done.wait_for(lambda: self._issued <= self._finished, timeout)
+            unfinished = sorted(self._issued - self._finished)
+        self.queue.put(_STOP)
+        self._thread.join()
+        if self._manager is not None:
+            self._manager.shutdown()
+
+        for ordinal in sorted(self._records):
+            by_shard = self._records[ordinal]
+            shards = [by_shard[shard_id] for shard_id in sorted(by_shard)]
+            for shard_id, record in zip(sorted(by_shard), shards):
+                record.shard_ids = [shard_id]
+            if self.merge_shards and len({r.function_name for r in shards}) == 1:
+                self.logger.append_record(merge_shard_records(
+                    shards, self.logger.change_samples))
+            else:
+                for record in shards:
+                    self.logger.append_record(record)
+        self._records.clear()
+        if unfinished:
+            raise TimeoutError(f"Shards {unfinished} were not done after {timeout}s; "
+                               f"their records may be incomplete")
+
+    def __enter__(self) -> "AuditCollector":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+            return
+        # The workers failed - some shards may never be done
+        try:
+            self.close(timeout=0)
+        except TimeoutError:
+            pass
+
+
+def merge_shard_records(records: List[AuditRecord],
+                        sample_size: Optional[int] = DEFAULT_CHANGE_SAMPLES) -> AuditRecord:
+    """
+    Merge the records of one step run on several shards, in shard order.
+
+    Output positions (affected rows) are shifted by the rows the earlier
+    shards produced, input positions (deleted rows) by the rows they read.
+    Of the shards' sampled changed rows, sample_size are kept (None keeps
+    them all).
+    """
+    first = records[0]
+    affected = RowIndexSet()
+    deleted = RowIndexSet()
+    change_samples = []
+    offset_before = offset_after = 0
+    for record in records:
+        for sample in record.change_samples or ():
+            change_samples.append(dict(sample, row=sample["row"] + offset_after,
+                                       input_row=sample["input_row"] + offset_before))
+        for start, stop in record.affected_row_indices.ranges():
+            affected.add_range(start + offset_after, stop + offset_after)
+        for start, stop in record.deleted_row_indices.ranges():
+            deleted.add_range(start + offset_before, stop + offset_before)
+        offset_before += record.rows_before
+        offset_after += record.rows_after
+
+    sampled = next((r for r in records if r.sample_before or r.sample_after), first)
+    messages = [f"shard {r.shard_ids[0] if r.shard_ids else i}: {r.message}"
+                for i, r in enumerate(records) if r.message]
+    shard_ids = sorted(s for r in records for s in (r.shard_ids or ()))
+
+    return AuditRecord(
+        step_id="",
+        function_name=first.function_name,
+        timestamp=max(r.timestamp for r in records),
+        rule_id=first.rule_id,
+        rows_before=offset_before,
+        rows_after=offset_after,
+        columns_before=next((r.columns_before for r in records if r.columns_before), []),
+        columns_after=next((r.columns_after for r in records if r.columns_after), []),
+        affected_row_indices=affected,
+        affected_row_count=sum(r.affected_row_count for r in records),
+        sample_before=sampled.sample_before,
+        sample_after=sampled.sample_after,
+        hash_before=combine_digests([r.hash_before for r in records]),
+        hash_after=combine_digests([r.hash_after for r in records]),
+        status=max((r.status for r in records), key=lambda s: _STATUS_RANK.get(s, 1)),
+        message="; ".join(messages) or None,
+        key_columns=first.key_columns,
+        rows_inserted=sum(r.rows_inserted for r in records),
+        rows_deleted=sum(r.rows_deleted for r in records),
+        rows_modified=sum(r.rows_modified for r in records),
+        rows_unchanged=sum(r.rows_unchanged for r in records),
+        deleted_row_indices=deleted,
+        performance=_merge_performance([r.performance for r in records]),
+        shard_ids=shard_ids,
+        # The step is only as thoroughly audited as its least audited shard
+        audit_level=min((r.audit_level for r in records), key=AUDIT_LEVELS.index),
+        estimate=_merge_estimates([r.estimate for r in records]),
+        column_stats=merge_column_stats(r.column_stats for r in records),
+        change_samples=(_merge_samples(change_samples, sample_size)
+                        if any(r.change_samples is not None for r in records) else None),
+    )
+
+
+def _merge_samples(samples: List[Dict[str, Any]],
+                   sample_size: Optional[int]) -> List[Dict[str, Any]]:
+    if sample_size is None:
+        return sorted(samples, key=lambda s: s["row"])
+    return pick_samples(samples, sample_size)
+
+
+def _merge_performance(parts: List[Optional[Dict[str, Optional[float]]]]
+                       ) -> Optional[Dict[str, Optional[float]]]:
+    """Sum times across shards; peak memory is the largest shard's."""
+    parts = [p for p in parts if p]
+    if not parts:
+        return None
+    merged: Dict[str, float] = {}
+    for part in parts:
+        for key, value in part.items():
+            if key.endswith("_peak_bytes"):
+                # Unavailable in one shard is unavailable for the step
+                previous = merged.get(key, 0)
+                merged[key] = (None if value is None or previous is None
+                               else max(previous, value))
+            else:
+                merged[key] = round(merged.get(key, 0) + value, 6)
+    return merged
+
+
+def _merge_estimates(parts: List[Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+    """Add up the shards' estimates; independent margins add in quadrature."""
+    parts = [p for p in parts if p]
+    if not parts:
+        return None
+    return {
+        "method": parts[0]["method"],
+        "sampled_rows": sum(p["sampled_rows"] for p in parts),
+        "changed_in_sample": sum(p["changed_in_sample"] for p in parts),
+        "estimated_changed_rows": sum(p["estimated_changed_rows"] for p in parts),
+        "margin": round(math.sqrt(sum(p["margin"] ** 2 for p in parts))),
+        "confidence": parts[0]["confidence"],
+    }
@@ -0,0 +1,167 @@
+"""
+Columnar diff backend - compares datasets stored as dict-of-columns.
+
+Columns can be lists, array.array or NumPy arrays. Each column is compared
+as a whole, producing a changed-row mask per column; the masks are then
+OR-ed and reduced to affected indices. No row dicts are ever built.
+
+NumPy is optional: when it is installed, NumPy columns are compared with
+vectorized operations; otherwise (and for lists / array.array) unchanged
+blocks are skipped with C-level slice comparisons and only differing
+blocks are scanned element by element.
+"""
+
+from array import array
+from typing import Any, Dict, List, Mapping, Sequence
+
+from .diff import DiffResult
+from .indexset import RowIndexSet
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is an optional speed-up
+    np = None
+
+Columns = Mapping[str, Sequence]
+
+# Block size for the pure-Python path
+BLOCK_SIZE = 4096
+
+
+def is_columnar(data: Any) -> bool:
+    """Check whether data is a dict of columns rather than a list of rows."""
+    if not isinstance(data, Mapping) or not data:
+        return False
+    return all(isinstance(col, (list, tuple, array)) or _is_ndarray(col)
+               for col in data.values())
+
+
+def _is_ndarray(column: Any) -> bool:
+    return np is not None and isinstance(column, np.ndarray)
+
+
+def column_length(columns: Columns) -> int:
+    """Number of rows in a dict of columns (all columns must agree)."""
+    lengths = {len(col) for col in columns.values()}
+    if len(lengths) > 1:
+        raise ValueError(f"Columns have different lengths: {sorted(lengths)}")
+    return lengths.pop() if lengths else 0
+
+
+def copy_columns(columns: Columns) -> Dict[str, Sequence]:
+    """Shallow-copy every column (a memcpy for arrays)."""
+    copied = {}
+    for name, col in columns.items():
+        if _is_ndarray(col):
+            copied[name] = col.copy()
+        elif isinstance(col, array):
+            copied[name] = array(col.typecode, col)
+        else:
+            copied[name] = list(col)
+    return copied
+
+
+def _scalar(value: Any) -> Any:
+    """Convert NumPy scalars to plain Python values."""
+    if np is not None and isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def row_at(columns: Columns, index: int) -> Dict[str, Any]:
+    """Materialize a single row (used for samples only)."""
+    return {name: _scalar(col[index]) for name, col in columns.items()}
+
+
+def _changed_positions(col_before: Sequence, col_after: Sequence, n: int) -> List[int]:
+    """Positions in [0, n) where two plain sequences differ."""
+    changed = []
+    for start in range(0, n, BLOCK_SIZE):
+        stop = min(start + BLOCK_SIZE, n)
+        block_before = col_before[start:stop]
+        block_after = col_after[start:stop]
+        if block_before == block_after:
+            continue  # Whole block unchanged (C-level comparison)
+        # NaN != NaN, so an unchanged NaN must not count as a change
+        changed.extend(start + i for i, (a, b) in enumerate(zip(block_before, block_after))
+                       if a != b and (a == a or b == b))
+    return changed
+
+
+def _present_positions(column: Sequence, n: int) -> List[int]:
+    """Positions holding a non-None value (a missing column counts as None)."""
+    return [i for i in range(n) if column[i] is not None]
+
+
+def _ndarray_mask(col_before: Any, col_after: Any, n: int):
+    """Vectorized changed-row mask for two columns."""
+    a = np.asarray(col_before[:n])
+    b = np.asarray(col_after[:n])
+    mask = np.asarray(a != b, dtype=bool)
+    if mask.shape != (n,):
+        # Incomparable dtypes - every row changed
+        return np.ones(n, dtype=bool)
+    if a.dtype.kind in "fc" and b.dtype.kind in "fc":
+        mask &= ~(np.isnan(a) & np.isnan(b))
+    return mask
+
+
+def _ndarray_present(column: Any, n: int):
+    arr = np.asarray(column[:n])
+    if arr.dtype.kind == "O":
+        return np.not_equal(arr, None)
+    return np.ones(n, dtype=bool)
+
+
+def diff_columns(before: Columns, after: Columns) -> DiffResult:
+    """
+    Diff two dict-of-columns datasets position by position.
+
+    A column present on one side only counts as None on the other, matching
+    the row-based diff. Rows past the end of the shorter side are reported
+    as inserted or deleted.
+    """
+    n_before = column_length(before)
+    n_after = column_length(after)
+    overlap = min(n_before, n_after)
+
+    use_numpy = np is not None and any(
+        _is_ndarray(col) for col in list(before.values()) + list(after.values()))
+
+    mask = np.zeros(overlap, dtype=bool) if use_numpy else None
+    changed = set()
+
+    for name in list(before) + [c for c in after if c not in before]:
+        col_before = before.get(name)
+        col_after = after.get(name)
+
+        if use_numpy:
+            if col_before is None:
+                mask |= _ndarray_present(col_after, overlap)
+            elif col_after is None:
+                mask |= _ndarray_present(col_before, overlap)
+            else:
+                mask |= _ndarray_mask(col_before, col_after, overlap)
+        elif col_before is None:
+            changed.update(_present_positions(col_after, overlap))
+        elif col_after is None:
+            changed.update(_present_positions(col_before, overlap))
+        else:
+            changed.update(_changed_positions(col_before, col_after, overlap))
+
+    result = DiffResult()
+    if use_numpy:
+        # Run boundaries straight from the mask - no per-index Python ints
+        edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+        result.modified = RowIndexSet.from_ranges(
+            zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)))
+    else:
+        result.modified = RowIndexSet.from_sorted(sorted(changed))
+
+    result.unchanged = overlap - len(result.modified)
+    result.inserted.add_range(overlap, n_after)
+    result.deleted.add_range(overlap, n_before)
+    if result.modified:
+        first = result.modified.first()
+        result.sample = (first, first)
+    return result
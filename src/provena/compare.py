@@ -0,0 +1,224 @@
+"""
+Run-to-run comparison of audit trails.
+
+A TrailComparison reads a baseline trail and a candidate trail side by
+side, aligns their steps by (function_name, rule_id) and yields every
+divergence: steps missing from or new in the candidate, status changes,
+hash_before / hash_after mismatches, affected-count drift beyond a
+tolerance and duration regressions. Only steps still waiting for their
+counterpart are held in memory, never more than `window` per side.
+"""
+
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .logger import AuditRecord
+
+# Divergence kinds, in the order they are checked for a pair of steps
+DIVERGENCE_KINDS = ("missing", "new", "status", "hash_before", "hash_after",
+                    "affected_count", "duration")
+
+# Default number of unmatched steps held per side while aligning
+DEFAULT_WINDOW = 1000
+
+StepKey = Tuple[str, Optional[str]]
+
+
+def step_key(record: AuditRecord) -> StepKey:
+    """What identifies 'the same step' in two runs."""
+    return (record.function_name, record.rule_id)
+
+
+def step_duration(record: AuditRecord) -> Optional[float]:
+    """Function plus audit wall time of a profiled step (None if not profiled)."""
+    performance = record.performance
+    if not performance or "function_wall_s" not in performance:
+        return None
+    return performance["function_wall_s"] + performance.get("audit_wall_s", 0.0)
+
+
+def _divergence(kind: str,
+                baseline: Optional[AuditRecord],
+                candidate: Optional[AuditRecord],
+                expected: Any = None,
+                found: Any = None) -> Dict[str, Any]:
+    record = baseline or candidate
+    return {
+        "kind": kind,
+        "function_name": record.function_name,
+        "rule_id": record.rule_id,
+        "baseline_step": baseline.step_id if baseline else None,
+        "candidate_step": candidate.step_id if candidate else None,
+        "baseline": expected,
+        "candidate": found,
+    }
+
+
+class TrailComparison:
+    """
+    Streaming comparison of a baseline and a candidate audit trail.
+
+    Steps are aligned in order: a step is paired with the oldest unmatched
+    step of the other trail with the same (function_name, rule_id), and
+    the unmatched steps before them are reported as missing (baseline
+    side) or new (candidate side). When more than `window` steps of one
+    trail are unmatched, the oldest is reported right away.
+
+    Iterating yields the divergences as they are found; the counts are in
+    self.stats once iteration is done.
+
+    Args:
+        baseline: Records of the reference run (e.g. TrailFile.records())
+        candidate: Records of the run being checked
+        count_tolerance: Allowed relative change of affected_row_count
+            (0.1 = 10%); 0 flags any change
+        duration_tolerance: Allowed relative slowdown of profiled steps
+            (0.5 = 50% slower)
+        min_duration_s: Slowdowns smaller than this are never flagged
+        check_hashes: Compare hash_before / hash_after (turn off when the
+            runs read different data)
+        window: Unmatched steps held per side
+
+    Example:
+        comparison = TrailComparison(TrailFile("last_night.json").records(),
+                                     TrailFile("tonight.json").records(),
+                                     count_tolerance=0.05)
+        for divergence in comparison:
+            print(divergence["kind"], divergence["function_name"])
+        print(comparison.stats)
+    """
+
+    def __init__(self,
+                 baseline: Iterable[AuditRecord],
+                 candidate: Iterable[AuditRecord],
+                 count_tolerance: float = 0.0,
+                 duration_tolerance: float = 0.5,
+                 min_duration_s: float = 0.05,
+                 check_hashes: bool = True,
+                 window: int = DEFAULT_WINDOW):
+        if window < 1:
+            raise ValueError("window must be at least 1")
+        if count_tolerance < 0 or duration_tolerance < 0:
+            raise ValueError("Tolerances must not be negative")
+        self.baseline = baseline
+        self.candidate = candidate
+        self.count_tolerance = count_tolerance
+        self.duration_tolerance = duration_tolerance
+        self.min_duration_s = min_duration_s
+        self.check_hashes = check_hashes
+        self.window = window
+        self.stats = dict.fromkeys(("baseline_steps", "candidate_steps", "matched_steps")
+                                   + DIVERGENCE_KINDS, 0)
+
+    @property
+    def divergent(self) -> bool:
+        """Whether any divergence was found (so far)."""
+        return any(self.stats[kind] for kind in DIVERGENCE_KINDS)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for divergence in self._align():
+            self.stats[divergence["kind"]] += 1
+            yield divergence
+
+    # Alignment
+    def _align(self) -> Iterator[Dict[str, Any]]:
+        # Per side (0 = baseline, 1 = candidate): position -> unmatched
+        # record in arrival order, and key -> their positions (oldest first)
+        pending: Tuple["OrderedDict[int, AuditRecord]", ...] = (OrderedDict(), OrderedDict())
+        by_key: Tuple[Dict[StepKey, Deque[int]], ...] = ({}, {})
+        sources = (iter(self.baseline), iter(self.candidate))
+        counters = ("baseline_steps", "candidate_steps")
+        active = [True, True]
+        positions = [0, 0]
+
+        while any(active):
+            for side in (0, 1):
+                if not active[side]:
+                    continue
+                record = next(sources[side], None)
+                if record is None:
+                    active[side] = False
+                    continue
+                self.stats[counters[side]] += 1
+                position = positions[side]
+                positions[side] += 1
+
+                other = 1 - side
+                key = step_key(record)
+                waiting = by_key[other].get(key)
+                if not waiting:
+                    pending[side][position] = record
+                    by_key[side].setdefault(key, deque()).append(position)
+                    if len(pending[side]) > self.window:
+                        yield self._unmatched(side, pending, by_key)
+                    continue
+
+                # Everything still unmatched before the pair has no counterpart
+                match = waiting[0]
+                while True:
+                    oldest = next(iter(pending[other]))
+                    if oldest == match:
+                        break
+                    yield self._unmatched(other, pending, by_key)
+                while pending[side]:
+                    yield self._unmatched(side, pending, by_key)
+                waiting.popleft()
+                if not waiting:
+                    del by_key[other][key]
+                paired = pending[other].pop(match)
+                pair = (paired, record) if side == 1 else (record, paired)
+                self.stats["matched_steps"] += 1
+                yield from self._compare(*pair)
+
+        for side in (0, 1):
+            while pending[side]:
+                yield self._unmatched(side, pending, by_key)
+
+    def _unmatched(self, side: int, pending, by_key) -> Dict[str, Any]:
+        """Report the oldest unmatched record of one side."""
+        _, record = pending[side].popitem(last=False)
+        key = step_key(record)
+        waiting = by_key[side][key]
+        waiting.popleft()
+        if not waiting:
+            del by_key[side][key]
+        if side == 0:
+            return _divergence("missing", record, None)
+        return _divergence("new", None, record)
+
+    # Checks of a pair of steps
+    def _compare(self, baseline: AuditRecord, candidate: AuditRecord
+                 ) -> Iterator[Dict[str, Any]]:
+        if baseline.status != candidate.status:
+            yield _divergence("status", baseline, candidate, baseline.status, candidate.status)
+        if self.check_hashes:
+            for field in ("hash_before", "hash_after"):
+                expected = getattr(baseline, field)
+                found = getattr(candidate, field)
+                if expected != found:
+                    yield _divergence(field, baseline, candidate, expected, found)
+
+        expected = baseline.affected_row_count
+        found = candidate.affected_row_count
+        if abs(found - expected) > self.count_tolerance * max(expected, 1):
+            yield _divergence("affected_count", baseline, candidate, expected, found)
+
+        expected = step_duration(baseline)
+        found = step_duration(candidate)
+        if (expected is not None and found is not None
+                and found - expected > max(self.duration_tolerance * expected,
+                                           self.min_duration_s)):
+            yield _divergence("duration", baseline, candidate, round(expected, 6),
+                              round(found, 6))
+
+
+def compare_trails(baseline: Iterable[AuditRecord],
+                   candidate: Iterable[AuditRecord],
+                   **options) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """
+    Compare two trails in one go: (divergences, stats). See TrailComparison
+    for the options.
+    """
+    comparison = TrailComparison(baseline, candidate, **options)
+    divergences = list(comparison)
+    return divergences, comparison.stats
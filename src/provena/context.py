@@ -0,0 +1,66 @@
+"""
+The active logger, carried in a context variable.
+
+audit_pipeline makes its logger the current one, so decorated steps called
+without provena_logger= log to the right pipeline - including steps run in
+asyncio tasks (which copy the context) and in threads started through
+ContextThreadPoolExecutor or bind_context (plain threads start with an
+empty context). Pipelines running side by side in one process each see
+their own logger.
+"""
+
+import contextvars
+import functools
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+
+from .logger import ProvenaLogger
+
+_current_logger: "contextvars.ContextVar[Optional[ProvenaLogger]]" = contextvars.ContextVar(
+    "provena_logger", default=None)
+
+
+def current_logger() -> Optional[ProvenaLogger]:
+    """The logger of the innermost active pipeline, or None."""
+    return _current_logger.get()
+
+
+@contextmanager
+def use_logger(logger: ProvenaLogger) -> Iterator[ProvenaLogger]:
+    """
+    Make logger the current one inside the block.
+
+    Example:
+        with use_logger(logger):
+            data = clean_emails(data)   # logged to logger
+    """
+    token = _current_logger.set(logger)
+    try:
+        yield logger
+    finally:
+        _current_logger.reset(token)
+
+
+def bind_context(func: Callable) -> Callable:
+    """
+    Wrap func so it runs in a copy of the caller's current context, e.g. as
+    a threading.Thread target.
+
+    Example:
+        threading.Thread(target=bind_context(run_step), args=(data,)).start()
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        # A context can only be entered by one thread at a time
+        return context.copy().run(func, *args, **kwargs)
+    return wrapper
+
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor whose tasks run in a copy of the submitter's context."""
+
+    def submit(self, fn: Callable, *args: Any, **kwargs: Any) -> Future:
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
@@ -0,0 +1,334 @@
+"""
+Row diff engine - works out which rows a transformation inserted, deleted
+or modified.
+"""
+
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from .changes import ChangeStats
+from .indexset import RowIndexSet
+from .snapshot import row_fingerprint
+
+KeyColumns = Union[str, Sequence[str]]
+
+
+@dataclass
+class DiffResult:
+    """Classification of the rows of one transformation."""
+
+    # Positions in the output of rows whose values changed
+    modified: RowIndexSet = field(default_factory=RowIndexSet)
+    # Positions in the output of rows with no counterpart in the input
+    inserted: RowIndexSet = field(default_factory=RowIndexSet)
+    # Positions in the input of rows with no counterpart in the output
+    deleted: RowIndexSet = field(default_factory=RowIndexSet)
+    unchanged: int = 0
+    # (input position, output position) of the first modified row
+    sample: Optional[Tuple[int, int]] = None
+    # Column counters and sampled modified rows, when requested
+    changes: Optional[ChangeStats] = None
+
+    @property
+    def affected_indices(self) -> RowIndexSet:
+        """Output positions of modified and inserted rows."""
+        if not self.inserted:
+            return self.modified
+        return self.modified | self.inserted
+
+    @property
+    def affected_count(self) -> int:
+        return len(self.modified) + len(self.inserted) + len(self.deleted)
+
+
+def normalize_key_columns(key_column: Optional[KeyColumns]) -> Optional[Tuple[str, ...]]:
+    """Turn a key_column argument into a tuple of column names (or None)."""
+    if key_column is None:
+        return None
+    if isinstance(key_column, str):
+        return (key_column,)
+    columns = tuple(key_column)
+    if not columns:
+        raise ValueError("key_column must name at least one column")
+    return columns
+
+
+def _key_getter(key_columns: Tuple[str, ...]) -> Callable[[Dict], object]:
+    if len(key_columns) == 1:
+        column = key_columns[0]
+        return lambda row: row.get(column)
+    return lambda row: tuple(row.get(c) for c in key_columns)
+
+
+def _eq_default(val_before: Any, val_after: Any) -> bool:
+    return val_before == val_after
+
+
+def _eq_float(val_before: Any, val_after: Any) -> bool:
+    # NaN never equals itself, but an unchanged NaN is not a change
+    return val_before == val_after or (val_before != val_before and val_after != val_after)
+
+
+# Type-specific equality, picked per column when the plan is compiled
+_EQUALITY_BY_TYPE = {
+    float: _eq_float,
+}
+
+
+class ComparisonPlan:
+    """
+    Comparison plan compiled once per schema and reused for every row.
+    
+    Rows are compared with a single dict equality first, which runs in C and
+    settles every unchanged row. Only rows that differ fall through to the
+    per-column comparison, where a missing column counts as None, both-None
+    is no change, and each column uses the equality picked for its type.
+    Values are compared as-is (no str() conversion), so 1 -> '1' is a change.
+    """
+
+    __slots__ = ("columns", "_column_set", "_equality")
+
+    def __init__(self, columns: Sequence[str], sample_row: Optional[Dict] = None):
+        self.columns = tuple(columns)
+        self._column_set = frozenset(self.columns)
+        sample_row = sample_row or {}
+        self._equality = tuple(
+            _EQUALITY_BY_TYPE.get(type(sample_row.get(column)), _eq_default)
+            for column in self.columns
+        )
+
+    @classmethod
+    def compile(cls, before: List[Dict], after: List[Dict]) -> "ComparisonPlan":
+        """Build the plan from the schema of the first row on each side."""
+        columns = list(before[0].keys()) if before else []
+        if after:
+            seen = set(columns)
+            columns.extend(c for c in after[0].keys() if c not in seen)
+        return cls(columns, before[0] if before else None)
+
+    def rows_equal(self, row_before: Dict, row_after: Dict) -> bool:
+        """Check whether two rows hold the same values."""
+        if row_before == row_after:
+            return True
+        return self.values_equal(row_before, row_after)
+
+    def values_equal(self, row_before: Dict, row_after: Dict) -> bool:
+        """Column-by-column comparison for rows that are not identical dicts."""
+        column_set = self._column_set
+        if row_before.keys() <= column_set and row_after.keys() <= column_set:
+            checks = zip(self.columns, self._equality)
+        else:
+            # Row has columns outside the compiled schema
+            extra = (row_before.keys() | row_after.keys()) - column_set
+            checks = list(zip(self.columns, self._equality))
+            checks.extend((column, _eq_default) for column in extra)
+
+        for column, equal in checks:
+            val_before = row_before.get(column)
+            val_after = row_after.get(column)
+
+            # Handle None values properly
+            if val_before is None or val_after is None:
+                if val_before is val_after:
+                    continue  # Both None = no change
+                return False  # One is None, other isn't = CHANGE!
+            if not equal(val_before, val_after):
+                return False
+
+        return True
+
+
+def _pair_differ(before: List[Dict],
+                 after: List[Dict],
+                 fingerprints_before: Optional[Sequence[int]],
+                 fingerprints_after: Optional[Sequence[int]] = None
+                 ) -> Callable[[int, int, Dict], bool]:
+    """Build a 'does output row j differ from input row i' check."""
+    if fingerprints_before is not None:
+        if fingerprints_after is not None:
+            return lambda i, j, row: fingerprints_before[i] != fingerprints_after[j]
+        return lambda i, j, row: fingerprints_before[i] != row_fingerprint(row)
+    rows_equal = ComparisonPlan.compile(before, after).rows_equal
+    return lambda i, j, row: not rows_equal(before[i], row)
+
+
+def diff_positional(before: List[Dict],
+                    after: List[Dict],
+                    fingerprints_before: Optional[Sequence[int]] = None,
+                    fingerprints_after: Optional[Sequence[int]] = None,
+                    change_samples: Optional[int] = None) -> DiffResult:
+    """
+    Compare rows position by position.
+
+    Rows past the end of the shorter side count as inserted (output longer)
+    or deleted (output shorter).
+    """
+    result = DiffResult()
+    overlap = min(len(before), len(after))
+
+    modified = modified_positions(before, after, 0, overlap, fingerprints_before,
+                                  fingerprints_after=fingerprints_after)
+    result.modified = RowIndexSet.from_sorted(modified)
+    if change_samples is not None:
+        result.changes = positional_changes(before, after, modified, change_samples)
+
+    result.unchanged = overlap - len(modified)
+    result.inserted.add_range(overlap, len(after))
+    result.deleted.add_range(overlap, len(before))
+    if modified:
+        result.sample = (modified[0], modified[0])
+    return result
+
+
+def modified_positions(before: List[Dict],
+                       after: List[Dict],
+                       start: int,
+                       stop: int,
+                       fingerprints_before: Optional[Sequence[int]] = None,
+                       plan: Optional[ComparisonPlan] = None,
+                       fingerprints_after: Optional[Sequence[int]] = None) -> List[int]:
+    """
+    Positions in [start, stop) where the output row differs from the input
+    row at the same position.
+
+    The plan defaults to ComparisonPlan.compile(before, after); pass it in
+    when diffing a dataset range by range so every range uses the same one.
+    """
+    if start or stop < min(len(before), len(after)):
+        before = before[start:stop]
+        after = after[start:stop]
+        if fingerprints_before is not None:
+            fingerprints_before = fingerprints_before[start:stop]
+        if fingerprints_after is not None:
+            fingerprints_after = fingerprints_after[start:stop]
+
+    if fingerprints_before is not None:
+        if fingerprints_after is None:
+            fingerprints_after = map(row_fingerprint, after)
+        return [start + i for i, (fp_before, fp_after)
+                in enumerate(zip(fingerprints_before, fingerprints_after))
+                if fp_before != fp_after]
+
+    # Tight loop: the C-level dict comparison settles unchanged rows,
+    # only differing rows reach the compiled plan
+    values_equal = (plan or ComparisonPlan.compile(before, after)).values_equal
+    return [start + i for i, (row_before, row_after) in enumerate(zip(before, after))
+            if row_before != row_after
+            and not values_equal(row_before, row_after)]
+
+
+def positional_changes(before: List[Dict],
+                       after: List[Dict],
+                       modified: Iterable[int],
+                       sample_size: int) -> ChangeStats:
+    """ChangeStats of the rows at the given (modified) positions."""
+    changes = ChangeStats(sample_size)
+    for position in modified:
+        changes.add(position, position, before[position], after[position])
+    return changes
+
+
+def diff_keyed(before: List[Dict],
+               after: List[Dict],
+               key_columns: Tuple[str, ...],
+               fingerprints_before: Optional[Sequence[int]] = None,
+               fingerprints_after: Optional[Sequence[int]] = None,
+               change_samples: Optional[int] = None) -> DiffResult:
+    """
+    Hash-join the two sides on key_columns in a single pass over each.
+
+    Rows are matched by key regardless of order. Duplicate keys are matched
+    in order of appearance, so a dedup step reports the dropped duplicates
+    as deleted.
+    """
+    differs = _pair_differ(before, after, fingerprints_before, fingerprints_after)
+    return hash_join(enumerate(before), enumerate(after), _key_getter(key_columns), differs,
+                     before, change_samples)
+
+
+def hash_join(before: Iterable[Tuple[int, Dict]],
+              after: Iterable[Tuple[int, Dict]],
+              key_of: Callable[[Dict], object],
+              differs: Callable[[int, int, Dict], bool],
+              before_rows: Optional[Sequence[Dict]] = None,
+              change_samples: Optional[int] = None) -> DiffResult:
+    """
+    The join behind diff_keyed, over (position, row) pairs in ascending
+    position order - all rows, or any subset that holds every row of the
+    keys it contains (e.g. one hash bucket of keys).
+
+    With change_samples, modified pairs are also fed to a ChangeStats as
+    they are found; before_rows gives access to the input rows by position.
+    """
+    result = DiffResult()
+    changes = None
+    if change_samples is not None:
+        changes = result.changes = ChangeStats(change_samples)
+
+    # Build side: key -> first unmatched input position
+    index: Dict[object, int] = {}
+    duplicates: Dict[object, deque] = {}
+    for i, row in before:
+        key = key_of(row)
+        if key in index:
+            duplicates.setdefault(key, deque()).append(i)
+        else:
+            index[key] = i
+
+    # Probe side
+    modified = result.modified
+    inserted = result.inserted
+    unchanged = 0
+    for j, row in after:
+        key = key_of(row)
+        i = index.pop(key, None)
+        if i is None:
+            inserted.append(j)
+            continue
+
+        queue = duplicates.get(key)
+        if queue:
+            index[key] = queue.popleft()
+
+        if differs(i, j, row):
+            modified.append(j)
+            if result.sample is None:
+                result.sample = (i, j)
+            if changes is not None:
+                changes.add(i, j, before_rows[i], row)
+        else:
+            unchanged += 1
+
+    # Whatever was never matched was deleted
+    deleted = list(index.values())
+    for queue in duplicates.values():
+        deleted.extend(queue)
+    deleted.sort()
+
+    result.deleted = RowIndexSet.from_sorted(deleted)
+    result.unchanged = unchanged
+    return result
+
+
+def diff_rows(before: List[Dict],
+              after: List[Dict],
+              key_column: Optional[KeyColumns] = None,
+              fingerprints_before: Optional[Sequence[int]] = None,
+              fingerprints_after: Optional[Sequence[int]] = None,
+              change_samples: Optional[int] = None) -> DiffResult:
+    """
+    Diff two datasets, aligning rows by key_column when one is given.
+
+    With fingerprints_before (see provena.snapshot) rows are compared by
+    fingerprint; fingerprints_after saves fingerprinting the output again
+    when the caller already has them. With change_samples, the result
+    also carries a ChangeStats (see provena.changes) keeping that many
+    sampled modified rows.
+    """
+    key_columns = normalize_key_columns(key_column)
+    if key_columns is None:
+        return diff_positional(before, after, fingerprints_before, fingerprints_after,
+                               change_samples)
+    return diff_keyed(before, after, key_columns, fingerprints_before, fingerprints_after,
+                      change_samples)
@@ -0,0 +1,239 @@
+"""
+Compact sets of row indices.
+
+Transformations tend to change rows in runs (a filtered tail, every row
+of a column fill, a block of a file), so affected rows are stored as
+sorted, non-overlapping [start, stop) ranges in two machine-integer arrays
+instead of as a list of Python ints.
+"""
+
+from array import array
+from bisect import bisect_right
+from itertools import compress, islice, repeat
+from operator import lt, ne, sub
+from typing import Any, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+
+class RowIndexSet:
+    """
+    Set of non-negative row indices stored as run-length ranges.
+
+    Membership is a binary search over the ranges, len() is O(1), and
+    union is a linear merge of the two range lists. Indices added in
+    ascending order (the way every diff produces them) are appended in
+    O(1).
+    """
+
+    __slots__ = ("_starts", "_stops", "_count")
+
+    def __init__(self, indices: Iterable[int] = ()):
+        self._starts = array('q')
+        self._stops = array('q')
+        self._count = 0
+        self.extend(indices)
+
+    # Construction
+    @classmethod
+    def from_ranges(cls, ranges: Iterable[Tuple[int, int]]) -> "RowIndexSet":
+        """Build from [start, stop) ranges (in any order, may overlap)."""
+        result = cls()
+        for start, stop in ranges:
+            result.add_range(int(start), int(stop))
+        return result
+
+    @classmethod
+    def from_sorted(cls, indices: Sequence[int]) -> "RowIndexSet":
+        """
+        Build from strictly increasing indices (what the diff produces).
+        
+        Run boundaries are found with C-level iterators, so this is much
+        faster than adding indices one by one.
+        """
+        result = cls()
+        n = len(indices)
+        if not n:
+            return result
+        # Positions k where indices[k] doesn't continue the run of indices[k-1]
+        steps = map(sub, islice(indices, 1, None), indices)
+        breaks = list(compress(range(1, n), map(ne, steps, repeat(1))))
+        result._starts = array('q', [indices[0]])
+        result._starts.extend(indices[k] for k in breaks)
+        result._stops = array('q', [indices[k - 1] + 1 for k in breaks])
+        result._stops.append(indices[-1] + 1)
+        result._count = n
+        return result
+
+    def append(self, index: int):
+        """Add an index; O(1) when it is not below the current maximum."""
+        self.add_range(index, index + 1)
+
+    add = append
+
+    def extend(self, indices: Iterable[int]):
+        stops = self._stops
+        add_range = self.add_range
+        for index in indices:
+            if stops and index == stops[-1]:
+                # Extends the current run - the common case
+                stops[-1] = index + 1
+                self._count += 1
+            else:
+                add_range(index, index + 1)
+
+    def add_range(self, start: int, stop: int):
+        """Add every index in [start, stop)."""
+        if stop <= start:
+            return
+        if start < 0:
+            raise ValueError("Row indices must be non-negative")
+
+        starts, stops = self._starts, self._stops
+        if not starts or start > stops[-1]:
+            starts.append(start)
+            stops.append(stop)
+            self._count += stop - start
+            return
+        if start >= starts[-1]:
+            # Overlaps or touches the last range
+            if stop > stops[-1]:
+                self._count += stop - stops[-1]
+                stops[-1] = stop
+            return
+
+        # General case: merge with every range it overlaps or touches
+        first = bisect_right(stops, start - 1)  # first range with stop >= start
+        last = bisect_right(starts, stop) - 1   # last range with start <= stop
+        if first > last:
+            starts.insert(first, start)
+            stops.insert(first, stop)
+            self._count += stop - start
+            return
+
+        new_start = min(start, starts[first])
+        new_stop = max(stop, stops[last])
+        removed = sum(stops[i] - starts[i] for i in range(first, last + 1))
+        del starts[first:last + 1]
+        del stops[first:last + 1]
+        starts.insert(first, new_start)
+        stops.insert(first, new_stop)
+        self._count += (new_stop - new_start) - removed
+
+    # Queries
+    def __contains__(self, index: Any) -> bool:
+        pos = bisect_right(self._starts, index) - 1
+        return pos >= 0 and index < self._stops[pos]
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __bool__(self) -> bool:
+        return self._count > 0
+
+    def __iter__(self) -> Iterator[int]:
+        for start, stop in zip(self._starts, self._stops):
+            yield from range(start, stop)
+
+    def ranges(self) -> Iterator[Tuple[int, int]]:
+        """Iterate over the [start, stop) ranges."""
+        return zip(self._starts, self._stops)
+
+    @property
+    def range_count(self) -> int:
+        return len(self._starts)
+
+    def first(self) -> Optional[int]:
+        """Smallest index, or None if empty."""
+        return self._starts[0] if self._starts else None
+
+    def head(self, n: int) -> List[int]:
+        """The n smallest indices."""
+        return list(islice(iter(self), n))
+
+    def count_between(self, start: int, stop: int) -> int:
+        """Number of indices in [start, stop)."""
+        if stop <= start:
+            return 0
+        total = 0
+        pos = bisect_right(self._stops, start)
+        while pos < len(self._starts) and self._starts[pos] < stop:
+            total += min(stop, self._stops[pos]) - max(start, self._starts[pos])
+            pos += 1
+        return total
+
+    # Set algebra
+    def union(self, *others: "RowIndexSet") -> "RowIndexSet":
+        result = self.copy()
+        for other in others:
+            for start, stop in other.ranges():
+                result.add_range(start, stop)
+        return result
+
+    __or__ = union
+
+    def shifted(self, offset: int) -> "RowIndexSet":
+        """Copy with every index moved by offset (e.g. shard -> global)."""
+        result = RowIndexSet()
+        result._starts = array('q', (s + offset for s in self._starts))
+        result._stops = array('q', (s + offset for s in self._stops))
+        result._count = self._count
+        if result._starts and result._starts[0] < 0:
+            raise ValueError("Row indices must be non-negative")
+        return result
+
+    def copy(self) -> "RowIndexSet":
+        result = RowIndexSet()
+        result._starts = array('q', self._starts)
+        result._stops = array('q', self._stops)
+        result._count = self._count
+        return result
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, RowIndexSet):
+            return self._starts == other._starts and self._stops == other._stops
+        if isinstance(other, (list, tuple, range)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    # Serialization
+    def to_json(self) -> List[Union[int, List[int]]]:
+        """
+        JSON form: a single index as an int, a run as [start, stop).
+
+        Example: {0, 1, 2, 3, 7} -> [[0, 4], 7]
+        """
+        return [start if stop == start + 1 else [start, stop]
+                for start, stop in zip(self._starts, self._stops)]
+
+    @classmethod
+    def from_json(cls, value: Optional[Sequence[Union[int, Sequence[int]]]]) -> "RowIndexSet":
+        """Inverse of to_json(); a plain list of indices is accepted too."""
+        result = cls()
+        if not value:
+            return result
+        starts = [item if isinstance(item, int) else int(item[0]) for item in value]
+        stops = [item + 1 if isinstance(item, int) else int(item[1]) for item in value]
+        # to_json() output holds separate ascending runs: take the arrays as
+        # they are; anything else is merged range by range
+        if (starts[0] >= 0 and all(map(lt, starts, stops))
+                and all(map(lt, stops, islice(starts, 1, None)))):
+            result._starts = array('q', starts)
+            result._stops = array('q', stops)
+            result._count = sum(stops) - sum(starts)
+            return result
+        for start, stop in zip(starts, stops):
+            result.add_range(start, stop)
+        return result
+
+    def describe(self, max_ranges: int = 5) -> str:
+        """Human-readable form with inclusive ends, e.g. '0-3, 7 (+2 more ranges)'."""
+        parts = [str(start) if stop == start + 1 else f"{start}-{stop - 1}"
+                 for start, stop in islice(self.ranges(), max_ranges)]
+        text = ", ".join(parts)
+        if self.range_count > max_ranges:
+            text += f" (+{self.range_count - max_ranges} more ranges)"
+        return text
+
+    def __repr__(self) -> str:
+        return f"RowIndexSet({self.to_json()!r})"
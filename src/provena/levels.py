@@ -0,0 +1,222 @@
+"""
+Audit levels - how much work auditing a step is allowed to do.
+
+    counts  row and column counts only
+    hash    counts plus digests of the input and the output
+    sample  digests plus a diff of a sample of rows, with an estimate of
+            how many rows changed overall
+    full    digests plus a diff of every row (the default)
+
+An OverheadBudget lowers the level of a step when auditing it at the
+requested level is expected to cost more than a given fraction of the
+step's own running time.
+"""
+
+import math
+import random
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from .diff import DiffResult, KeyColumns, _key_getter, normalize_key_columns
+from .indexset import RowIndexSet
+from .snapshot import row_fingerprint
+
+AUDIT_LEVELS = ("counts", "hash", "sample", "full")
+
+# Rows checked by the 'sample' level
+DEFAULT_SAMPLE_SIZE = 1000
+
+# z-score of the reported confidence interval
+_Z_95 = 1.96
+
+# Key hashes are spread over 2**_KEY_BITS buckets when sampling by key;
+# the multiplier mixes them, since hash() of ints and of short tuples of
+# ints is nearly the identity and would select a contiguous run of keys
+_KEY_BITS = 20
+_KEY_BUCKETS = 1 << _KEY_BITS
+_MIX = 0x9E3779B97F4A7C15
+_MASK_64 = (1 << 64) - 1
+
+
+def check_audit_level(level: str) -> str:
+    if level not in AUDIT_LEVELS:
+        raise ValueError(f"Unknown audit level '{level}', expected one of {AUDIT_LEVELS}")
+    return level
+
+
+class SampledCheck:
+    """
+    Diff of a sample of rows, for the 'sample' level.
+
+    The sample is picked and fingerprinted before the transformation runs
+    and compared with the output afterwards. Without a key it is stratified
+    by position (one random row out of each of sample_size equal slices);
+    with a key it is every row whose key hashes into a fraction of buckets,
+    so a sampled key is followed wherever it moves.
+
+    Args:
+        rows: The input rows
+        key_column: Column (or list of columns) identifying a row
+        sample_size: Approximate number of input rows to check
+        seed: Seed of the positional sample
+    """
+
+    def __init__(self,
+                 rows: List[Dict],
+                 key_column: Optional[KeyColumns] = None,
+                 sample_size: int = DEFAULT_SAMPLE_SIZE,
+                 seed: int = 0):
+        if sample_size < 1:
+            raise ValueError("sample_size must be at least 1")
+        self.rows_before = len(rows)
+        self.key_columns = normalize_key_columns(key_column)
+
+        if self.key_columns is None:
+            self._positions = _stratified_positions(len(rows), sample_size, seed)
+            self._fingerprints = [row_fingerprint(rows[i]) for i in self._positions]
+        else:
+            self._key_of = _key_getter(self.key_columns)
+            rate = min(1.0, sample_size / len(rows)) if rows else 1.0
+            self._cutoff = math.ceil(rate * _KEY_BUCKETS)
+            self._by_key: Dict[Any, Deque[Tuple[int, int]]] = {}
+            for i, row in enumerate(rows):
+                key = self._key_of(row)
+                if self._sampled(key):
+                    self._by_key.setdefault(key, deque()).append((i, row_fingerprint(row)))
+
+    def _sampled(self, key: Any) -> bool:
+        return ((hash(key) * _MIX) & _MASK_64) >> (64 - _KEY_BITS) < self._cutoff
+
+    def compare(self, after: List[Dict]) -> Tuple[DiffResult, Dict[str, Any]]:
+        """
+        Diff the sampled rows against the output.
+
+        Returns:
+            (DiffResult of the sampled rows only, estimate dict)
+        """
+        if self.key_columns is None:
+            return self._compare_positional(after)
+        return self._compare_keyed(after)
+
+    def _compare_positional(self, after: List[Dict]) -> Tuple[DiffResult, Dict[str, Any]]:
+        result = DiffResult()
+        overlap = min(self.rows_before, len(after))
+        sampled = 0
+        for position, fingerprint in zip(self._positions, self._fingerprints):
+            if position >= overlap:
+                continue  # Tail rows are counted exactly below
+            sampled += 1
+            if fingerprint != row_fingerprint(after[position]):
+                result.modified.append(position)
+                if result.sample is None:
+                    result.sample = (position, position)
+            else:
+                result.unchanged += 1
+        # Rows past the end of the shorter side are known without sampling
+        result.inserted.add_range(overlap, len(after))
+        result.deleted.add_range(overlap, self.rows_before)
+
+        estimate = _estimate(len(result.modified), sampled, overlap, "stratified")
+        tail = len(result.inserted) + len(result.deleted)
+        estimate["estimated_changed_rows"] += tail
+        return result, estimate
+
+    def _compare_keyed(self, after: List[Dict]) -> Tuple[DiffResult, Dict[str, Any]]:
+        result = DiffResult()
+        pending = {key: deque(entries) for key, entries in self._by_key.items()}
+        for j, row in enumerate(after):
+            key = self._key_of(row)
+            if not self._sampled(key):
+                continue
+            entries = pending.get(key)
+            if not entries:
+                result.inserted.append(j)
+                continue
+            i, fingerprint = entries.popleft()
+            if fingerprint != row_fingerprint(row):
+                result.modified.append(j)
+                if result.sample is None:
+                    result.sample = (i, j)
+            else:
+                result.unchanged += 1
+        result.deleted = RowIndexSet.from_sorted(
+            sorted(i for entries in pending.values() for i, _ in entries))
+
+        sampled = sum(len(entries) for entries in self._by_key.values()) + len(result.inserted)
+        population = max(self.rows_before, len(after))
+        changed = len(result.modified) + len(result.inserted) + len(result.deleted)
+        return result, _estimate(changed, sampled, population, "key_hash")
+
+
+def _stratified_positions(n_rows: int, sample_size: int, seed: int) -> List[int]:
+    if n_rows <= sample_size:
+        return list(range(n_rows))
+    rng = random.Random(seed)
+    width = n_rows / sample_size
+    return [min(n_rows - 1, int(k * width + rng.random() * width)) for k in range(sample_size)]
+
+
+def _estimate(changed: int, sampled: int, population: int, method: str) -> Dict[str, Any]:
+    """Changed-row estimate with a 95% confidence margin (finite population)."""
+    if not sampled:
+        return {"method": method, "sampled_rows": 0, "changed_in_sample": 0,
+                "estimated_changed_rows": 0, "margin": 0, "confidence": 0.95}
+    share = changed / sampled
+    correction = max(0.0, (population - sampled) / (population - 1)) if population > 1 else 0.0
+    margin = _Z_95 * math.sqrt(share * (1 - share) / sampled * correction) * population
+    return {
+        "method": method,
+        "sampled_rows": sampled,
+        "changed_in_sample": changed,
+        "estimated_changed_rows": round(share * population),
+        "margin": round(margin),
+        "confidence": 0.95,
+    }
+
+
+class OverheadBudget:
+    """
+    Picks the highest audit level whose expected cost fits the budget.
+
+    Costs are learned per row as steps run: the function's own time per
+    function name, the audit time per level. A level whose cost is not
+    known yet is assumed to fit, so it gets measured.
+
+    Args:
+        fraction: Allowed audit time as a fraction of the function's time
+            (0.05 = at most 5%)
+    """
+
+    # Weight of the newest observation in the running averages
+    SMOOTHING = 0.3
+
+    def __init__(self, fraction: float):
+        if fraction <= 0:
+            raise ValueError("The overhead budget must be positive")
+        self.fraction = fraction
+        self._function_cost: Dict[str, float] = {}
+        self._audit_cost: Dict[str, float] = {}
+
+    def choose(self, function_name: str, requested: str, n_rows: int) -> str:
+        """Level to audit the next call of function_name at."""
+        function_cost = self._function_cost.get(function_name)
+        if function_cost is None:
+            return requested
+        allowed = self.fraction * function_cost * max(n_rows, 1)
+        for level in reversed(AUDIT_LEVELS[:AUDIT_LEVELS.index(requested) + 1]):
+            cost = self._audit_cost.get(level)
+            if cost is None or cost * max(n_rows, 1) <= allowed:
+                return level
+        return AUDIT_LEVELS[0]
+
+    def observe(self, function_name: str, level: str, n_rows: int,
+                function_s: float, audit_s: float):
+        """Record the measured cost of one step."""
+        n_rows = max(n_rows, 1)
+        _smooth(self._function_cost, function_name, function_s / n_rows, self.SMOOTHING)
+        _smooth(self._audit_cost, level, audit_s / n_rows, self.SMOOTHING)
+
+
+def _smooth(averages: Dict[str, float], key: str, value: float, weight: float):
+    previous = averages.get(key)
+    averages[key] = value if previous is None else previous + weight * (value - previous)
@@ -3,123 +3,479 @@ The audit logging system - stores all transformation records.
 """
 
 import json
-import hashlib
+import threading
 from datetime import datetime
-from dataclasses import dataclass, asdict
-from typing import List, Dict, Any, Optional, Union
-import csv
-import io
+from typing import List, Dict, Any, Callable, Iterable, Optional, Sequence, Tuple
+from .hashing import (EMPTY_DIGEST, HASH_MODES, compute_record_digest, digest_columns,
+                      digest_rows, unordered_digest, verify_chain)
+from .columnar import Columns, column_length, diff_columns, row_at
+from .changes import DEFAULT_CHANGE_SAMPLES
+from .indexset import RowIndexSet
+from .levels import OverheadBudget, SampledCheck, check_audit_level
+from .diff import DiffResult, KeyColumns, diff_rows, normalize_key_columns
+from .parallel import DEFAULT_PARALLEL_THRESHOLD, DEFAULT_SHARD_ROWS, ParallelAuditor
+from .profiling import StepProfile, measure
+from .sinks import AuditSink, opener_for
+from .snapshot import fingerprint_rows
+from .streaming import StreamDiffer
+
+_COUNT_TOTALS = ("total_steps", "total_changes", "total_inserted",
+                 "total_deleted", "total_modified")
+_PERFORMANCE_TOTALS = ("function_wall_s", "function_cpu_s", "audit_wall_s", "audit_cpu_s")
 
-@dataclass
 class AuditRecord:
-    """Immutable record of a single data transformation."""
+    """
+    Immutable record of a single data transformation.
     
-    # Basic info
-    step_id: str
-    function_name: str
-    timestamp: str
-    rule_id: Optional[str]
+    Uses __slots__ (no per-instance __dict__) and a hand-written
+    to_dict() / from_dict() pair, because trails from micro-batched jobs
+    hold hundreds of thousands of records.
+    """
     
-    # Data metrics
-    rows_before: int
-    rows_after: int
-    columns_before: List[str]
-    columns_after: List[str]
+    __slots__ = (
+        # Basic info
+        "step_id", "function_name", "timestamp", "rule_id",
+        # Data metrics
+        "rows_before", "rows_after", "columns_before", "columns_after",
+        # Critical: WHICH rows changed (output positions of modified and
+        # inserted rows, all of them; the count also includes deleted rows)
+        "affected_row_indices", "affected_row_count",
+        # Critical: WHAT changed (samples)
+        "sample_before", "sample_after",
+        # Per-column change counters and sampled changed rows (see
+        # provena.changes), None when not collected
+        "column_stats", "change_samples",
+        # Data integrity
+        "hash_before", "hash_after",
+        # Status ('SUCCESS', 'WARNING', 'ERROR')
+        "status", "message",
+        # Row classification (rows matched by key_columns, or by position)
+        "key_columns", "rows_inserted", "rows_deleted", "rows_modified",
+        "rows_unchanged", "deleted_row_indices",
+        # Tamper evidence: each record's digest covers the previous one
+        "prev_digest", "record_digest",
+        # Cost of the step (see provena.profiling), None when not profiled
+        "performance",
+        # Worker shards the record was collected from (see provena.collector)
+        "shard_ids",
+        # How thoroughly the step was audited (see provena.levels) and, for
+        # the 'sample' level, the estimated number of changed rows
+        "audit_level", "estimate",
+    )
     
-    # Critical: WHICH rows changed
-    affected_row_indices: List[int]
-    affected_row_count: int
+    def __init__(self,
+                 step_id: str,
+                 function_name: str,
+                 timestamp: str,
+                 rule_id: Optional[str],
+                 rows_before: int,
+                 rows_after: int,
+                 columns_before: List[str],
+                 columns_after: List[str],
+                 affected_row_indices: RowIndexSet,
+                 affected_row_count: int,
+                 sample_before: Dict[str, Any],
+                 sample_after: Dict[str, Any],
+                 hash_before: str,
+                 hash_after: str,
+                 status: str,
+                 message: Optional[str],
+                 key_columns: Optional[List[str]] = None,
+                 rows_inserted: int = 0,
+                 rows_deleted: int = 0,
+                 rows_modified: int = 0,
+                 rows_unchanged: int = 0,
+                 deleted_row_indices: Optional[RowIndexSet] = None,  # input positions
+                 prev_digest: Optional[str] = None,
+                 record_digest: Optional[str] = None,
+                 performance: Optional[Dict[str, float]] = None,
+                 shard_ids: Optional[List[int]] = None,
+                 audit_level: str = "full",
+                 estimate: Optional[Dict[str, Any]] = None,
+                 column_stats: Optional[Dict[str, Dict[str, int]]] = None,
+                 change_samples: Optional[List[Dict[str, Any]]] = None):
+        self.step_id = step_id
+        self.function_name = function_name
+        self.timestamp = timestamp
+        self.rule_id = rule_id
+        self.rows_before = rows_before
+        self.rows_after = rows_after
+        self.columns_before = columns_before
+        self.columns_after = columns_after
+        self.affected_row_indices = affected_row_indices
+        self.affected_row_count = affected_row_count
+        self.sample_before = sample_before
+        self.sample_after = sample_after
+        self.hash_before = hash_before
+        self.hash_after = hash_after
+        self.status = status
+        self.message = message
+        self.key_columns = key_columns
+        self.rows_inserted = rows_inserted
+        self.rows_deleted = rows_deleted
+        self.rows_modified = rows_modified
+        self.rows_unchanged = rows_unchanged
+        self.deleted_row_indices = (deleted_row_indices if deleted_row_indices is not None
+                                    else RowIndexSet())
+        self.prev_digest = prev_digest
+        self.record_digest = record_digest
+        self.performance = performance
+        self.shard_ids = shard_ids
+        self.audit_level = audit_level
+        self.estimate = estimate
+        self.column_stats = column_stats
+        self.change_samples = change_samples
     
-    # Critical: WHAT changed (samples)
-    sample_before: Dict[str, Any]
-    sample_after: Dict[str, Any]
+    def to_dict(self) -> Dict:
+        """
+        Convert to dictionary for serialization.
+        
+        Nested values (samples, column lists) are shared with the record,
+        not copied.
+        """
+        return {
+            "step_id": self.step_id,
+            "function_name": self.function_name,
+            "timestamp": self.timestamp,
+            "rule_id": self.rule_id,
+            "rows_before": self.rows_before,
+            "rows_after": self.rows_after,
+            "columns_before": self.columns_before,
+            "columns_after": self.columns_after,
+            # Index sets serialize as compact [start, stop) runs
+            "affected_row_indices": self.affected_row_indices.to_json(),
+            "affected_row_count": self.affected_row_count,
+            "sample_before": self.sample_before,
+            "sample_after": self.sample_after,
+            "hash_before": self.hash_before,
+            "hash_after": self.hash_after,
+            "status": self.status,
+            "message": self.message,
+            "key_columns": self.key_columns,
+            "rows_inserted": self.rows_inserted,
+            "rows_deleted": self.rows_deleted,
+            "rows_modified": self.rows_modified,
+            "rows_unchanged": self.rows_unchanged,
+            "deleted_row_indices": self.deleted_row_indices.to_json(),
+            "prev_digest": self.prev_digest,
+            "record_digest": self.record_digest,
+            "performance": self.performance,
+            "shard_ids": self.shard_ids,
+            "audit_level": self.audit_level,
+            "estimate": self.estimate,
+            "column_stats": self.column_stats,
+            "change_samples": self.change_samples,
+        }
     
-    # Data integrity
-    hash_before: str
-    hash_after: str
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "AuditRecord":
+        """
+        Rebuild a record from to_dict() output (e.g. a loaded JSON file).
+        
+        Fields added in later versions are optional, so older audit files
+        load too.
+        """
+        get = data.get
+        return cls(
+            step_id=data["step_id"],
+            function_name=data["function_name"],
+            timestamp=data["timestamp"],
+            rule_id=get("rule_id"),
+            rows_before=data["rows_before"],
+            rows_after=data["rows_after"],
+            columns_before=get("columns_before") or [],
+            columns_after=get("columns_after") or [],
+            affected_row_indices=RowIndexSet.from_json(get("affected_row_indices")),
+            affected_row_count=get("affected_row_count", 0),
+            sample_before=get("sample_before") or {},
+            sample_after=get("sample_after") or {},
+            hash_before=get("hash_before"),
+            hash_after=get("hash_after"),
+            status=get("status", "SUCCESS"),
+            message=get("message"),
+            key_columns=get("key_columns"),
+            rows_inserted=get("rows_inserted", 0),
+            rows_deleted=get("rows_deleted", 0),
+            rows_modified=get("rows_modified", 0),
+            rows_unchanged=get("rows_unchanged", 0),
+            deleted_row_indices=RowIndexSet.from_json(get("deleted_row_indices")),
+            prev_digest=get("prev_digest"),
+            record_digest=get("record_digest"),
+            performance=get("performance"),
+            shard_ids=get("shard_ids"),
+            audit_level=get("audit_level", "full"),
+            estimate=get("estimate"),
+            column_stats=get("column_stats"),
+            change_samples=get("change_samples"),
+        )
     
-    # Status
-    status: str  # 'SUCCESS', 'WARNING', 'ERROR'
-    message: Optional[str]
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, AuditRecord):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
     
-    def to_dict(self) -> Dict:
-        """Convert to dictionary for serialization."""
-        return asdict(self)
+    __hash__ = None
+    
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"AuditRecord({fields})"
+
+def write_trail_json(stream,
+                     header: Dict[str, Any],
+                     list_key: str,
+                     records: Iterable[AuditRecord],
+                     trailer: Optional[Callable[[], Dict[str, Any]]] = None):
+    """
+    Write a JSON document made of header fields plus a list of records.
+    
+    Header fields are indented for readability; each record is written on
+    one line with the C JSON encoder (json.dump with indent falls back to
+    the much slower pure-Python encoder). Records are written as they are
+    iterated, so a lazy iterable is never held in memory. trailer() is
+    called once the records are written, for fields computed from them.
+    """
+    stream.write("{\n")
+    for key, value in header.items():
+        text = json.dumps(value, indent=2, default=str).replace("\n", "\n  ")
+        stream.write(f"  {json.dumps(key)}: {text},\n")
+    stream.write(f"  {json.dumps(list_key)}: [")
+    separator = "\n    "
+    for record in records:
+        stream.write(separator)
+        stream.write(json.dumps(record.to_dict(), default=str))
+        separator = ",\n    "
+    stream.write("\n  ]")
+    for key, value in (trailer() if trailer else {}).items():
+        text = json.dumps(value, indent=2, default=str).replace("\n", "\n  ")
+        stream.write(f",\n  {json.dumps(key)}: {text}")
+    stream.write("\n}\n")
+
+class TrailTotals:
+    """
+    Running totals of a trail, so a summary never needs the records
+    themselves (see ProvenaLogger.get_summary and provena.reader).
+    """
+    
+    def __init__(self):
+        self.counts = dict.fromkeys(_COUNT_TOTALS, 0)
+        self.performance = dict.fromkeys(_PERFORMANCE_TOTALS, 0.0)
+        self.profiled_steps = 0
+        self.levels: Dict[str, int] = {}
+        self.start_time: Optional[str] = None
+        self.end_time: Optional[str] = None
+    
+    def add(self, record: AuditRecord):
+        counts = self.counts
+        counts["total_steps"] += 1
+        counts["total_changes"] += record.affected_row_count
+        counts["total_inserted"] += record.rows_inserted
+        counts["total_deleted"] += record.rows_deleted
+        counts["total_modified"] += record.rows_modified
+        level = record.audit_level
+        self.levels[level] = self.levels.get(level, 0) + 1
+        if record.performance:
+            self.profiled_steps += 1
+            for key in _PERFORMANCE_TOTALS:
+                self.performance[key] += record.performance.get(key, 0)
+        if self.start_time is None:
+            self.start_time = record.timestamp
+        self.end_time = record.timestamp
+    
+    def summary(self, pipeline_name: str) -> Dict[str, Any]:
+        summary = {"pipeline": pipeline_name}
+        summary.update(self.counts)
+        summary["start_time"] = self.start_time
+        summary["end_time"] = self.end_time
+        if set(self.levels) - {"full"}:
+            # Steps audited below 'full' report lower bounds of their changes
+            summary["audit_levels"] = dict(self.levels)
+        
+        if self.profiled_steps:
+            performance = {key: round(value, 6) for key, value in self.performance.items()}
+            performance["profiled_steps"] = self.profiled_steps
+            function_wall = self.performance["function_wall_s"]
+            performance["audit_overhead_pct"] = (
+                round(100 * self.performance["audit_wall_s"] / function_wall, 2)
+                if function_wall else None)
+            summary["performance"] = performance
+        return summary
+
+class _LastOutput:
+    """Output of the last logged step, kept for the next step to reuse."""
+    
+    __slots__ = ("data", "length", "hash", "fingerprints")
+    
+    def __init__(self, data: List[Dict], hash: str, fingerprints: Optional[Sequence[int]]):
+        self.data = data
+        self.length = len(data)
+        self.hash = hash
+        self.fingerprints = fingerprints
 
 class ProvenaLogger:
     """Maintains a tamper-evident audit trail without external dependencies."""
     
-    def __init__(self, pipeline_name: str = "Unnamed_Pipeline"):
+    def __init__(self,
+                 pipeline_name: str = "Unnamed_Pipeline",
+                 hash_mode: str = "ordered",
+                 sink: Optional[AuditSink] = None,
+                 keep_records: bool = True,
+                 workers: int = 1,
+                 shard_size: int = DEFAULT_SHARD_ROWS,
+                 parallel_threshold: int = DEFAULT_PARALLEL_THRESHOLD,
+                 reuse_last_output: bool = False,
+                 audit_level: str = "full",
+                 overhead_budget: Optional[float] = None,
+                 change_samples: Optional[int] = DEFAULT_CHANGE_SAMPLES):
+        """
+        Args:
+            pipeline_name: Name of the pipeline being audited
+            hash_mode: 'ordered' (row order is part of the hash) or
+                'unordered' (same rows in any order hash the same)
+            sink: Optional AuditSink that receives every record as soon as
+                it is logged (e.g. JsonlSink)
+            keep_records: Keep records in self.records; turn off with a sink
+                so long-running jobs don't hold the trail in memory
+            workers: Worker processes used to diff and hash large steps
+                (1 = serial, None = one per CPU). Steps stay serial while
+                other threads run, e.g. a sink's writer; see provena.parallel
+            shard_size: Rows per parallel shard, a multiple of 4096
+            parallel_threshold: Steps with fewer rows are audited serially
+            reuse_last_output: Remember the digest (and row fingerprints) of
+                each step's output, so a next step that receives that same
+                list doesn't hash or fingerprint it again
+            audit_level: Default audit level of the steps: 'counts', 'hash',
+                'sample' or 'full' (see provena.levels)
+            overhead_budget: Allowed audit time as a fraction of the step's
+                own time (e.g. 0.05); steps expected to exceed it are
+                audited at a lower level, recorded in AuditRecord.audit_level
+            change_samples: Changed rows sampled per step, along with
+                per-column change counters (see provena.changes); None
+                turns both off
+        """
+        if hash_mode not in HASH_MODES:
+            raise ValueError(f"Unknown hash_mode '{hash_mode}', expected one of {HASH_MODES}")
         self.pipeline_name = pipeline_name
+        self.hash_mode = hash_mode
         self.records: List[AuditRecord] = []
+        self.sink = sink
+        self.keep_records = keep_records
+        self.reuse_last_output = reuse_last_output
+        self.audit_level = check_audit_level(audit_level)
+        self.overhead_budget = overhead_budget
+        self.change_samples = change_samples
+        self._budget = OverheadBudget(overhead_budget) if overhead_budget else None
+        self._last_output: Optional[_LastOutput] = None
+        self._parallel = (ParallelAuditor(workers, shard_size, parallel_threshold)
+                          if workers != 1 else None)
         self._step_counter = 0
+        self._last_digest: Optional[str] = None
+        self._lock = threading.Lock()
+        self._reset_totals()
+        
+        if sink is not None:
+            sink.start(pipeline_name)
     
-    def _compute_hash(self, data: List[Dict]) -> str:
-        """Compute a deterministic hash for data validation."""
-        if not data:
-            return "empty"
+    def _reset_totals(self):
+        # Running totals, so get_summary() works without self.records
+        self._totals = TrailTotals()
+    
+    def last_output_state(self, data: Any) -> Optional[Tuple[str, Optional[Sequence[int]]]]:
+        """
+        (digest, row fingerprints or None) of data if it is the output of
+        the last logged step, else None.
         
-        # Convert data to CSV string for hashing
-        output = io.StringIO()
-        if data:
-            writer = csv.DictWriter(output, fieldnames=data[0].keys())
-            writer.writeheader()
-            writer.writerows(data[:10])  # Sample first 10 rows
+        Only the identity and length of the list are checked: rows edited
+        in place between two steps, outside any audited function, are not
+        noticed and show up as changes of the next step.
+        """
+        last = self._last_output
+        if last is None or last.data is not data or len(data) != last.length:
+            return None
+        return last.hash, last.fingerprints
+    
+    def remember_output(self, data: List[Dict], digest: Optional[str]):
+        """
+        Note data (with its digest) as the output of the last step, for a
+        step logged without a diff (e.g. a cache hit).
+        """
+        if self.reuse_last_output:
+            self._last_output = (_LastOutput(data, digest, None)
+                                 if digest is not None and isinstance(data, list) else None)
+    
+    def choose_audit_level(self, function_name: str, requested: str, n_rows: int) -> str:
+        """
+        Level to audit a step at: the requested one, or a lower one when the
+        overhead budget is expected to be exceeded.
+        """
+        check_audit_level(requested)
+        if self._budget is None:
+            return requested
+        return self._budget.choose(function_name, requested, n_rows)
+    
+    def observe_step_cost(self, function_name: str, audit_level: str, n_rows: int,
+                          profile: StepProfile):
+        """Feed the measured cost of a step to the overhead budget."""
+        if self._budget is None:
+            return
+        cost = profile.to_dict()
+        self._budget.observe(function_name, audit_level, n_rows,
+                             cost["function_wall_s"], cost["audit_wall_s"])
+    
+    def _compute_hash(self, data: List[Dict]) -> str:
+        """
+        Compute a deterministic hash covering every row of the data.
         
-        data_str = output.getvalue()
-        return hashlib.sha256(data_str.encode()).hexdigest()[:12]
+        'ordered' mode is the root of a per-chunk Merkle tree (see
+        provena.hashing); 'unordered' mode ignores row order.
+        """
+        if not data:
+            return EMPTY_DIGEST
+        if self.hash_mode == "unordered":
+            return unordered_digest(data)
+        return digest_rows(data).root
+    
+    def _compute_column_hash(self, columns: Columns) -> str:
+        """Compute a deterministic hash of a dict of columns (always ordered)."""
+        n_rows = column_length(columns) if columns else 0
+        if not n_rows:
+            return EMPTY_DIGEST
+        return digest_columns(columns, n_rows).root
     
     def _find_changed_rows(self, 
                           before: List[Dict], 
                           after: List[Dict],
-                          key_column: Optional[str] = None) -> List[int]:
+                          key_column: Optional[KeyColumns] = None,
+                          fingerprints_before: Optional[Sequence[int]] = None,
+                          fingerprints_after: Optional[Sequence[int]] = None,
+                          change_samples: Optional[int] = None) -> DiffResult:
         """
-        Find indices where rows actually changed.
-        FIXED: Compares RAW values, not normalized.
-        """
-        changed_indices = []
+        Classify rows as inserted, deleted, modified or unchanged.
         
-        if len(before) != len(after):
-            # If row counts differ, all indices changed
-            return list(range(max(len(before), len(after))))
+        With a key_column the two sides are hash-joined on the key, so
+        filters, dedups and reorderings are reported correctly. Without one,
+        rows are compared position by position.
         
-        for i in range(len(before)):
-            row_before = before[i]
-            row_after = after[i]
-            
-            # Compare each key-value pair
-            all_keys = set(row_before.keys()) | set(row_after.keys())
-            
-            for key in all_keys:
-                val_before = row_before.get(key)
-                val_after = row_after.get(key)
-                
-                # Handle None values properly
-                if val_before is None and val_after is None:
-                    continue  # Both None = no change
-                elif val_before is None or val_after is None:
-                    # One is None, other isn't = CHANGE!
-                    changed_indices.append(i)
-                    break
-                elif str(val_before) != str(val_after):
-                    # Different string values = CHANGE!
-                    changed_indices.append(i)
-                    break
-            
-            # Check if we already marked this row as changed
-            if i in changed_indices:
-                continue
+        When fingerprints of the input were taken up front (copy-free
+        snapshots), rows are compared by fingerprint instead, because the
+        input rows may share nested objects with the output.
         
-        return changed_indices
+        With change_samples, modified rows are also counted per column and
+        sampled as they are found (DiffResult.changes).
+        """
+        return diff_rows(before, after, key_column, fingerprints_before, fingerprints_after,
+                         change_samples)
     
     def log_transformation(self,
                           function_name: str,
                           data_before: List[Dict],
                           data_after: List[Dict],
                           rule_id: Optional[str] = None,
-                          key_column: Optional[str] = None,
+                          key_column: Optional[KeyColumns] = None,
                           status: str = "SUCCESS",
-                          message: Optional[str] = None) -> AuditRecord:
+                          message: Optional[str] = None,
+                          fingerprints_before: Optional[Sequence[int]] = None,
+                          profile: Optional[StepProfile] = None,
+                          hash_before: Optional[str] = None) -> AuditRecord:
         """
         Log a data transformation with full audit details.
         
@@ -128,78 +484,378 @@ class ProvenaLogger:
             data_before: List of dictionaries (rows) before transformation
             data_after: List of dictionaries (rows) after transformation
             rule_id: Business rule identifier
-            key_column: Column to use for row identification
+            key_column: Column (or list of columns) identifying a row; rows
+                are then matched by key instead of by position
             status: 'SUCCESS', 'WARNING', or 'ERROR'
             message: Optional status message
+            fingerprints_before: Row fingerprints of data_before taken before
+                the transformation ran (see provena.snapshot)
+            profile: StepProfile of the step; the diff and hashing done here
+                are added to its audit phase
+            hash_before: Digest of data_before when it is already known
+                (see last_output_state), so it isn't hashed again
         """
         
-        self._step_counter += 1
+        with measure(profile, "audit"):
+            # Get columns
+            cols_before = list(data_before[0].keys()) if data_before else []
+            cols_after = list(data_after[0].keys()) if data_after else []
+            
+            # Fingerprint the output in full so the next step can take
+            # them over as its input fingerprints
+            fingerprints_after = None
+            if fingerprints_before is not None and self.reuse_last_output:
+                fingerprints_after = fingerprint_rows(data_after)
+            
+            # Find changed rows and hash both sides
+            if self._parallel is not None and self._parallel.applies(data_before, data_after):
+                diff, hash_before, hash_after = self._parallel.diff_and_hash(
+                    data_before, data_after, normalize_key_columns(key_column),
+                    fingerprints_before, self.hash_mode, fingerprints_after, hash_before,
+                    self.change_samples)
+            else:
+                diff = self._find_changed_rows(data_before, data_after, key_column,
+                                               fingerprints_before, fingerprints_after,
+                                               self.change_samples)
+                if hash_before is None:
+                    hash_before = self._compute_hash(data_before)
+                hash_after = self._compute_hash(data_after)
+            
+            if self.reuse_last_output:
+                self._last_output = _LastOutput(data_after, hash_after, fingerprints_after)
+            
+            # Capture samples of changes
+            sample_before = {}
+            sample_after = {}
+            
+            if diff.sample is not None:
+                sample_before = data_before[diff.sample[0]]
+                sample_after = data_after[diff.sample[1]]
         
-        # Get columns
-        cols_before = list(data_before[0].keys()) if data_before else []
-        cols_after = list(data_after[0].keys()) if data_after else []
+        return self._append_record(
+            function_name=function_name,
+            rule_id=rule_id,
+            rows_before=len(data_before),
+            rows_after=len(data_after),
+            columns_before=cols_before,
+            columns_after=cols_after,
+            diff=diff,
+            sample_before=sample_before,
+            sample_after=sample_after,
+            hash_before=hash_before,
+            hash_after=hash_after,
+            status=status,
+            message=message,
+            key_columns=normalize_key_columns(key_column),
+            performance=profile.to_dict() if profile else None
+        )
+    
+    def log_partial_transformation(self,
+                                   function_name: str,
+                                   data_before: List[Dict],
+                                   data_after: List[Dict],
+                                   audit_level: str,
+                                   rule_id: Optional[str] = None,
+                                   key_column: Optional[KeyColumns] = None,
+                                   status: str = "SUCCESS",
+                                   message: Optional[str] = None,
+                                   hash_before: Optional[str] = None,
+                                   sampled: Optional[SampledCheck] = None,
+                                   profile: Optional[StepProfile] = None) -> AuditRecord:
+        """
+        Log a transformation audited below the 'full' level.
         
-        # Find changed rows
-        changed_indices = self._find_changed_rows(data_before, data_after, key_column)
+        'counts' records row and column counts only, 'hash' adds the
+        digests, 'sample' adds the diff of the rows picked by sampled
+        (affected rows are then the changed rows found in the sample, and
+        AuditRecord.estimate extrapolates them to the whole step).
         
-        # Capture samples of changes
-        sample_before = {}
-        sample_after = {}
+        Args:
+            function_name: Name of the transformation function
+            data_before: List of dictionaries (rows) before transformation
+            data_after: List of dictionaries (rows) after transformation
+            audit_level: 'counts', 'hash' or 'sample'
+            rule_id: Business rule identifier
+            key_column: Column (or list of columns) identifying a row
+            status: 'SUCCESS', 'WARNING', or 'ERROR'
+            message: Optional status message
+            hash_before: Digest of data_before, taken before the
+                transformation ran; computed here if missing
+            sampled: SampledCheck taken before the transformation ran
+                (required for 'sample')
+            profile: StepProfile of the step (see log_transformation)
+        """
+        if audit_level not in ("counts", "hash", "sample"):
+            raise ValueError(f"Cannot log a partial transformation at level '{audit_level}'")
+        if audit_level == "sample" and sampled is None:
+            raise ValueError("The 'sample' level needs a SampledCheck")
         
-        if changed_indices and len(changed_indices) > 0:
-            sample_idx = changed_indices[0]
-            if sample_idx < len(data_before):
-                sample_before = data_before[sample_idx]
-            if sample_idx < len(data_after):
-                sample_after = data_after[sample_idx]
+        with measure(profile, "audit"):
+            cols_before = list(data_before[0].keys()) if data_before else []
+            cols_after = list(data_after[0].keys()) if data_after else []
+            
+            diff = DiffResult()
+            estimate = None
+            hash_after = None
+            if audit_level == "counts":
+                hash_before = None
+            else:
+                if hash_before is None:
+                    hash_before = self._compute_hash(data_before)
+                hash_after = self._compute_hash(data_after)
+                if hash_after == hash_before:
+                    # Identical digests - nothing changed, no sampling needed
+                    diff.unchanged = len(data_after)
+                elif sampled is not None:
+                    diff, estimate = sampled.compare(data_after)
+            
+            if self.reuse_last_output and hash_after is not None:
+                self._last_output = _LastOutput(data_after, hash_after, None)
+            
+            sample_before = {}
+            sample_after = {}
+            if diff.sample is not None:
+                sample_before = data_before[diff.sample[0]]
+                sample_after = data_after[diff.sample[1]]
         
-        # Create the audit record
-        record = AuditRecord(
-            step_id=f"step_{self._step_counter:03d}",
+        return self._append_record(
             function_name=function_name,
-            timestamp=datetime.now().isoformat(),
             rule_id=rule_id,
             rows_before=len(data_before),
             rows_after=len(data_after),
             columns_before=cols_before,
             columns_after=cols_after,
-            affected_row_indices=changed_indices[:20],  # First 20 indices
-            affected_row_count=len(changed_indices),
+            diff=diff,
+            sample_before=sample_before,
+            sample_after=sample_after,
+            hash_before=hash_before,
+            hash_after=hash_after,
+            status=status,
+            message=message,
+            key_columns=normalize_key_columns(key_column),
+            performance=profile.to_dict() if profile else None,
+            audit_level=audit_level,
+            estimate=estimate
+        )
+    
+    def log_columnar_transformation(self,
+                                    function_name: str,
+                                    columns_before: Columns,
+                                    columns_after: Columns,
+                                    rule_id: Optional[str] = None,
+                                    status: str = "SUCCESS",
+                                    message: Optional[str] = None,
+                                    profile: Optional[StepProfile] = None) -> AuditRecord:
+        """
+        Log a transformation of a dataset stored as a dict of columns.
+        
+        Columns may be lists, array.array or NumPy arrays. Changed rows are
+        found column by column (vectorized when NumPy is available) and no
+        row dicts are built, except for the change sample. Rows are matched
+        by position.
+        
+        Args:
+            function_name: Name of the transformation function
+            columns_before: Dict of column name -> values before transformation
+            columns_after: Dict of column name -> values after transformation
+            rule_id: Business rule identifier
+            status: 'SUCCESS', 'WARNING', or 'ERROR'
+            message: Optional status message
+            profile: StepProfile of the step (see log_transformation)
+        """
+        with measure(profile, "audit"):
+            diff = diff_columns(columns_before, columns_after)
+            
+            sample_before = {}
+            sample_after = {}
+            if diff.sample is not None:
+                sample_before = row_at(columns_before, diff.sample[0])
+                sample_after = row_at(columns_after, diff.sample[1])
+            
+            hash_before = self._compute_column_hash(columns_before)
+            hash_after = self._compute_column_hash(columns_after)
+        
+        return self._append_record(
+            function_name=function_name,
+            rule_id=rule_id,
+            rows_before=column_length(columns_before),
+            rows_after=column_length(columns_after),
+            columns_before=list(columns_before.keys()),
+            columns_after=list(columns_after.keys()),
+            diff=diff,
+            sample_before=sample_before,
+            sample_after=sample_after,
+            hash_before=hash_before,
+            hash_after=hash_after,
+            status=status,
+            message=message,
+            performance=profile.to_dict() if profile else None
+        )
+    
+    def log_stream(self,
+                   function_name: str,
+                   differ: StreamDiffer,
+                   rule_id: Optional[str] = None,
+                   status: str = "SUCCESS",
+                   message: Optional[str] = None) -> AuditRecord:
+        """
+        Log a transformation that was diffed incrementally as a stream.
+        
+        Args:
+            function_name: Name of the transformation function
+            differ: The StreamDiffer that saw the input and output rows
+            rule_id: Business rule identifier
+            status: 'SUCCESS', 'WARNING', or 'ERROR'
+            message: Optional status message
+        """
+        diff = differ.finish()
+        return self._append_record(
+            function_name=function_name,
+            rule_id=rule_id,
+            rows_before=differ.rows_before,
+            rows_after=differ.rows_after,
+            columns_before=differ.columns_before,
+            columns_after=differ.columns_after,
+            diff=diff,
+            sample_before=differ.sample_before,
+            sample_after=differ.sample_after,
+            hash_before=differ.hash_before,
+            hash_after=differ.hash_after,
+            status=status,
+            message=message,
+            key_columns=differ.key_columns
+        )
+    
+    def _append_record(self,
+                       function_name: str,
+                       rule_id: Optional[str],
+                       rows_before: int,
+                       rows_after: int,
+                       columns_before: List[str],
+                       columns_after: List[str],
+                       diff: DiffResult,
+                       sample_before: Dict[str, Any],
+                       sample_after: Dict[str, Any],
+                       hash_before: str,
+                       hash_after: str,
+                       status: str,
+                       message: Optional[str],
+                       key_columns: Optional[Sequence[str]] = None,
+                       performance: Optional[Dict[str, float]] = None,
+                       audit_level: str = "full",
+                       estimate: Optional[Dict[str, Any]] = None) -> AuditRecord:
+        """Build the AuditRecord for a finished diff and add it to the trail."""
+        changes = diff.changes
+        record = AuditRecord(
+            step_id="",
+            function_name=function_name,
+            timestamp="",
+            rule_id=rule_id,
+            rows_before=rows_before,
+            rows_after=rows_after,
+            columns_before=columns_before,
+            columns_after=columns_after,
+            affected_row_indices=diff.affected_indices,
+            affected_row_count=diff.affected_count,
             sample_before=sample_before,
             sample_after=sample_after,
-            hash_before=self._compute_hash(data_before),
-            hash_after=self._compute_hash(data_after),
+            hash_before=hash_before,
+            hash_after=hash_after,
             status=status,
-            message=message
+            message=message,
+            key_columns=list(key_columns) if key_columns else None,
+            rows_inserted=len(diff.inserted),
+            rows_deleted=len(diff.deleted),
+            rows_modified=len(diff.modified),
+            rows_unchanged=diff.unchanged,
+            deleted_row_indices=diff.deleted,
+            performance=performance,
+            audit_level=audit_level,
+            estimate=estimate,
+            column_stats=changes.column_stats() if changes is not None else None,
+            change_samples=changes.samples() if changes is not None else None
         )
+        return self._commit(record, stamp=True)
+    
+    def append_record(self, record: AuditRecord) -> AuditRecord:
+        """
+        Add a record built elsewhere (e.g. by a worker process) to the trail.
         
-        self.records.append(record)
-        return record
+        The record keeps its timestamp but gets this trail's next step id
+        and is chained to this trail's previous record.
+        """
+        return self._commit(record, stamp=False)
+    
+    def _commit(self, record: AuditRecord, stamp: bool) -> AuditRecord:
+        # Steps may finish concurrently: numbering, chaining and appending
+        # happen under one lock so step ids, the digest chain and the
+        # order of records (and of sink writes) always agree
+        with self._lock:
+            self._step_counter += 1
+            record.step_id = f"step_{self._step_counter:03d}"
+            if stamp:
+                record.timestamp = datetime.now().isoformat()
+            
+            # Chain the record to the previous one
+            record.prev_digest = self._last_digest
+            record.record_digest = compute_record_digest(record.to_dict(), self._last_digest)
+            self._last_digest = record.record_digest
+            
+            self._totals.add(record)
+            
+            if self.keep_records:
+                self.records.append(record)
+            if self.sink is not None:
+                self.sink.write(record)
+            return record
     
     def get_summary(self) -> Dict:
         """Get a summary of the audit trail."""
-        return {
-            "pipeline": self.pipeline_name,
-            "total_steps": len(self.records),
-            "total_changes": sum(r.affected_row_count for r in self.records),
-            "start_time": self.records[0].timestamp if self.records else None,
-            "end_time": self.records[-1].timestamp if self.records else None
-        }
+        with self._lock:
+            return self._build_summary()
+    
+    def _build_summary(self) -> Dict:
+        return self._totals.summary(self.pipeline_name)
     
     def export_json(self, filepath: str):
         """Export full audit trail to JSON file."""
-        audit_data = {
+        # Snapshot under the lock so steps still running elsewhere can't
+        # leave the summary and the records out of step
+        with self._lock:
+            records = list(self.records)
+            summary = self._build_summary()
+        header = {
             "pipeline": self.pipeline_name,
             "created_at": datetime.now().isoformat(),
             "provena_version": "0.1.0",
-            "summary": self.get_summary(),
-            "audit_trail": [r.to_dict() for r in self.records]
+            "summary": summary,
         }
         
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(audit_data, f, indent=2, default=str)
+        # A .gz / .xz filepath is compressed
+        with opener_for(filepath)(filepath, 'wt', encoding='utf-8') as f:
+            write_trail_json(f, header, "audit_trail", records)
+    
+    def verify_chain(self) -> bool:
+        """Check that no record in the trail was altered, removed or reordered."""
+        with self._lock:
+            records = list(self.records)
+        return verify_chain(r.to_dict() for r in records) is None
+    
+    def flush(self):
+        """Push buffered records to the sink, if there is one."""
+        if self.sink is not None:
+            self.sink.flush()
+    
+    def close(self):
+        """Finalize the sink, if there is one."""
+        if self.sink is not None:
+            self.sink.close()
     
     def clear(self):
         """Clear all audit records."""
-        self.records.clear()
-        self._step_counter = 0
\ No newline at end of file
+        with self._lock:
+            self.records.clear()
+            self._step_counter = 0
+            self._last_digest = None
+            self._last_output = None
+            self._reset_totals()
\ No newline at end of file
@@ -0,0 +1,271 @@
+"""
+Parallel diffing and hashing of large steps across a process pool.
+
+Positional diffs and dataset hashes are split into row ranges (shards);
+keyed diffs are split into buckets of key hashes, so every row of a key
+lands in the same worker. The partial results are merged in shard order,
+which makes the DiffResult and digests identical to the serial ones.
+
+Workers are forked, so they read the step's rows straight from the parent's
+memory instead of receiving a pickled copy; keyed diffs are bucketed once in
+the parent, so each worker only touches its own bucket's rows. Where fork is
+not available (Windows) shipping the rows would cost more than diffing them,
+so auditing stays serial there. It also stays serial while other threads
+run - including the writer thread of a background sink - since forking a
+multi-threaded process is unsafe.
+"""
+
+import multiprocessing
+import os
+import threading
+from array import array
+from itertools import chain
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .changes import ChangeStats
+from .diff import (ComparisonPlan, DiffResult, _key_getter, _pair_differ, hash_join,
+                   modified_positions, positional_changes)
+from .hashing import EMPTY_DIGEST, HASH_CHUNK_ROWS, DatasetDigest, UnorderedHasher, digest_rows
+from .indexset import RowIndexSet
+
+# Rows per shard; a multiple of the Merkle chunk size so shard leaves line up
+DEFAULT_SHARD_ROWS = 64 * HASH_CHUNK_ROWS
+
+# Steps with fewer rows than this are audited serially
+DEFAULT_PARALLEL_THRESHOLD = 500000
+
+# Rows of the step being audited, inherited by the forked workers
+_shared: Dict[str, Any] = {}
+_shared_lock = threading.Lock()
+
+
+def _fork_context():
+    if multiprocessing.current_process().daemon:
+        return None  # Pool workers cannot start pools of their own
+    if threading.active_count() > 1:
+        # A forked child only gets the forking thread, so locks held by
+        # the others (e.g. a JsonlSink, SegmentedSink or StoreSink writer)
+        # stay locked in it forever
+        return None
+    try:
+        return multiprocessing.get_context("fork")
+    except ValueError:
+        return None
+
+
+# Worker tasks - each reads the rows from _shared
+def _modified_task(start: int, stop: int) -> Tuple[RowIndexSet, Optional[ChangeStats]]:
+    before, after = _shared["before"], _shared["after"]
+    positions = modified_positions(before, after, start, stop,
+                                   _shared["fingerprints"], _shared["plan"],
+                                   _shared["fingerprints_after"])
+    changes = None
+    if _shared["change_samples"] is not None:
+        changes = positional_changes(before, after, positions, _shared["change_samples"])
+    return RowIndexSet.from_sorted(positions), changes
+
+
+def _keyed_task(bucket: int) -> DiffResult:
+    before, after = _shared["before"], _shared["after"]
+
+    def in_bucket(rows, positions):
+        # Only this bucket's rows are touched (and so copied into the worker)
+        return ((i, rows[i]) for i in positions)
+
+    differs = _pair_differ(before, after, _shared["fingerprints"],
+                           _shared["fingerprints_after"])
+    return hash_join(in_bucket(before, _shared["buckets_before"][bucket]),
+                     in_bucket(after, _shared["buckets_after"][bucket]),
+                     _key_getter(_shared["key_columns"]), differs,
+                     before, _shared["change_samples"])
+
+
+def _hash_task(side: str, start: int, stop: int) -> Any:
+    rows = _shared[side][start:stop]
+    if _shared["hash_mode"] == "unordered":
+        hasher = UnorderedHasher()
+        hasher.update_many(rows)
+        return hasher
+    return digest_rows(rows).leaves
+
+
+def _key_buckets(rows: Sequence[Dict], key_of: Callable[[Dict], object],
+                 n_buckets: int) -> List[array]:
+    """Positions of the rows in each bucket of key hashes, in ascending order."""
+    buckets = [array('q') for _ in range(n_buckets)]
+    append_to = [bucket.append for bucket in buckets]
+    for i, row in enumerate(rows):
+        append_to[hash(key_of(row)) % n_buckets](i)
+    return buckets
+
+
+def _run_task(task: Tuple) -> Any:
+    func, args = task
+    return func(*args)
+
+
+class ParallelAuditor:
+    """
+    Diffs and hashes one step across a pool of forked worker processes.
+
+    Args:
+        workers: Number of worker processes (None = one per CPU)
+        shard_size: Rows per shard for positional diffs and hashing; must
+            be a multiple of provena.hashing.HASH_CHUNK_ROWS
+        threshold: Steps with fewer rows (on the larger side) stay serial
+    """
+
+    def __init__(self,
+                 workers: Optional[int] = None,
+                 shard_size: int = DEFAULT_SHARD_ROWS,
+                 threshold: int = DEFAULT_PARALLEL_THRESHOLD):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        if shard_size < 1 or shard_size % HASH_CHUNK_ROWS:
+            raise ValueError(f"shard_size must be a positive multiple of {HASH_CHUNK_ROWS}")
+        self.workers = workers
+        self.shard_size = shard_size
+        self.threshold = threshold
+        # Fork context found by applies(), reused by diff_and_hash()
+        self._context = None
+
+    def applies(self, before: Sequence, after: Sequence) -> bool:
+        """
+        Whether a step of this size is worth auditing in parallel, and
+        forking is safe right now.
+        """
+        if self.workers < 2 or max(len(before), len(after)) < max(self.threshold, 1):
+            return False
+        context = _fork_context()
+        if context is None:
+            return False
+        self._context = context
+        return True
+
+    def _ranges(self, n_rows: int) -> List[Tuple[int, int]]:
+        return [(start, min(start + self.shard_size, n_rows))
+                for start in range(0, n_rows, self.shard_size)]
+
+    def diff_and_hash(self,
+                      before: List[Dict],
+                      after: List[Dict],
+                      key_columns: Optional[Tuple[str, ...]],
+                      fingerprints_before: Optional[Sequence[int]],
+                      hash_mode: str,
+                      fingerprints_after: Optional[Sequence[int]] = None,
+                      hash_before: Optional[str] = None,
+                      change_samples: Optional[int] = None) -> Tuple[DiffResult, str, str]:
+        """
+        Diff the two sides and hash both, in one round of pool tasks.
+
+        A hash_before that is already known is passed through as is. With
+        change_samples, each shard collects ChangeStats and they are merged.
+
+        Only call it after applies() returned True for these rows.
+
+        Returns:
+            (diff, hash_before, hash_after), identical to the serial result
+        """
+        if self._context is None:
+            raise RuntimeError("diff_and_hash() called without applies() allowing it")
+        overlap = min(len(before), len(after))
+        tasks = []
+        if key_columns is None:
+            tasks.extend((_modified_task, r) for r in self._ranges(overlap))
+        else:
+            tasks.extend((_keyed_task, (b,)) for b in range(self.workers))
+        n_diff = len(tasks)
+        if hash_before is None:
+            tasks.extend((_hash_task, ("before",) + r) for r in self._ranges(len(before)))
+        n_hash_before = len(tasks) - n_diff
+        tasks.extend((_hash_task, ("after",) + r) for r in self._ranges(len(after)))
+
+        with _shared_lock:
+            _shared.update(
+                before=before,
+                after=after,
+                fingerprints=fingerprints_before,
+                fingerprints_after=fingerprints_after,
+                plan=ComparisonPlan.compile(before, after),
+                key_columns=key_columns,
+                hash_mode=hash_mode,
+                change_samples=change_samples,
+            )
+            if key_columns is not None:
+                # Bucket once here rather than in every worker
+                key_of = _key_getter(key_columns)
+                _shared.update(buckets_before=_key_buckets(before, key_of, self.workers),
+                               buckets_after=_key_buckets(after, key_of, self.workers))
+            try:
+                with self._context.Pool(min(self.workers, len(tasks))) as pool:
+                    results = pool.map(_run_task, tasks, chunksize=1)
+            finally:
+                _shared.clear()
+
+        diff_parts = results[:n_diff]
+        if key_columns is None:
+            diff = _merge_positional(diff_parts, len(before), len(after))
+        else:
+            diff = _merge_keyed(diff_parts)
+        if hash_before is None:
+            hash_before = _merge_hash(results[n_diff:n_diff + n_hash_before],
+                                      len(before), hash_mode)
+        hash_after = _merge_hash(results[n_diff + n_hash_before:], len(after), hash_mode)
+        return diff, hash_before, hash_after
+
+
+def _merge_positional(parts: List[Tuple[RowIndexSet, Optional[ChangeStats]]],
+                      n_before: int, n_after: int) -> DiffResult:
+    result = DiffResult()
+    overlap = min(n_before, n_after)
+    for modified, changes in parts:  # Shards are in row order, so this only appends
+        for start, stop in modified.ranges():
+            result.modified.add_range(start, stop)
+        result.changes = _merge_changes(result.changes, changes)
+    result.unchanged = overlap - len(result.modified)
+    result.inserted.add_range(overlap, n_after)
+    result.deleted.add_range(overlap, n_before)
+    if result.modified:
+        first = result.modified.first()
+        result.sample = (first, first)
+    return result
+
+
+def _merge_keyed(parts: List[DiffResult]) -> DiffResult:
+    def merged(name):
+        # Each bucket is already sorted; sorted() just merges the runs
+        return RowIndexSet.from_sorted(sorted(chain.from_iterable(
+            getattr(part, name) for part in parts)))
+
+    result = DiffResult(modified=merged("modified"),
+                        inserted=merged("inserted"),
+                        deleted=merged("deleted"),
+                        unchanged=sum(part.unchanged for part in parts))
+    for part in parts:
+        result.changes = _merge_changes(result.changes, part.changes)
+    samples = [part.sample for part in parts if part.sample is not None]
+    if samples:
+        # The serial join samples the first modified row in output order
+        result.sample = min(samples, key=lambda sample: sample[1])
+    return result
+
+
+def _merge_changes(total: Optional[ChangeStats],
+                   part: Optional[ChangeStats]) -> Optional[ChangeStats]:
+    if total is None or part is None:
+        return total or part
+    total.merge(part)
+    return total
+
+
+def _merge_hash(parts: List[Any], n_rows: int, hash_mode: str) -> str:
+    if not n_rows:
+        return EMPTY_DIGEST
+    if hash_mode == "unordered":
+        total = UnorderedHasher()
+        for part in parts:
+            total.merge(part)
+        return total.root
+    return DatasetDigest(list(chain.from_iterable(parts)), n_rows).root
@@ -0,0 +1,127 @@
+"""
+Per-step cost measurement - how long the user function took versus how
+long auditing it took.
+"""
+
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator, List, Optional
+
+PHASES = ("function", "audit")
+
+# tracemalloc is process-wide, so measurements share it: the first one to
+# need it starts it (unless it already runs) and the last one stops it.
+# A measurement that overlaps another one - a step in another thread or
+# asyncio task, or a nested step - can't tell whose allocations made the
+# peak, so its peak is recorded as unavailable.
+_lock = threading.Lock()
+_active: List["_Measurement"] = []
+_tracing_users = 0
+_started_tracing = False
+
+
+class _Measurement:
+    __slots__ = ("traced", "overlapped")
+
+    def __init__(self, traced: bool):
+        self.traced = traced
+        self.overlapped = False
+
+
+def _begin(traced: bool) -> _Measurement:
+    global _tracing_users, _started_tracing
+    measurement = _Measurement(traced)
+    with _lock:
+        if _active:
+            measurement.overlapped = True
+            for other in _active:
+                other.overlapped = True
+        _active.append(measurement)
+        if traced:
+            if _tracing_users == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _started_tracing = True
+            elif not measurement.overlapped and hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()  # Python 3.9+
+            _tracing_users += 1
+    return measurement
+
+
+def _end(measurement: _Measurement):
+    global _tracing_users, _started_tracing
+    with _lock:
+        _active.remove(measurement)
+        if measurement.traced:
+            _tracing_users -= 1
+            if _tracing_users == 0 and _started_tracing:
+                tracemalloc.stop()
+                _started_tracing = False
+
+
+class StepProfile:
+    """
+    Wall time, CPU time and peak allocation of one audited step, split into
+    the user function and the audit overhead (copy, diff, hash).
+
+    Peak allocation comes from tracemalloc, which slows allocation-heavy
+    code down while it runs; pass trace_memory=False to measure time only.
+    It is None (unavailable) for a phase that overlapped another step or
+    awaited. CPU time is the measuring thread's, except for awaiting
+    phases, whose CPU time is the whole process's.
+    """
+
+    __slots__ = ("trace_memory", "_stats")
+
+    def __init__(self, trace_memory: bool = True):
+        self.trace_memory = trace_memory
+        self._stats = {phase: {"wall_s": 0.0, "cpu_s": 0.0, "peak_bytes": 0}
+                       for phase in PHASES}
+
+    @contextmanager
+    def measure(self, phase: str, awaits: bool = False) -> Iterator[None]:
+        """
+        Add the cost of the enclosed block to a phase.
+
+        Pass awaits=True when the block awaits (other tasks run in it, and
+        the work may be done in other threads).
+        """
+        stats = self._stats[phase]
+        measurement = _begin(self.trace_memory and not awaits)
+        baseline = tracemalloc.get_traced_memory()[0] if measurement.traced else 0
+        clock = time.process_time if awaits else time.thread_time
+
+        wall = time.perf_counter()
+        cpu = clock()
+        try:
+            yield
+        finally:
+            stats["wall_s"] += time.perf_counter() - wall
+            stats["cpu_s"] += clock() - cpu
+            peak = None
+            if measurement.traced:
+                peak = tracemalloc.get_traced_memory()[1] - baseline
+            _end(measurement)
+            if self.trace_memory:
+                if peak is None or measurement.overlapped:
+                    stats["peak_bytes"] = None
+                elif stats["peak_bytes"] is not None:
+                    stats["peak_bytes"] = max(stats["peak_bytes"], peak)
+
+    def to_dict(self) -> Dict[str, Optional[float]]:
+        """Flat dict, e.g. {'function_wall_s': 1.2, 'audit_wall_s': 0.1, ...}."""
+        result = {}
+        for phase, stats in self._stats.items():
+            result[f"{phase}_wall_s"] = round(stats["wall_s"], 6)
+            result[f"{phase}_cpu_s"] = round(stats["cpu_s"], 6)
+            if self.trace_memory:
+                result[f"{phase}_peak_bytes"] = stats["peak_bytes"]
+        return result
+
+
+def measure(profile: Optional[StepProfile], phase: str, awaits: bool = False):
+    """profile.measure(phase), or a no-op when profiling is off."""
+    if profile is None:
+        return nullcontext()
+    return profile.measure(phase, awaits)
@@ -0,0 +1,326 @@
+"""
+Lazy reading of audit trail files.
+
+Reads the export_json() / generate_json_report() document format and the
+line-delimited format written by JsonlSink. Records are parsed one at a
+time as they are iterated, so a multi-GB trail can be summarized, filtered
+and rendered in constant memory.
+
+A JsonlSink appends one run per pipeline run to its file, each starting
+with a header line and with its own step numbering and digest chain;
+TrailFile reads them as separate runs.
+"""
+
+import json
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from .hashing import verify_chain
+from .logger import AuditRecord, TrailTotals
+from .sinks import opener_for
+
+# Keys holding the list of records in the document formats
+RECORD_LIST_KEYS = ("audit_trail", "steps")
+
+# Characters read from the file at a time
+_CHUNK_CHARS = 1 << 20
+
+_WHITESPACE = " \t\n\r"
+
+_decoder = json.JSONDecoder()
+
+
+class _JsonStream:
+    """Incremental reader of the JSON values in a text stream."""
+
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.stream.read(_CHUNK_CHARS)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character ('' at the end of the stream)."""
+        while True:
+            buffer = self.buffer
+            while self.pos < len(buffer) and buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(buffer) or not self._fill():
+                return buffer[self.pos:self.pos + 1]
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected '{char}' in audit file, found '{found or 'end of file'}'")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Decode the next JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            if end == len(self.buffer) and self._fill():
+                continue  # A number may continue in the next chunk
+            self.pos = end
+            return value
+
+
+def _document_entries(stream: TextIO) -> Iterator[Tuple[str, Any]]:
+    """
+    Yield (key, value) for the top-level fields of a JSON document; the
+    value of a record list is an iterator over its elements instead, which
+    must be consumed (or abandoned) before the next field is read.
+    """
+    parser = _JsonStream(stream)
+    parser.expect("{")
+    if parser.peek() == "}":
+        return
+    while True:
+        key = parser.value()
+        parser.expect(":")
+        if key in RECORD_LIST_KEYS and parser.peek() == "[":
+            yield key, _list_items(parser)
+        else:
+            yield key, parser.value()
+        if parser.peek() == ",":
+            parser.pos += 1
+            continue
+        parser.expect("}")
+        return
+
+
+def _list_items(parser: _JsonStream) -> Iterator[Any]:
+    parser.expect("[")
+    if parser.peek() == "]":
+        parser.pos += 1
+        return
+    while True:
+        yield parser.value()
+        if parser.peek() == ",":
+            parser.pos += 1
+            continue
+        parser.expect("]")
+        return
+
+
+def _is_record(data: Dict[str, Any]) -> bool:
+    return "step_id" in data and "function_name" in data
+
+
+def _is_record_line(line: str) -> bool:
+    """_is_record without parsing the line (the key can't occur in a header)."""
+    return '"step_id":' in line
+
+
+def _jsonl_runs(lines: Iterable[str]) -> Iterator[Tuple[Dict[str, Any], Iterator[Dict[str, Any]]]]:
+    """
+    Split JSON Lines into runs: (header, iterator over the run's record
+    dicts). Records before the first header form a run with an empty
+    header. Records of a run not read by the time the next run is asked
+    for are skipped without being parsed.
+    """
+    lines = (line for line in lines if line.strip())
+    pending = [next(lines, None)]
+
+    def run_records() -> Iterator[Dict[str, Any]]:
+        while pending[0] is not None and _is_record_line(pending[0]):
+            yield json.loads(pending[0])
+            pending[0] = next(lines, None)
+
+    while pending[0] is not None:
+        header = {}
+        if not _is_record_line(pending[0]):
+            header = json.loads(pending[0])
+            pending[0] = next(lines, None)
+        records = run_records()
+        yield header, records
+        records.close()
+        while pending[0] is not None and _is_record_line(pending[0]):
+            pending[0] = next(lines, None)
+
+
+def detect_format(filepath: str, opener: Optional[Callable[..., TextIO]] = None) -> str:
+    """'document' (export_json, reports) or 'jsonl' (JsonlSink)."""
+    with (opener or opener_for(filepath))(filepath, 'rt', encoding='utf-8') as f:
+        first_line = f.readline()
+    try:
+        data = json.loads(first_line)
+    except json.JSONDecodeError:
+        return "document"  # A document spread over lines starts with a lone '{'
+    # One complete object per line, unless the whole document is on one line
+    if isinstance(data, dict) and any(isinstance(data.get(key), list) for key in RECORD_LIST_KEYS):
+        return "document"
+    return "jsonl"
+
+
+class TrailFile:
+    """
+    An audit trail file, read lazily.
+
+    A document holds one run; a JsonlSink file holds one run per header
+    line. Runs are numbered from 1 in file order (see runs).
+
+    Args:
+        filepath: File written by export_json(), generate_json_report() or
+            a JsonlSink
+        opener: Function opening the file in text mode; by default
+            gzip.open / lzma.open for .gz / .xz files, else open
+
+    Example:
+        trail = TrailFile("Customer_Cleaning_audit.json")
+        errors = filter_records(trail.records(run=trail.runs[-1]), statuses=["ERROR"])
+        for record in errors:
+            print(record.step_id, record.message)
+    """
+
+    def __init__(self, filepath: str, opener: Optional[Callable[..., TextIO]] = None):
+        self.filepath = filepath
+        self.opener = opener or opener_for(filepath)
+        self.format = detect_format(filepath, opener)
+        self.header = self._read_header()
+
+    def _open(self) -> TextIO:
+        return self.opener(self.filepath, 'rt', encoding='utf-8')
+
+    def _read_header(self) -> Dict[str, Any]:
+        """Fields before the records (pipeline, summary, ...)."""
+        with self._open() as f:
+            if self.format == "jsonl":
+                for line in f:
+                    if line.strip():
+                        data = json.loads(line)
+                        return {} if _is_record(data) else data
+                return {}
+            header = {}
+            for key, value in _document_entries(f):
+                if key in RECORD_LIST_KEYS and not isinstance(value, list):
+                    break  # Don't read the records
+                header[key] = value
+            return header
+
+    @property
+    def pipeline_name(self) -> str:
+        return self.header.get("pipeline") or "Unknown"
+
+    @property
+    def summary(self) -> Optional[Dict[str, Any]]:
+        """The summary stored in the file, if any (JSON Lines trails have none)."""
+        return self.header.get("summary")
+
+    @property
+    def runs(self) -> List[int]:
+        """Numbers of the runs in the file (one pass over a JSON Lines file)."""
+        if self.format != "jsonl":
+            return [1]
+        count = 0
+        with self._open() as f:
+            first = True
+            for line in f:
+                if not line.strip():
+                    continue
+                if first or not _is_record_line(line):
+                    count += 1
+                    first = False
+        return list(range(1, count + 1))
+
+    def _runs(self, f: TextIO) -> Iterator[Tuple[Dict[str, Any], Iterator[Dict[str, Any]]]]:
+        """(header, record dicts) of each run in an open file."""
+        if self.format == "jsonl":
+            yield from _jsonl_runs(f)
+            return
+        for key, value in _document_entries(f):
+            if key in RECORD_LIST_KEYS:
+                yield self.header, iter(value)
+                return
+
+    def iter_runs(self) -> Iterator[Tuple[Dict[str, Any], Iterator[AuditRecord]]]:
+        """
+        (header, records) of each run, in file order; a run's records must
+        be read before asking for the next run.
+        """
+        with self._open() as f:
+            for header, entries in self._runs(f):
+                yield header, (AuditRecord.from_dict(data) for data in entries)
+
+    def records(self, run: Optional[int] = None) -> Iterator[AuditRecord]:
+        """
+        Parse the records one at a time; each call reads the file again.
+
+        Every run is read, in order, unless run picks one (see runs). Step
+        ids restart with each run.
+        """
+        for number, (_, records) in enumerate(self.iter_runs(), 1):
+            if run is None or number == run:
+                yield from records
+            if number == run:
+                return
+
+    def verify(self) -> List[str]:
+        """Problems found: runs whose digest chain is broken (see ProvenaLogger.verify_chain)."""
+        problems = []
+        with self._open() as f:
+            for number, (_, entries) in enumerate(self._runs(f), 1):
+                position = verify_chain(entries)
+                if position is not None:
+                    problems.append(f"run {number}: digest chain broken at record {position + 1}")
+        return problems
+
+
+def record_filter(statuses: Optional[Iterable[str]] = None,
+                  rule_ids: Optional[Iterable[str]] = None,
+                  functions: Optional[Iterable[str]] = None,
+                  since: Optional[str] = None,
+                  until: Optional[str] = None) -> Optional[Callable[[AuditRecord], bool]]:
+    """
+    Predicate matching the records that pass every given filter, or None
+    when no filter is given.
+
+    since / until are ISO timestamps (e.g. '2026-10-17' or
+    '2026-10-17T08:30'), compared as text with the records' timestamps:
+    since is inclusive, until exclusive.
+    """
+    statuses = frozenset(statuses) if statuses else None
+    rule_ids = frozenset(rule_ids) if rule_ids else None
+    functions = frozenset(functions) if functions else None
+    if statuses is None and rule_ids is None and functions is None \
+            and since is None and until is None:
+        return None
+
+    def matches(record: AuditRecord) -> bool:
+        return ((statuses is None or record.status in statuses)
+                and (rule_ids is None or record.rule_id in rule_ids)
+                and (functions is None or record.function_name in functions)
+                and (since is None or record.timestamp >= since)
+                and (until is None or record.timestamp < until))
+    return matches
+
+
+def filter_records(records: Iterable[AuditRecord], **filters) -> Iterator[AuditRecord]:
+    """Lazily keep the records matching every filter (see record_filter)."""
+    matches = record_filter(**filters)
+    if matches is None:
+        return iter(records)
+    return (record for record in records if matches(record))
+
+
+def summarize(pipeline_name: str, records: Iterable[AuditRecord]) -> Dict[str, Any]:
+    """Summary of a sequence of records, in the form of ProvenaLogger.get_summary()."""
+    totals = TrailTotals()
+    for record in records:
+        totals.add(record)
+    return totals.summary(pipeline_name)
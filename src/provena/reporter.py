@@ -2,119 +2,396 @@
 Generate human-readable audit reports.
 """
 
-import json
+import heapq
+import io
 from datetime import datetime
-from typing import List
-from .logger import ProvenaLogger, AuditRecord
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+from .logger import ProvenaLogger, AuditRecord, write_trail_json
+from .sinks import opener_for
 
 def _get_status_emoji(status: str) -> str:
     """Get emoji for status."""
     emoji_map = {
         "SUCCESS": "✅",
         "WARNING": "⚠️",
-        "ERROR": "❌"
+        "ERROR": "❌",
+        "CACHED": "♻️"
     }
     return emoji_map.get(status, "🔹")
 
-def generate_terminal_report(logger: ProvenaLogger) -> str:
+def _format_bytes(n: float) -> str:
+    """Format a byte count, e.g. 1536 -> '1.5 KB'."""
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+def _format_cost(performance: dict, phase: str) -> str:
+    """Format one phase of AuditRecord.performance."""
+    text = (f"{phase} {performance.get(phase + '_wall_s', 0):.3f}s"
+            f" (cpu {performance.get(phase + '_cpu_s', 0):.3f}s")
+    peak = performance.get(phase + '_peak_bytes')
+    if peak is not None:
+        text += f", peak {_format_bytes(peak)}"
+    return text + ")"
+
+def _truncate(value, width: int = 20) -> str:
+    text = repr(value)
+    return text if len(text) <= width else text[:width - 3] + "..."
+
+def _format_column_stats(column: str, counts: dict) -> str:
+    """E.g. "email: 120 changed (3 nulled, 1 filled)"."""
+    details = [f"{counts[name]} {name.replace('_', ' ')}"
+               for name in ("nulled", "filled", "type_changed") if counts.get(name)]
+    text = f"{column}: {counts['changed']} changed"
+    return text + (f" ({', '.join(details)})" if details else "")
+
+class _Selection:
     """
-    Generate a clean, terminal-friendly audit report.
-    
-    Returns:
-        Formatted string ready to print
+    Status filter, paging and the top-N "most rows affected" steps, all
+    applied in a single pass over the records.
     """
+    
+    def __init__(self,
+                 statuses: Optional[Iterable[str]] = None,
+                 page: int = 1,
+                 page_size: Optional[int] = None,
+                 top: int = 0,
+                 where: Optional[Callable[[AuditRecord], bool]] = None):
+        if page < 1:
+            raise ValueError("page must be at least 1")
+        if page_size is not None and page_size < 1:
+            raise ValueError("page_size must be positive")
+        if top < 0:
+            raise ValueError("top must not be negative")
+        self.statuses = frozenset(statuses) if statuses else None
+        self.page = page
+        self.page_size = page_size
+        self.top = top
+        self.where = where
+        self._heap: List[Tuple[int, int, int, AuditRecord]] = []
+    
+    def iterate(self, records: Iterable[AuditRecord]) -> Iterator[Tuple[int, AuditRecord]]:
+        """Yield (position in the trail, record) for the records on the page."""
+        first = (self.page - 1) * self.page_size if self.page_size else 0
+        stop = first + self.page_size if self.page_size else None
+        matched = 0
+        for ordinal, record in enumerate(records, 1):
+            if self.statuses is not None and record.status not in self.statuses:
+                continue
+            if self.where is not None and not self.where(record):
+                continue
+            if self.top:
+                self._offer(ordinal, record)
+            if matched >= first and (stop is None or matched < stop):
+                yield ordinal, record
+            matched += 1
+            if stop is not None and matched >= stop and not self.top:
+                break  # Nothing left to render or rank
+    
+    def _offer(self, ordinal: int, record: AuditRecord):
+        # Min-heap of the top N; on equal counts the earlier step wins
+        entry = (record.affected_row_count, -ordinal, ordinal, record)
+        if len(self._heap) < self.top:
+            heapq.heappush(self._heap, entry)
+        elif entry > self._heap[0]:
+            heapq.heapreplace(self._heap, entry)
+    
+    def top_records(self) -> List[Tuple[int, AuditRecord]]:
+        """(position, record) of the steps that affected the most rows."""
+        return [(ordinal, record) for _, _, ordinal, record in sorted(self._heap, reverse=True)]
+    
+    def describe(self) -> Dict[str, Any]:
+        """The options in effect, for report headers."""
+        options = {}
+        if self.statuses is not None:
+            options["statuses"] = sorted(self.statuses)
+        if self.page_size:
+            options["page"] = self.page
+            options["page_size"] = self.page_size
+        if self.top:
+            options["top"] = self.top
+        if self.where is not None:
+            options["filtered"] = True
+        return options
+
+class _LineWriter:
+    """Writes lines to a stream, separated by newlines."""
+    
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+        self._started = False
+    
+    def append(self, line: str):
+        if self._started:
+            self.stream.write("\n")
+        self.stream.write(line)
+        self._started = True
+
+def _record_lines(ordinal: int, record: AuditRecord) -> List[str]:
+    """Report lines of one step."""
     lines = []
+    emoji = _get_status_emoji(record.status)
+    
+    lines.append(f"\n[{ordinal}] {emoji} {record.function_name}")
+    lines.append(f"   • Status: {record.status}")
+    lines.append(f"   • Time: {record.timestamp[11:19]}")
+    
+    if record.rule_id:
+        lines.append(f"   • Rule: {record.rule_id}")
+    
+    lines.append(f"   • Rows: {record.rows_before} → {record.rows_after}")
+    
+    if record.audit_level != "full":
+        lines.append(f"   • Audit level: {record.audit_level}")
+    if record.estimate:
+        est = record.estimate
+        lines.append(f"   • Estimated changes: ~{est['estimated_changed_rows']}"
+                     f" ± {est['margin']} rows ({est['confidence']:.0%} confidence,"
+                     f" {est['sampled_rows']} rows sampled)")
+    
+    if record.affected_row_count > 0:
+        lines.append(f"   • Changed: {record.affected_row_count} rows")
+        if record.rows_inserted or record.rows_deleted:
+            lines.append(f"   • Modified: {record.rows_modified}, "
+                         f"Inserted: {record.rows_inserted}, "
+                         f"Deleted: {record.rows_deleted}")
+        
+        # Show sample of changed indices
+        if record.affected_row_indices:
+            lines.append(f"   • Rows: [{record.affected_row_indices.describe(5)}]")
+        if record.deleted_row_indices:
+            lines.append(f"   • Deleted rows: [{record.deleted_row_indices.describe(5)}]")
+        
+        # Per-column counters and sampled changed rows
+        if record.column_stats:
+            for column, counts in list(record.column_stats.items())[:5]:
+                lines.append(f"   • Column {_format_column_stats(column, counts)}")
+            if len(record.column_stats) > 5:
+                lines.append(f"   • ... {len(record.column_stats) - 5} more columns changed")
+        if record.change_samples:
+            for sample in record.change_samples:
+                changes = ", ".join(f"{key} = {_truncate(before)} → {_truncate(after)}"
+                                    for key, (before, after) in sample["changes"].items())
+                lines.append(f"   • Sample row {sample['row']}: {changes}")
+        
+        # Show sample changes (trails without change_samples)
+        elif record.sample_before and record.sample_after:
+            for key in record.sample_before:
+                if key in record.sample_after:
+                    before_val = record.sample_before[key]
+                    after_val = record.sample_after[key]
+                    if before_val != after_val:
+                        # Truncate long values
+                        before_str = str(before_val)
+                        after_str = str(after_val)
+                        if len(before_str) > 20:
+                            before_str = before_str[:17] + "..."
+                        if len(after_str) > 20:
+                            after_str = after_str[:17] + "..."
+                        lines.append(f"   • Sample: {key} = {before_str} → {after_str}")
+    
+    if record.performance:
+        lines.append(f"   • Cost: {_format_cost(record.performance, 'function')}"
+                     f" | {_format_cost(record.performance, 'audit')}")
+    
+    if record.message:
+        lines.append(f"   • Note: {record.message}")
+    return lines
+
+def write_terminal_report(stream: TextIO,
+                          pipeline_name: str,
+                          summary: Dict[str, Any],
+                          records: Iterable[AuditRecord],
+                          statuses: Optional[Iterable[str]] = None,
+                          page: int = 1,
+                          page_size: Optional[int] = None,
+                          top: int = 0,
+                          where: Optional[Callable[[AuditRecord], bool]] = None):
+    """
+    Write the terminal report to a stream, one step at a time.
+    
+    Steps are rendered as they are read and only the top-N steps are
+    kept, so records may be a lazy iterable over a trail of any size.
+    
+    Args:
+        stream: Writable text stream
+        pipeline_name: Name shown in the header
+        summary: Summary dict (see ProvenaLogger.get_summary)
+        records: The trail's records, in order
+        statuses: Only report steps with one of these statuses
+        page: Page to render (1-based), with page_size
+        page_size: Steps per page (None = all steps)
+        top: List the N steps that affected the most rows at the end
+        where: Only report steps this predicate accepts (see
+            provena.reader.record_filter); steps keep their position in
+            the trail as their number
+    """
+    selection = _Selection(statuses, page, page_size, top, where)
+    lines = _LineWriter(stream)
     
     # Header
     lines.append("=" * 70)
-    lines.append(f"🚀 PROVENA AUDIT REPORT: {logger.pipeline_name}")
+    lines.append(f"🚀 PROVENA AUDIT REPORT: {pipeline_name}")
     lines.append("=" * 70)
     
     # Summary
-    summary = logger.get_summary()
     lines.append(f"\n📊 SUMMARY")
     lines.append(f"   • Steps: {summary['total_steps']}")
     lines.append(f"   • Total Changes: {summary['total_changes']} rows")
+    if summary['total_inserted'] or summary['total_deleted']:
+        lines.append(f"   • Modified/Inserted/Deleted: {summary['total_modified']}"
+                     f" / {summary['total_inserted']} / {summary['total_deleted']}")
     if summary['start_time']:
         lines.append(f"   • Started: {summary['start_time'][:19]}")
+    if summary.get('audit_levels'):
+        levels = ", ".join(f"{level} {count}" for level, count in summary['audit_levels'].items())
+        lines.append(f"   • Audit levels: {levels}")
+    if summary.get('performance'):
+        perf = summary['performance']
+        lines.append(f"   • Function time: {perf['function_wall_s']:.3f}s"
+                     f" | Audit time: {perf['audit_wall_s']:.3f}s")
+        if perf['audit_overhead_pct'] is not None:
+            lines.append(f"   • Audit overhead: {perf['audit_overhead_pct']}% of function time")
+    if selection.statuses is not None:
+        lines.append(f"   • Showing: {', '.join(sorted(selection.statuses))} steps")
+    if where is not None:
+        lines.append("   • Showing: filtered steps")
+    if page_size:
+        lines.append(f"   • Page: {page} ({page_size} steps per page)")
     
     lines.append("-" * 70)
     
     # Detailed steps
-    for i, record in enumerate(logger.records, 1):
-        emoji = _get_status_emoji(record.status)
-        
-        lines.append(f"\n[{i}] {emoji} {record.function_name}")
-        lines.append(f"   • Status: {record.status}")
-        lines.append(f"   • Time: {record.timestamp[11:19]}")
-        
-        if record.rule_id:
-            lines.append(f"   • Rule: {record.rule_id}")
-        
-        lines.append(f"   • Rows: {record.rows_before} → {record.rows_after}")
-        
-        if record.affected_row_count > 0:
-            lines.append(f"   • Changed: {record.affected_row_count} rows")
-            
-            # Show sample of changed indices
-            if record.affected_row_indices:
-                indices_str = ", ".join(str(idx) for idx in record.affected_row_indices[:5])
-                if len(record.affected_row_indices) > 5:
-                    indices_str += f" (+{len(record.affected_row_indices)-5} more)"
-                lines.append(f"   • Rows: [{indices_str}]")
-            
-            # Show sample changes
-            if record.sample_before and record.sample_after:
-                for key in record.sample_before:
-                    if key in record.sample_after:
-                        before_val = record.sample_before[key]
-                        after_val = record.sample_after[key]
-                        if before_val != after_val:
-                            # Truncate long values
-                            before_str = str(before_val)
-                            after_str = str(after_val)
-                            if len(before_str) > 20:
-                                before_str = before_str[:17] + "..."
-                            if len(after_str) > 20:
-                                after_str = after_str[:17] + "..."
-                            lines.append(f"   • Sample: {key} = {before_str} → {after_str}")
-        
-        if record.message:
-            lines.append(f"   • Note: {record.message}")
+    shown = 0
+    for ordinal, record in selection.iterate(records):
+        for line in _record_lines(ordinal, record):
+            lines.append(line)
+        shown += 1
+    if not shown and selection.describe():
+        lines.append("\n   (no steps to show)")
+    
+    if top:
+        lines.append("\n" + "-" * 70)
+        lines.append(f"🔥 MOST ROWS AFFECTED (top {top})")
+        for ordinal, record in selection.top_records():
+            rule = f" [{record.rule_id}]" if record.rule_id else ""
+            lines.append(f"   [{ordinal}] {record.function_name}{rule}:"
+                         f" {record.affected_row_count} rows")
     
     # Footer
     lines.append("\n" + "=" * 70)
-    lines.append(f"📁 Export: provena export {logger.pipeline_name}.json")
+    lines.append(f"📁 Export: provena export {pipeline_name}.json")
     lines.append("=" * 70)
-    
-    return "\n".join(lines)
 
-def generate_json_report(logger: ProvenaLogger, filepath: str = None) -> str:
+def generate_terminal_report(logger: ProvenaLogger,
+                             stream: Optional[TextIO] = None,
+                             statuses: Optional[Iterable[str]] = None,
+                             page: int = 1,
+                             page_size: Optional[int] = None,
+                             top: int = 0) -> Optional[str]:
     """
-    Generate a machine-readable JSON report.
+    Generate a clean, terminal-friendly audit report.
     
     Args:
         logger: The ProvenaLogger instance
-        filepath: Optional path to save the file
+        stream: Write the report to this stream as it is rendered instead
+            of returning it
+        statuses: Only report steps with one of these statuses
+        page: Page to render (1-based), with page_size
+        page_size: Steps per page (None = all steps)
+        top: List the N steps that affected the most rows at the end
     
     Returns:
-        JSON string
+        Formatted string ready to print, or None when written to stream
+    
+    Example:
+        generate_terminal_report(logger, sys.stdout, statuses=['ERROR'], top=10)
+    """
+    target = stream if stream is not None else io.StringIO()
+    write_terminal_report(target, logger.pipeline_name, logger.get_summary(), logger.records,
+                          statuses, page, page_size, top)
+    if stream is not None:
+        stream.write("\n")
+        return None
+    return target.getvalue()
+
+def write_json_report(stream: TextIO,
+                      pipeline_name: str,
+                      summary: Dict[str, Any],
+                      records: Iterable[AuditRecord],
+                      statuses: Optional[Iterable[str]] = None,
+                      page: int = 1,
+                      page_size: Optional[int] = None,
+                      top: int = 0,
+                      where: Optional[Callable[[AuditRecord], bool]] = None):
     """
-    report = {
+    Write the JSON report to a stream, one step at a time.
+    
+    Arguments are as for write_terminal_report. The top-N steps are
+    written after the steps, as "top_affected".
+    """
+    selection = _Selection(statuses, page, page_size, top, where)
+    header = {
         "metadata": {
             "generated_at": datetime.now().isoformat(),
             "provena_version": "0.1.0",
             "report_type": "audit_trail"
         },
-        "pipeline": logger.pipeline_name,
-        "summary": logger.get_summary(),
-        "steps": [r.to_dict() for r in logger.records]
+        "pipeline": pipeline_name,
+        "summary": summary,
     }
+    if selection.describe():
+        header["selection"] = selection.describe()
+    
+    def trailer() -> Dict[str, Any]:
+        if not top:
+            return {}
+        return {"top_affected": [
+            {"position": ordinal, "step_id": record.step_id,
+             "function_name": record.function_name, "rule_id": record.rule_id,
+             "affected_row_count": record.affected_row_count}
+            for ordinal, record in selection.top_records()]}
+    
+    steps = (record for _, record in selection.iterate(records))
+    write_trail_json(stream, header, "steps", steps, trailer)
+
+def generate_json_report(logger: ProvenaLogger,
+                         filepath: Optional[str] = None,
+                         stream: Optional[TextIO] = None,
+                         statuses: Optional[Iterable[str]] = None,
+                         page: int = 1,
+                         page_size: Optional[int] = None,
+                         top: int = 0) -> Optional[str]:
+    """
+    Generate a machine-readable JSON report.
+    
+    Args:
+        logger: The ProvenaLogger instance
+        filepath: Optional path to save the file
+        stream: Optional stream to write to (not together with filepath)
+        statuses, page, page_size, top: See generate_terminal_report
+    
+    Returns:
+        JSON string (also saved to filepath, if given), or None when
+        written to stream (the report is then never held in memory as a
+        whole; to stream it into a file, pass an open file as stream or
+        use write_json_report)
+    """
+    if stream is not None and filepath:
+        raise ValueError("Pass either filepath or stream, not both")
+    args = (logger.pipeline_name, logger.get_summary(), logger.records,
+            statuses, page, page_size, top)
+    if stream is not None:
+        write_json_report(stream, *args)
+        return None
     
-    json_str = json.dumps(report, indent=2, default=str)
+    buffer = io.StringIO()
+    write_json_report(buffer, *args)
+    json_str = buffer.getvalue()
     
     if filepath:
-        with open(filepath, 'w', encoding='utf-8') as f:
+        with opener_for(filepath)(filepath, 'wt', encoding='utf-8') as f:
             f.write(json_str)
     
-    return json_str
\ No newline at end of file
+    return json_str
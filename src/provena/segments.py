@@ -0,0 +1,363 @@
+"""
+Segmented audit trails - a directory of compressed JSON Lines segments
+plus a manifest.
+
+A SegmentedSink starts a new segment once the current one holds
+max_records records or max_bytes of (uncompressed) JSON, compresses each
+segment with gzip or lzma as it is written, and lists every finished
+segment in manifest.json: its file, run, record count, first / last step
+and timestamp, size and SHA-256 digest. Runs append segments to the same
+directory instead of overwriting an earlier trail, and retention policies
+drop the oldest segments.
+
+Each segment is a complete JSON Lines trail (a header line, then one
+record per line), readable on its own with TrailFile. A SegmentedTrail
+reads the manifest and opens only the segments a query needs.
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import os
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from .logger import AuditRecord
+from .reader import TrailFile
+from .sinks import COMPRESSION_SUFFIXES, _BackgroundSink, _trail_header
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_FORMAT = "provena-segments"
+
+# Suffix of the segment being written; it is renamed once complete
+PARTIAL_SUFFIX = ".part"
+
+
+def read_manifest(directory: str) -> Dict[str, Any]:
+    """The manifest of a segment directory (an empty one if there is none yet)."""
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {"format": MANIFEST_FORMAT, "version": 1, "runs": 0, "next_segment": 1,
+                "segments": []}
+    with open(path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get("format") != MANIFEST_FORMAT:
+        raise ValueError(f"'{path}' is not a provena segment manifest")
+    return manifest
+
+
+def _write_manifest(directory: str, manifest: Dict[str, Any]):
+    # Written aside and renamed, so readers never see half a manifest
+    manifest["updated_at"] = datetime.now().isoformat()
+    path = os.path.join(directory, MANIFEST_NAME)
+    with open(path + PARTIAL_SUFFIX, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + PARTIAL_SUFFIX, path)
+
+
+class _HashingWriter(io.RawIOBase):
+    """Binary file wrapper that digests and counts the bytes written."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.raw.write(data)
+
+
+class _Segment:
+    """The segment being written: its files and the manifest entry it will get."""
+
+    def __init__(self, directory: str, number: int, run: int, pipeline_name: str,
+                 compression: str):
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", pipeline_name)
+        self.name = f"{number:06d}-{safe_name}.jsonl{COMPRESSION_SUFFIXES[compression]}"
+        self.path = os.path.join(directory, self.name)
+        self._raw = open(self.path + PARTIAL_SUFFIX, 'wb')
+        self._hashing = _HashingWriter(self._raw)
+        if compression == "gzip":
+            binary = gzip.GzipFile(filename="", mode='wb', fileobj=self._hashing)
+        elif compression == "lzma":
+            binary = lzma.LZMAFile(self._hashing, mode='wb')
+        else:
+            binary = io.BufferedWriter(self._hashing)
+        self.file = io.TextIOWrapper(binary, encoding='utf-8', newline="\n")
+        self.entry: Dict[str, Any] = {
+            "name": self.name, "number": number, "run": run, "pipeline": pipeline_name,
+            "records": 0, "uncompressed_bytes": 0,
+            "first_step": None, "last_step": None,
+            "first_timestamp": None, "last_timestamp": None,
+            "last_record_digest": None,
+            "created_at": datetime.now().isoformat(),
+        }
+
+    def write(self, line: str, step_id: str, timestamp: str, digest: Optional[str]):
+        self.file.write(line)
+        self.file.write("\n")
+        entry = self.entry
+        entry["records"] += 1
+        entry["uncompressed_bytes"] += len(line) + 1
+        if entry["first_step"] is None:
+            entry["first_step"] = step_id
+            entry["first_timestamp"] = timestamp
+        entry["last_step"] = step_id
+        entry["last_timestamp"] = timestamp
+        entry["last_record_digest"] = digest
+
+    def finish(self) -> Dict[str, Any]:
+        """Close, sync and rename the segment; returns its manifest entry."""
+        self.file.close()  # Ends the compressed stream; the raw file stays open
+        try:
+            self._raw.flush()
+            os.fsync(self._raw.fileno())
+        finally:
+            self._raw.close()
+        os.replace(self.path + PARTIAL_SUFFIX, self.path)
+        self.entry.update(size=self._hashing.size, sha256=self._hashing.sha256.hexdigest(),
+                          closed_at=datetime.now().isoformat())
+        return self.entry
+
+
+class SegmentedSink(_BackgroundSink):
+    """
+    Sink writing a directory of compressed JSON Lines segments plus a
+    manifest, with rollover and retention.
+
+    Records are serialized in the calling thread and compressed and written
+    by a background thread (see JsonlSink). A segment is only flushed,
+    synced and listed in the manifest once it is complete, i.e. after
+    rollover or when the sink is closed, so the compressor is never
+    flushed mid-stream; only one sink should write to a directory at a
+    time.
+
+    Args:
+        directory: Directory of the segments (created if missing); earlier
+            runs' segments are kept
+        max_records: Records per segment
+        max_bytes: Uncompressed JSON bytes per segment
+        compression: 'gzip', 'lzma' or 'none'
+        keep_segments: Keep at most this many segments
+        keep_days: Drop segments completed more than this many days ago
+        keep_bytes: Keep at most this many (compressed) bytes of segments;
+            the newest segment is always kept
+        batch_size: Maximum records written per batch
+        max_queue: Maximum records waiting to be written
+
+    Example:
+        sink = SegmentedSink("audit/customer_cleaning", max_records=50000,
+                             compression="lzma", keep_days=30)
+        with audit_pipeline("Customer_Cleaning", sink=sink) as logger:
+            data = clean(data)
+
+        trail = SegmentedTrail("audit/customer_cleaning")
+        for record in trail.records(since="2026-10-17T08:00"):
+            print(record.step_id, record.affected_row_count)
+    """
+
+    def __init__(self,
+                 directory: str,
+                 max_records: int = 100000,
+                 max_bytes: int = 64 << 20,
+                 compression: str = "gzip",
+                 keep_segments: Optional[int] = None,
+                 keep_days: Optional[float] = None,
+                 keep_bytes: Optional[int] = None,
+                 batch_size: int = 100,
+                 max_queue: int = 10000):
+        if compression not in COMPRESSION_SUFFIXES:
+            raise ValueError(f"Unknown compression '{compression}', "
+                             f"expected one of {tuple(COMPRESSION_SUFFIXES)}")
+        if max_records < 1 or max_bytes < 1:
+            raise ValueError("max_records and max_bytes must be at least 1")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.compression = compression
+        self.keep_segments = keep_segments
+        self.keep_days = keep_days
+        self.keep_bytes = keep_bytes
+        self.manifest = read_manifest(directory)
+        self._header: Optional[Dict[str, Any]] = None
+        self._run_number = 0
+        self._segment: Optional[_Segment] = None
+        super().__init__(directory, batch_size, max_queue, "provena-segmented-sink")
+
+    def start(self, pipeline_name: str):
+        self._put(_trail_header(pipeline_name))
+
+    def write(self, record) -> None:
+        self._put((json.dumps(record.to_dict(), default=str), record.step_id,
+                   record.timestamp, record.record_digest))
+
+    # Background writer
+    def _write_batch(self, batch: List[Any]):
+        for item in batch:
+            if isinstance(item, dict):  # A new run starts
+                self._finish_segment()
+                self.manifest["runs"] += 1
+                self._run_number = self.manifest["runs"]
+                self._header = item
+                continue
+            if self._segment is None:
+                self._open_segment()
+            self._segment.write(*item)
+            entry = self._segment.entry
+            if entry["records"] >= self.max_records or entry["uncompressed_bytes"] >= self.max_bytes:
+                self._finish_segment()
+
+    def _open_segment(self):
+        if self._header is None:
+            raise ValueError("SegmentedSink must be attached to a logger before writing")
+        number = self.manifest["next_segment"]
+        self.manifest["next_segment"] += 1
+        self._segment = _Segment(self.directory, number, self._run_number,
+                                 self._header["pipeline"], self.compression)
+        header = dict(self._header, segment=number, run=self._run_number)
+        self._segment.file.write(json.dumps(header) + "\n")
+
+    def _finish_segment(self):
+        if self._segment is None:
+            return
+        segment, self._segment = self._segment, None
+        self.manifest["segments"].append(segment.finish())
+        self._apply_retention()
+        _write_manifest(self.directory, self.manifest)
+
+    def _apply_retention(self):
+        segments = self.manifest["segments"]
+        cutoff = None
+        if self.keep_days is not None:
+            cutoff = (datetime.now() - timedelta(days=self.keep_days)).isoformat()
+        total = sum(entry["size"] for entry in segments)
+        dropped = 0
+        while dropped < len(segments) - 1:
+            oldest = segments[dropped]
+            if not ((self.keep_segments is not None
+                     and len(segments) - dropped > self.keep_segments)
+                    or (self.keep_bytes is not None and total > self.keep_bytes)
+                    or (cutoff is not None and oldest["closed_at"] < cutoff)):
+                break
+            try:
+                os.remove(os.path.join(self.directory, oldest["name"]))
+            except FileNotFoundError:
+                pass
+            total -= oldest["size"]
+            dropped += 1
+        del segments[:dropped]
+
+    def _finish(self):
+        self._finish_segment()
+
+
+class SegmentedTrail:
+    """
+    A segmented trail directory, read through its manifest.
+
+    Queries narrowed by run or time only open the segments that can hold
+    matching records.
+
+    Args:
+        directory: Directory written by a SegmentedSink
+
+    Example:
+        trail = SegmentedTrail("audit/customer_cleaning")
+        print(trail.verify())  # [] when every segment matches its digest
+        for record in trail.records(run=trail.runs[-1]):
+            print(record.step_id, record.status)
+    """
+
+    def __init__(self, directory: str):
+        if not os.path.isdir(directory):
+            raise FileNotFoundError(directory)
+        self.directory = directory
+        self.manifest = read_manifest(directory)
+        self.header: Dict[str, Any] = {"pipeline": self.pipeline_name}
+
+    @property
+    def segments(self) -> List[Dict[str, Any]]:
+        """Manifest entries of the segments, oldest first."""
+        return self.manifest["segments"]
+
+    @property
+    def runs(self) -> List[int]:
+        """Runs with at least one stored segment, oldest first."""
+        return sorted({entry["run"] for entry in self.segments})
+
+    @property
+    def pipeline_name(self) -> str:
+        segments = self.manifest["segments"]
+        return segments[-1]["pipeline"] if segments else "Unknown"
+
+    @property
+    def summary(self) -> Optional[Dict[str, Any]]:
+        """Segments store no summary (see provena.reader.summarize)."""
+        return None
+
+    def select(self,
+               run: Optional[int] = None,
+               since: Optional[str] = None,
+               until: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Entries of the segments holding records of this run / time window."""
+        return [entry for entry in self.segments
+                if (run is None or entry["run"] == run)
+                and (since is None or (entry["last_timestamp"] or "") >= since)
+                and (until is None or (entry["first_timestamp"] or "") < until)]
+
+    def segment(self, entry: Union[int, Dict[str, Any]]) -> TrailFile:
+        """One segment (a manifest entry or its number) as a TrailFile."""
+        if isinstance(entry, int):
+            matches = [e for e in self.segments if e["number"] == entry]
+            if not matches:
+                raise ValueError(f"No segment {entry} in '{self.directory}'")
+            entry = matches[0]
+        return TrailFile(os.path.join(self.directory, entry["name"]))
+
+    def records(self,
+                run: Optional[int] = None,
+                since: Optional[str] = None,
+                until: Optional[str] = None) -> Iterator[AuditRecord]:
+        """
+        Records of the selected segments, oldest first; since (inclusive) and
+        until (exclusive) also filter the records themselves.
+        """
+        for entry in self.select(run, since, until):
+            for record in self.segment(entry).records():
+                if ((since is None or record.timestamp >= since)
+                        and (until is None or record.timestamp < until)):
+                    yield record
+
+    def verify(self) -> List[str]:
+        """Problems found: missing segments and segments not matching their digest."""
+        problems = []
+        for entry in self.segments:
+            path = os.path.join(self.directory, entry["name"])
+            if not os.path.exists(path):
+                problems.append(f"{entry['name']}: missing")
+                continue
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+            if digest.hexdigest() != entry["sha256"]:
+                problems.append(f"{entry['name']}: digest mismatch")
+        return problems
+
+
+def open_trail(path: str) -> Union[TrailFile, SegmentedTrail]:
+    """A SegmentedTrail for a segment directory, else a TrailFile."""
+    if os.path.isdir(path):
+        return SegmentedTrail(path)
+    return TrailFile(path)
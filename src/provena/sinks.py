@@ -0,0 +1,193 @@
+"""
+Sinks - destinations that receive audit records as soon as they are logged.
+
+A ProvenaLogger with a sink hands every new AuditRecord to it, so a
+long-running job keeps its trail on disk as it goes instead of holding it
+in memory until export_json() runs at the end.
+"""
+
+import gzip
+import json
+import lzma
+import os
+import queue
+import threading
+from datetime import datetime
+from typing import IO, Any, Callable, Dict, List, Optional
+
+FSYNC_POLICIES = ("never", "batch", "close")
+
+# Compression -> file suffix
+COMPRESSION_SUFFIXES = {"none": "", "gzip": ".gz", "lzma": ".xz"}
+
+_OPENERS = {".gz": gzip.open, ".xz": lzma.open}
+
+_STOP = object()
+
+
+def opener_for(filepath: str) -> Callable[..., IO]:
+    """open(), gzip.open or lzma.open, by the file's suffix (.gz, .xz)."""
+    return _OPENERS.get(os.path.splitext(filepath)[1].lower(), open)
+
+
+class AuditSink:
+    """Base class for record sinks."""
+
+    def start(self, pipeline_name: str):
+        """Called once when the sink is attached to a logger."""
+
+    def write(self, record) -> None:
+        """Receive one AuditRecord."""
+        raise NotImplementedError
+
+    def flush(self):
+        """Push buffered records to their destination."""
+
+    def close(self):
+        """Flush and release resources. The sink is unusable afterwards."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class _BackgroundSink(AuditSink):
+    """Sink writing from a bounded queue in a background thread (see JsonlSink)."""
+
+    def __init__(self, destination: str, batch_size: int, max_queue: int, thread_name: str):
+        self._destination = destination
+        self.batch_size = batch_size
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=thread_name, daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        if self._closed:
+            raise ValueError("I/O operation on closed sink")
+        self._raise_pending_error()
+        self._queue.put(item)
+
+    def _raise_pending_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise IOError(f"Audit sink failed writing to '{self._destination}': {error}") from error
+
+    def flush(self):
+        """Block until every queued record has been written."""
+        self._queue.join()
+        self._raise_pending_error()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        try:
+            self._finish()
+        finally:
+            self._raise_pending_error()
+
+    def _write_batch(self, batch: List[Any]):
+        raise NotImplementedError
+
+    def _finish(self):
+        """Called once the writer thread has stopped."""
+
+    # Background writer
+    def _run(self):
+        stop = False
+        while not stop:
+            batch: List[Any] = []
+            item = self._queue.get()
+            taken = 1
+            if item is _STOP:
+                stop = True
+            else:
+                batch.append(item)
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                taken += 1
+                if item is _STOP:
+                    stop = True
+                else:
+                    batch.append(item)
+
+            try:
+                if batch:
+                    self._write_batch(batch)
+            except Exception as e:  # Reported to the producer on its next call
+                self._error = e
+            finally:
+                for _ in range(taken):
+                    self._queue.task_done()
+
+
+def _trail_header(pipeline_name: str) -> Dict[str, Any]:
+    from . import __version__
+    return {
+        "pipeline": pipeline_name,
+        "created_at": datetime.now().isoformat(),
+        "provena_version": __version__
+    }
+
+
+class JsonlSink(_BackgroundSink):
+    """
+    Append-only JSON Lines sink with a background writer thread.
+
+    Records are serialized in the calling thread (so later changes to the
+    data cannot leak into the trail) and written by a background thread,
+    which writes whatever has queued up (up to batch_size records) in one
+    go. The queue between them is bounded, so a slow disk slows the
+    pipeline down instead of growing memory.
+
+    Each run starts with a header line ({"pipeline": ..., "created_at": ...})
+    followed by one line per record.
+
+    Args:
+        filepath: File to append to (created if missing)
+        batch_size: Maximum records written per batch
+        fsync: 'batch' (fsync after every batch), 'close' (only when the sink
+            is closed) or 'never' (leave it to the OS)
+        max_queue: Maximum records waiting to be written
+    """
+
+    def __init__(self,
+                 filepath: str,
+                 batch_size: int = 100,
+                 fsync: str = "batch",
+                 max_queue: int = 10000):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy '{fsync}', expected one of {FSYNC_POLICIES}")
+        self.filepath = filepath
+        self.fsync = fsync
+        self._file = open(filepath, 'a', encoding='utf-8')
+        super().__init__(filepath, batch_size, max_queue, "provena-jsonl-sink")
+
+    def start(self, pipeline_name: str):
+        self._put(json.dumps(_trail_header(pipeline_name)))
+
+    def write(self, record) -> None:
+        self._put(json.dumps(record.to_dict(), default=str))
+
+    def _finish(self):
+        try:
+            self._file.flush()
+            if self.fsync != "never":
+                os.fsync(self._file.fileno())
+        finally:
+            self._file.close()
+
+    def _write_batch(self, batch: List[str]):
+        self._file.write("\n".join(batch) + "\n")
+        self._file.flush()
+        if self.fsync == "batch":
+            os.fsync(self._file.fileno())
@@ -0,0 +1,163 @@
+"""
+Copy-free snapshots of a dataset for the @audit_trail decorator.
+
+Instead of deep-copying every row before a transformation, a snapshot takes
+a fingerprint of each row up front and hands the function copy-on-write row
+proxies. Rows the function never writes to are never copied.
+
+Proxies are not a drop-in replacement for dicts, which is why 'cow' is
+opt-in: they fail isinstance(row, dict) and json.dumps, and nested values
+(lists, dicts) are the caller's own objects, so editing them in place
+changes the caller's data (the fingerprints still report the change).
+"""
+
+import hashlib
+from array import array
+from typing import Any, Dict, Iterator, List, Mapping, MutableMapping, Optional, Sequence
+
+# Below this many rows the old deepcopy behaviour is cheap enough to keep
+STRICT_SNAPSHOT_MAX_ROWS = 10000
+
+SNAPSHOT_MODES = ("auto", "strict", "cow")
+
+
+def row_fingerprint(row: Mapping) -> int:
+    """
+    Compute a fingerprint of a row's content.
+
+    A 64-bit blake2b digest of the row's items sorted by column, so it
+    ignores column order. Python's hash() is not used: hash(-1) ==
+    hash(-2) and 1, 1.0 and True hash alike, which would hide edits.
+    """
+    try:
+        items = sorted(row.items())  # Keys are unique, so values are never compared
+    except TypeError:
+        # Keys of mixed types
+        items = sorted(row.items(), key=lambda item: str(item[0]))
+    digest = hashlib.blake2b(repr(items).encode("utf-8", "surrogatepass"),
+                             digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+def fingerprint_rows(rows: List[Mapping]) -> Sequence[int]:
+    """Fingerprint every row of a dataset (as a compact array of int64)."""
+    return array('q', map(row_fingerprint, rows))
+
+
+class CopyOnWriteRow(MutableMapping):
+    """
+    Read-through proxy for a row that copies it only when it is written to.
+
+    Reads are served from the original row. The first write makes a private
+    shallow copy, so the caller's row itself is never modified - but the
+    values in it are shared, nested ones included. It is a MutableMapping,
+    not a dict: pass row.copy() to code that needs a real dict.
+    """
+
+    __slots__ = ("_base", "_own")
+
+    def __init__(self, base: Dict):
+        self._base = base
+        self._own: Optional[Dict] = None
+
+    @property
+    def dirty(self) -> bool:
+        """True once the row has been written to."""
+        return self._own is not None
+
+    def unwrap(self) -> Dict:
+        """Return the current row as a plain dict."""
+        return self._base if self._own is None else self._own
+
+    def _writable(self) -> Dict:
+        if self._own is None:
+            self._own = dict(self._base)
+        return self._own
+
+    # Read access (unwrap() inlined on the hot paths - row functions call
+    # these once per column per row)
+    def __getitem__(self, key: Any) -> Any:
+        own = self._own
+        return (self._base if own is None else own)[key]
+
+    def __iter__(self) -> Iterator:
+        return iter(self.unwrap())
+
+    def __len__(self) -> int:
+        return len(self.unwrap())
+
+    def __contains__(self, key: Any) -> bool:
+        own = self._own
+        return key in (self._base if own is None else own)
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        own = self._own
+        return (self._base if own is None else own).get(key, default)
+
+    def keys(self):
+        return self.unwrap().keys()
+
+    def values(self):
+        return self.unwrap().values()
+
+    def items(self):
+        return self.unwrap().items()
+
+    def copy(self) -> Dict:
+        return dict(self.unwrap())
+
+    # Write access
+    def __setitem__(self, key: Any, value: Any):
+        self._writable()[key] = value
+
+    def __delitem__(self, key: Any):
+        del self._writable()[key]
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, CopyOnWriteRow):
+            other = other.unwrap()
+        return self.unwrap() == other
+
+    def __ne__(self, other: Any) -> bool:
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"CopyOnWriteRow({self.unwrap()!r})"
+
+
+def is_row_list(data: Any) -> bool:
+    """Check whether data looks like a List[Dict] that can be proxied."""
+    return isinstance(data, list) and (not data or isinstance(data[0], dict))
+
+
+def wrap_rows(rows: List[Dict]) -> List[CopyOnWriteRow]:
+    """Wrap every row in a copy-on-write proxy."""
+    return [CopyOnWriteRow(row) for row in rows]
+
+
+def unwrap_rows(result: Any) -> Any:
+    """
+    Replace proxies in a transformation's output with plain dicts.
+
+    Rows that were never written to come back as the caller's original row
+    objects, so unchanged rows are shared between input and output.
+    """
+    if not isinstance(result, list):
+        return result
+    return [row.unwrap() if isinstance(row, CopyOnWriteRow) else row
+            for row in result]
+
+
+def resolve_snapshot_mode(mode: str, data: Any) -> str:
+    """Resolve 'auto' to 'strict' or 'cow' for the given input."""
+    if mode not in SNAPSHOT_MODES:
+        raise ValueError(f"Unknown snapshot mode '{mode}', "
+                         f"expected one of {SNAPSHOT_MODES}")
+    if not is_row_list(data):
+        # Only List[Dict] can be proxied row by row
+        return "strict"
+    if mode == "auto":
+        return "strict" if len(data) < STRICT_SNAPSHOT_MAX_ROWS else "cow"
+    return mode
@@ -0,0 +1,397 @@
+"""
+Indexed on-disk audit store.
+
+An sqlite3 database holding the records of many runs of many pipelines,
+indexed so lineage ("which steps, across which runs, touched row 48213")
+and rule-impact questions are answered without reading every trail:
+
+    runs        one row per logger (or per run of an ingested trail file)
+    steps       one row per AuditRecord: the indexed fields, plus the
+                whole record as JSON
+    row_ranges  an R-tree over the [first, last] row ranges of every
+                step's affected (output) and deleted (input) positions
+
+Lineage is by row position only. Records don't carry the key values of
+the rows they affected, so key values are not indexed, not even for
+keyed steps (their key columns are in the stored record).
+
+A StoreSink writes a logger's records as they are logged, in one
+transaction per batch.
+"""
+
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from .logger import AuditRecord
+from .sinks import AuditSink
+
+SCHEMA_VERSION = 1
+
+# Kinds of row range: positions in the step's output or in its input
+RANGE_KINDS = ("affected", "deleted")
+
+# Row positions are indexed as 32-bit integers
+MAX_INDEXED_ROW = (1 << 31) - 1
+
+_STEP_COLUMNS = ("run_id", "seq", "step_id", "function_name", "rule_id", "status",
+                 "timestamp", "rows_before", "rows_after", "affected_row_count",
+                 "rows_inserted", "rows_deleted", "rows_modified", "audit_level",
+                 "record")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    pipeline TEXT NOT NULL,
+    started_at TEXT NOT NULL,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_pipeline ON runs (pipeline, started_at);
+CREATE TABLE IF NOT EXISTS steps (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    seq INTEGER NOT NULL,
+    step_id TEXT NOT NULL,
+    function_name TEXT NOT NULL,
+    rule_id TEXT,
+    status TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    rows_before INTEGER,
+    rows_after INTEGER,
+    affected_row_count INTEGER,
+    rows_inserted INTEGER,
+    rows_deleted INTEGER,
+    rows_modified INTEGER,
+    audit_level TEXT,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS steps_run ON steps (run_id, seq);
+-- Covers rule_impact(), which then never reads the (large) stored records
+CREATE INDEX IF NOT EXISTS steps_rule ON steps (
+    rule_id, timestamp, run_id, status, affected_row_count,
+    rows_inserted, rows_deleted, rows_modified
+);
+CREATE INDEX IF NOT EXISTS steps_status ON steps (status, timestamp);
+CREATE INDEX IF NOT EXISTS steps_function ON steps (function_name, timestamp);
+CREATE INDEX IF NOT EXISTS steps_timestamp ON steps (timestamp);
+"""
+
+_RTREE = ("CREATE VIRTUAL TABLE IF NOT EXISTS row_ranges "
+          "USING rtree_i32(id, first_row, last_row, +step, +kind)")
+
+# Without the R-tree module: a plain table, slower to search for high rows
+_RANGE_TABLE = """
+CREATE TABLE IF NOT EXISTS row_ranges (
+    id INTEGER PRIMARY KEY, first_row INTEGER, last_row INTEGER, step INTEGER, kind INTEGER
+);
+CREATE INDEX IF NOT EXISTS row_ranges_first ON row_ranges (first_row, last_row);
+"""
+
+
+# A record as rows: its steps row and the (first row, last row, kind) of its ranges
+_Prepared = Tuple[Tuple, List[Tuple[int, int, int]]]
+
+
+def _prepare(run_id: int, seq: int, record: AuditRecord) -> _Prepared:
+    step = (run_id, seq, record.step_id, record.function_name, record.rule_id,
+            record.status, record.timestamp, record.rows_before, record.rows_after,
+            record.affected_row_count, record.rows_inserted, record.rows_deleted,
+            record.rows_modified, record.audit_level,
+            json.dumps(record.to_dict(), default=str))
+    ranges = []
+    for kind, indices in enumerate((record.affected_row_indices, record.deleted_row_indices)):
+        for start, stop in indices.ranges():
+            if stop - 1 > MAX_INDEXED_ROW:
+                raise ValueError(f"Row {stop - 1} of {record.step_id} is beyond the "
+                                 f"largest indexed row position ({MAX_INDEXED_ROW})")
+            ranges.append((start, stop - 1, kind))
+    return step, ranges
+
+
+def _where(conditions: List[Tuple[str, Any]]) -> Tuple[str, List[Any]]:
+    """SQL WHERE clause of the (condition, parameter) pairs whose parameter is set."""
+    clauses = []
+    params: List[Any] = []
+    for clause, value in conditions:
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple, set, frozenset)):
+            values = list(value)
+            clause = clause.replace("= ?", f"IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        else:
+            params.append(value)
+        clauses.append(clause)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+class AuditStore:
+    """
+    sqlite3 database of audit records from many runs.
+
+    The connection may be shared between threads; statements are
+    serialized by a lock.
+
+    Args:
+        filepath: Database file (created if missing), or ':memory:'
+
+    Example:
+        store = AuditStore("audit.db")
+        with audit_pipeline("Customer_Cleaning", sink=StoreSink(store)) as logger:
+            data = clean(data)
+
+        for step in store.lineage(48213, pipeline="Customer_Cleaning"):
+            print(step["run_id"], step["step_id"], step["function_name"], step["kind"])
+    """
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(filepath, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._create_schema()
+
+    def _create_schema(self):
+        conn = self._conn
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version > SCHEMA_VERSION:
+            raise ValueError(f"'{self.filepath}' was written by a newer version of provena "
+                             f"(schema {version})")
+        if self.filepath != ":memory:":
+            conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        try:
+            conn.execute(_RTREE)
+        except sqlite3.OperationalError:  # sqlite built without the R-tree module
+            conn.executescript(_RANGE_TABLE)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+
+    # Writing
+    def start_run(self, pipeline_name: str, source: Optional[str] = None,
+                  started_at: Optional[str] = None) -> int:
+        """Register a new run and return its run_id; started_at defaults to now."""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO runs (pipeline, started_at, source) VALUES (?, ?, ?)",
+                (pipeline_name, started_at or datetime.now().isoformat(), source))
+            return cursor.lastrowid
+
+    def add_records(self, run_id: int, records: Iterable[Tuple[int, AuditRecord]]):
+        """Insert (seq, record) pairs of a run in one transaction."""
+        self._insert([_prepare(run_id, seq, record) for seq, record in records])
+
+    def _insert(self, prepared: List[_Prepared]):
+        insert_step = (f"INSERT INTO steps ({', '.join(_STEP_COLUMNS)}) "
+                       f"VALUES ({', '.join('?' * len(_STEP_COLUMNS))})")
+        with self._lock, self._conn:
+            conn = self._conn
+            ranges = []
+            for step, step_ranges in prepared:
+                step_key = conn.execute(insert_step, step).lastrowid
+                ranges.extend((first, last, step_key, kind) for first, last, kind in step_ranges)
+            conn.executemany("INSERT INTO row_ranges (first_row, last_row, step, kind) "
+                             "VALUES (?, ?, ?, ?)", ranges)
+
+    def ingest(self, filepath: str, batch_size: int = 1000, opener=None) -> List[int]:
+        """
+        Add the records of an audit file (see provena.reader.TrailFile),
+        each run in it (one per header line of a JSON Lines file) as a new
+        run; returns their run_ids.
+        """
+        from .reader import TrailFile
+        trail = TrailFile(filepath, opener)
+        run_ids = []
+        for header, records in trail.iter_runs():
+            run_id = self.start_run(header.get("pipeline") or trail.pipeline_name,
+                                    source=filepath, started_at=header.get("created_at"))
+            run_ids.append(run_id)
+            batch: List[Tuple[int, AuditRecord]] = []
+            for seq, record in enumerate(records, 1):
+                batch.append((seq, record))
+                if len(batch) >= batch_size:
+                    self.add_records(run_id, batch)
+                    batch = []
+            if batch:
+                self.add_records(run_id, batch)
+        return run_ids
+
+    # Queries
+    def _query(self, sql: str, params: Iterable[Any] = ()) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, list(params))]
+
+    def runs(self, pipeline: Optional[str] = None, limit: Optional[int] = None
+             ) -> List[Dict[str, Any]]:
+        """Runs, newest first, with their step counts."""
+        where, params = _where([("r.pipeline = ?", pipeline)])
+        sql = ("SELECT r.run_id, r.pipeline, r.started_at, r.source, "
+               "(SELECT COUNT(*) FROM steps s WHERE s.run_id = r.run_id) AS steps "
+               f"FROM runs r{where} ORDER BY r.run_id DESC")
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self._query(sql, params)
+
+    def lineage(self,
+                row: int,
+                pipeline: Optional[str] = None,
+                kind: Optional[str] = None,
+                run_id: Optional[int] = None,
+                since: Optional[str] = None,
+                until: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Steps that touched the row at this position: as an output row they
+        modified or inserted (kind 'affected') or as an input row they
+        deleted (kind 'deleted'). Oldest first.
+
+        row is a position within each step's output or input, not a key
+        value: after a step that filters or reorders, the same position
+        holds a different row (see the module docstring).
+
+        since / until are ISO timestamps (since inclusive, until exclusive).
+        """
+        if kind is not None and kind not in RANGE_KINDS:
+            raise ValueError(f"Unknown kind '{kind}', expected one of {RANGE_KINDS}")
+        where, params = _where([
+            ("g.first_row <= ?", row),
+            ("g.last_row >= ?", row),
+            ("g.kind = ?", RANGE_KINDS.index(kind) if kind is not None else None),
+            ("r.pipeline = ?", pipeline),
+            ("s.run_id = ?", run_id),
+            ("s.timestamp >= ?", since),
+            ("s.timestamp < ?", until),
+        ])
+        found = self._query(
+            "SELECT r.pipeline, s.run_id, s.step_id, s.function_name, s.rule_id, s.status, "
+            "s.timestamp, g.kind, g.first_row, g.last_row "
+            "FROM row_ranges g JOIN steps s ON s.id = g.step JOIN runs r ON r.run_id = s.run_id"
+            f"{where} ORDER BY s.timestamp, s.run_id, s.seq", params)
+        for step in found:
+            step["kind"] = RANGE_KINDS[step["kind"]]
+        return found
+
+    def steps(self,
+              pipeline: Optional[str] = None,
+              run_id: Optional[int] = None,
+              rule_ids: Optional[Iterable[str]] = None,
+              statuses: Optional[Iterable[str]] = None,
+              functions: Optional[Iterable[str]] = None,
+              since: Optional[str] = None,
+              until: Optional[str] = None,
+              limit: Optional[int] = None) -> Iterator[AuditRecord]:
+        """Stored records matching every given filter, oldest first."""
+        where, params = _where([
+            ("r.pipeline = ?", pipeline),
+            ("s.run_id = ?", run_id),
+            ("s.rule_id = ?", tuple(rule_ids) if rule_ids else None),
+            ("s.status = ?", tuple(statuses) if statuses else None),
+            ("s.function_name = ?", tuple(functions) if functions else None),
+            ("s.timestamp >= ?", since),
+            ("s.timestamp < ?", until),
+        ])
+        sql = ("SELECT s.record FROM steps s JOIN runs r ON r.run_id = s.run_id"
+               f"{where} ORDER BY s.timestamp, s.run_id, s.seq")
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        for step in self._query(sql, params):
+            yield AuditRecord.from_dict(json.loads(step["record"]))
+
+    def rule_impact(self,
+                    rule_ids: Optional[Iterable[str]] = None,
+                    pipeline: Optional[str] = None,
+                    since: Optional[str] = None,
+                    until: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Per rule_id: steps and runs it ran in, rows it inserted, deleted and
+        modified, warnings and errors, first and last time it ran. Rules
+        that affected the most rows come first.
+        """
+        where, params = _where([
+            ("s.rule_id = ?", tuple(rule_ids) if rule_ids else None),
+            ("r.pipeline = ?", pipeline),
+            ("s.timestamp >= ?", since),
+            ("s.timestamp < ?", until),
+        ])
+        return self._query(
+            "SELECT s.rule_id, COUNT(*) AS steps, COUNT(DISTINCT s.run_id) AS runs, "
+            "SUM(s.affected_row_count) AS rows_affected, "
+            "SUM(s.rows_inserted) AS rows_inserted, SUM(s.rows_deleted) AS rows_deleted, "
+            "SUM(s.rows_modified) AS rows_modified, "
+            "SUM(s.status = 'WARNING') AS warnings, SUM(s.status = 'ERROR') AS errors, "
+            "MIN(s.timestamp) AS first_seen, MAX(s.timestamp) AS last_seen "
+            f"FROM steps s JOIN runs r ON r.run_id = s.run_id{where} "
+            "GROUP BY s.rule_id ORDER BY rows_affected DESC, s.rule_id", params)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class StoreSink(AuditSink):
+    """
+    Sink writing a logger's records to an AuditStore, batch_size records
+    per transaction. Each logger it is attached to starts a new run.
+
+    Args:
+        store: An AuditStore, or the path of its database (then the sink
+            opens the store and closes it when it is closed)
+        batch_size: Records inserted per transaction
+
+    Example:
+        logger = ProvenaLogger("Customer_Cleaning", sink=StoreSink("audit.db"),
+                               keep_records=False)
+    """
+
+    def __init__(self, store: Union[str, AuditStore], batch_size: int = 1000):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self._owns_store = not isinstance(store, AuditStore)
+        self.store = AuditStore(store) if self._owns_store else store
+        self.batch_size = batch_size
+        self.run_id: Optional[int] = None
+        self._seq = 0
+        self._batch: List[_Prepared] = []
+        self._closed = False
+
+    def start(self, pipeline_name: str):
+        self.flush()
+        self.run_id = self.store.start_run(pipeline_name)
+        self._seq = 0
+
+    def write(self, record) -> None:
+        if self._closed:
+            raise ValueError("I/O operation on closed sink")
+        if self.run_id is None:
+            raise ValueError("StoreSink must be attached to a logger before writing")
+        self._seq += 1
+        # Serialized now, so later changes to the data cannot leak into the store
+        self._batch.append(_prepare(self.run_id, self._seq, record))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._batch:
+            batch, self._batch = self._batch, []
+            self.store._insert(batch)
+
+    def close(self):
+        if self._closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self._closed = True
+            if self._owns_store:
+                self.store.close()
@@ -0,0 +1,299 @@
+"""
+Bounded-memory diffing for row streams.
+
+A StreamDiffer sees every input row as the transformation pulls it and
+every output row as it is produced, pairs them up (by position, or by key
+within a window) and keeps running counts, digests and samples. Only rows
+still waiting for their counterpart are held in memory, and never more
+than `window` of them.
+"""
+
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .changes import ChangeStats
+from .diff import ComparisonPlan, DiffResult, KeyColumns, _key_getter, normalize_key_columns
+from .hashing import PairedHasher, StreamingHasher, UnorderedHasher
+from .snapshot import CopyOnWriteRow
+
+# Default number of unmatched input rows held while streaming
+DEFAULT_WINDOW = 10000
+
+
+class StreamDiffer:
+    """
+    Incremental diff between an input stream and an output stream.
+
+    Positional mode pairs the n-th output row with the n-th input row.
+    Keyed mode matches rows by key among the input rows still pending.
+    When more than `window` input rows are pending, the oldest one is
+    counted as deleted. With change_samples, modified rows are also fed to
+    a ChangeStats (see provena.changes).
+    """
+
+    def __init__(self,
+                 key_column: Optional[KeyColumns] = None,
+                 window: int = DEFAULT_WINDOW,
+                 hash_mode: str = "ordered",
+                 change_samples: Optional[int] = None):
+        if window < 1:
+            raise ValueError("window must be at least 1")
+        self.key_columns = normalize_key_columns(key_column)
+        self.window = window
+        self._key_of = _key_getter(self.key_columns) if self.key_columns else None
+
+        self.result = DiffResult()
+        if change_samples is not None:
+            self.result.changes = ChangeStats(change_samples)
+        self.rows_before = 0
+        self.rows_after = 0
+        self.columns_before = []
+        self.columns_after = []
+        self.sample_before: Dict[str, Any] = {}
+        self.sample_after: Dict[str, Any] = {}
+
+        hasher = UnorderedHasher if hash_mode == "unordered" else StreamingHasher
+        self._hash_before = hasher()
+        self._hash_after = hasher()
+        self._plan: Optional[ComparisonPlan] = None
+
+        # Positional mode: FIFO of (input position, row)
+        self._queue: Deque[Tuple[int, Dict]] = deque()
+        # Keyed mode: input position -> (key, row) in arrival order,
+        # plus key -> pending input positions (oldest first)
+        self._pending: "OrderedDict[int, Tuple[Any, Dict]]" = OrderedDict()
+        self._by_key: Dict[Any, Deque[int]] = {}
+
+    # Input side
+    def add_input(self, row: Dict):
+        """Register an input row as the transformation reads it."""
+        index = self.rows_before
+        self.rows_before += 1
+        if index == 0:
+            self.columns_before = list(row.keys())
+        self._hash_before.update(row)
+
+        if self._key_of is None:
+            self._queue.append((index, row))
+            if len(self._queue) > self.window:
+                self.result.deleted.append(self._queue.popleft()[0])
+        else:
+            key = self._key_of(row)
+            self._pending[index] = (key, row)
+            self._by_key.setdefault(key, deque()).append(index)
+            if len(self._pending) > self.window:
+                self._evict_oldest()
+
+    def _evict_oldest(self):
+        index, (key, _) = self._pending.popitem(last=False)
+        self._pop_key(key)
+        self.result.deleted.append(index)
+
+    def _pop_key(self, key: Any) -> int:
+        positions = self._by_key[key]
+        index = positions.popleft()
+        if not positions:
+            del self._by_key[key]
+        return index
+
+    # Output side
+    def add_output(self, row: Dict):
+        """Register an output row and diff it against its input row."""
+        position = self.rows_after
+        self.rows_after += 1
+        if position == 0:
+            self.columns_after = list(row.keys())
+        self._hash_after.update(row)
+
+        if self._key_of is None:
+            if not self._queue:
+                self.result.inserted.append(position)
+                return
+            index, row_before = self._queue.popleft()
+        else:
+            key = self._key_of(row)
+            if key not in self._by_key:
+                self.result.inserted.append(position)
+                return
+            index = self._pop_key(key)
+            _, row_before = self._pending.pop(index)
+
+        if self._plan is None:
+            columns = list(row_before.keys())
+            columns.extend(c for c in row.keys() if c not in row_before)
+            self._plan = ComparisonPlan(columns, row_before)
+
+        if self._plan.rows_equal(row_before, row):
+            self.result.unchanged += 1
+            return
+
+        self.result.modified.append(position)
+        if self.result.sample is None:
+            self.result.sample = (index, position)
+            self.sample_before = row_before
+            self.sample_after = row
+        if self.result.changes is not None:
+            self.result.changes.add(index, position, row_before, row)
+
+    def finish(self) -> DiffResult:
+        """Count every still-pending input row as deleted."""
+        if self._key_of is None:
+            self.result.deleted.extend(index for index, _ in self._queue)
+            self._queue.clear()
+        else:
+            self.result.deleted.extend(self._pending.keys())
+            self._pending.clear()
+            self._by_key.clear()
+        return self.result
+
+    @property
+    def hash_before(self) -> str:
+        return _hasher_root(self._hash_before)
+
+    @property
+    def hash_after(self) -> str:
+        return _hasher_root(self._hash_after)
+
+    @property
+    def pending(self) -> int:
+        """Input rows currently held while waiting for their output row."""
+        return len(self._queue) + len(self._pending)
+
+
+class RowDiffer:
+    """
+    Incremental diff of a row -> row function: every output row is compared
+    with the one input row it was made from, so nothing is held between
+    rows and nothing has to be matched up.
+
+    The function is handed CopyOnWriteRow proxies; a proxy returned without
+    having been written to is unchanged without any comparison, and only
+    rows that were written to or replaced are compared value by value. A
+    function returning None drops the row (counted as deleted).
+
+    Exposes the same finish() / counts / samples / hashes as StreamDiffer,
+    so ProvenaLogger.log_stream() logs it.
+    """
+
+    key_columns = None
+
+    def __init__(self, hash_mode: str = "ordered", change_samples: Optional[int] = None):
+        self.result = DiffResult()
+        if change_samples is not None:
+            self.result.changes = ChangeStats(change_samples)
+        self.rows_before = 0
+        self.rows_after = 0
+        self.columns_before = []
+        self.columns_after = []
+        self.sample_before: Dict[str, Any] = {}
+        self.sample_after: Dict[str, Any] = {}
+
+        # Ordered digests share the leaves of chunks the function left alone
+        self._paired = PairedHasher() if hash_mode != "unordered" else None
+        if self._paired is None:
+            self._hash_before = UnorderedHasher()
+            self._hash_after = UnorderedHasher()
+        self._roots: Optional[Tuple[str, str]] = None
+        self._plan: Optional[ComparisonPlan] = None
+
+    def add_batch(self, rows_before: List[Dict], results: List[Any]) -> List[Dict]:
+        """
+        Diff a batch of input rows against the function's result for each
+        (a CopyOnWriteRow, a dict or None); returns the output rows.
+        """
+        if not rows_before:
+            return []
+        if self.rows_before == 0:
+            self.columns_before = list(rows_before[0].keys())
+
+        result = self.result
+        changes = result.changes
+        start = i = self.rows_before
+        j = self.rows_after
+        output = []
+        changed = []  # Offsets of output rows that are not their input row
+        for row_before, row in zip(rows_before, results):
+            if row is None:
+                result.deleted.append(i)
+                i += 1
+                continue
+            if type(row) is CopyOnWriteRow:
+                # row.dirty / row.unwrap(), inlined for the per-row loop
+                own = row._own
+                written = own is not None
+                row = own if written else row._base
+            else:
+                written = row is not row_before
+            if not written:
+                result.unchanged += 1
+            elif row == row_before or self._rows_equal(row_before, row):
+                result.unchanged += 1
+                changed.append(i - start)
+            else:
+                changed.append(i - start)
+                result.modified.append(j)
+                if result.sample is None:
+                    result.sample = (i, j)
+                    self.sample_before = row_before
+                    self.sample_after = row
+                if changes is not None:
+                    changes.add(i, j, row_before, row)
+            output.append(row)
+            i += 1
+            j += 1
+
+        if output and self.rows_after == 0:
+            self.columns_after = list(output[0].keys())
+        if self._paired is not None:
+            self._paired.update(rows_before, output, changed)
+        else:
+            self._hash_before.update_many(rows_before)
+            self._hash_after.update_many(output)
+        self.rows_before = i
+        self.rows_after = j
+        return output
+
+    def _rows_equal(self, row_before: Dict, row_after: Dict) -> bool:
+        if self._plan is None:
+            columns = list(row_before.keys())
+            columns.extend(c for c in row_after.keys() if c not in row_before)
+            self._plan = ComparisonPlan(columns, row_before)
+        return self._plan.values_equal(row_before, row_after)
+
+    def finish(self) -> DiffResult:
+        return self.result
+
+    def _digests(self) -> Tuple[str, str]:
+        if self._roots is None:
+            if self._paired is not None:
+                before, after = self._paired.finish()
+                self._roots = (before.root, after.root)
+            else:
+                self._roots = (self._hash_before.root, self._hash_after.root)
+        return self._roots
+
+    @property
+    def hash_before(self) -> str:
+        return self._digests()[0]
+
+    @property
+    def hash_after(self) -> str:
+        return self._digests()[1]
+
+
+def _hasher_root(hasher: Any) -> str:
+    if isinstance(hasher, StreamingHasher):
+        return hasher.finish().root
+    return hasher.root
+
+
+def track_input(rows: Iterable[Dict], differ: StreamDiffer) -> Iterator[Any]:
+    """
+    Feed rows to the differ as they are consumed.
+
+    Rows are handed out as copy-on-write proxies so in-place edits by the
+    transformation never reach the row the differ compares against.
+    """
+    for row in rows:
+        differ.add_input(row)
+        yield CopyOnWriteRow(row) if isinstance(row, dict) else row
@@ -0,0 +1,66 @@
+from provena import ProvenaLogger, audit_trail
+from provena.cache import ResultCache, code_hash
+
+ROWS = [{"id": 1, "amount": 10}, {"id": 2, "amount": 20}]
+
+
+def make(offset):
+    def shift(data):
+        return [dict(row, amount=row["amount"] + offset) for row in data]
+    return shift
+
+
+def run_cached(func, cache, data=ROWS):
+    logger = ProvenaLogger(pipeline_name="cache_test")
+    output = audit_trail(rule_id="STEP", cache=cache)(func)(data, provena_logger=logger)
+    return output, logger.records[-1].status
+
+
+def test_closure_values_are_part_of_the_key(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    assert code_hash(make(5)) != code_hash(make(10))
+
+    assert run_cached(make(5), cache) == ([{"id": 1, "amount": 15}, {"id": 2, "amount": 25}],
+                                          "SUCCESS")
+    output, status = run_cached(make(10), cache)
+    assert status == "SUCCESS"
+    assert output == [{"id": 1, "amount": 20}, {"id": 2, "amount": 30}]
+    assert run_cached(make(10), cache)[1] == "CACHED"
+
+
+def test_default_arguments_are_part_of_the_key(tmp_path):
+    cache = ResultCache(str(tmp_path))
+
+    def scale(data, factor=2):
+        return [dict(row, amount=row["amount"] * factor) for row in data]
+
+    assert run_cached(scale, cache)[0][0]["amount"] == 20
+    scale.__defaults__ = (3,)
+    output, status = run_cached(scale, cache)
+    assert status == "SUCCESS"
+    assert output[0]["amount"] == 30
+
+
+def test_referenced_globals_are_part_of_the_key():
+    global LIMIT
+
+    def capped(data):
+        return [dict(row, amount=min(row["amount"], LIMIT)) for row in data]
+
+    LIMIT = 15
+    before = code_hash(capped)
+    LIMIT = 25
+    assert code_hash(capped) != before
+
+
+def test_unstable_values_are_not_cached(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    marker = object()
+
+    def tag(data):
+        return [dict(row, tagged=marker is not None) for row in data]
+
+    assert code_hash(tag) is None
+    assert run_cached(tag, cache)[1] == "SUCCESS"
+    assert run_cached(tag, cache)[1] == "SUCCESS"
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,51 @@
+import json
+import os
+
+import pytest
+
+from provena import JsonlSink, ProvenaLogger, SegmentedSink, audit_trail
+from provena.cli import main
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("name", ["csv_audit_final.json", "customer_audit.json",
+                                  "manual_test_audit.json"])
+def test_report_on_exports_without_insert_delete_totals(name, capsys):
+    path = os.path.join(ROOT, name)
+    with open(path, encoding="utf-8") as f:
+        assert "total_inserted" not in json.load(f)["summary"]
+
+    assert main(["report", path]) == 0
+    assert "PROVENA AUDIT REPORT" in capsys.readouterr().out
+
+    assert main(["report", path, "--format", "json"]) == 0
+    summary = json.loads(capsys.readouterr().out)["summary"]
+    assert summary["total_inserted"] >= 0 and summary["total_deleted"] >= 0
+
+
+def _write_runs(sink_type, path):
+    """Two runs of one pipeline; the second drops a row the first kept."""
+    @audit_trail(rule_id="POSITIVE")
+    def positive(data):
+        return [row for row in data if row["amount"] > 0]
+
+    for amounts in ([1, 2, 3], [1, -2, 3]):
+        logger = ProvenaLogger(pipeline_name="runs", sink=sink_type(path))
+        positive([{"amount": amount} for amount in amounts], provena_logger=logger)
+        logger.close()
+
+
+@pytest.mark.parametrize("sink_type, path_name", [(JsonlSink, "trail.jsonl"),
+                                                  (SegmentedSink, "segments")])
+def test_compare_picks_runs(sink_type, path_name, tmp_path, capsys):
+    path = str(tmp_path / path_name)
+    _write_runs(sink_type, path)
+
+    # By default the last runs are compared
+    assert main(["compare", path, path]) == 0
+    assert main(["compare", path, path, "--baseline-run", "1"]) == 1
+    assert main(["compare", path, path, "--baseline-run", "2", "--candidate-run", "2"]) == 0
+    capsys.readouterr()
+    assert main(["compare", path, path, "--candidate-run", "3"]) == 1
+    assert "has no run 3" in capsys.readouterr().err
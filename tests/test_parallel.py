@@ -0,0 +1,28 @@
+import pytest
+
+from provena import ProvenaLogger, audit_trail
+from provena.parallel import ParallelAuditor
+
+
+def test_diff_and_hash_needs_applies():
+    rows = [{"id": i} for i in range(10)]
+    with pytest.raises(RuntimeError):
+        ParallelAuditor(workers=2, threshold=1).diff_and_hash(rows, rows, None, None, "ordered")
+
+
+def test_parallel_step_matches_serial():
+    def run(workers):
+        logger = ProvenaLogger(pipeline_name="parallel_test", workers=workers,
+                               parallel_threshold=1)
+
+        @audit_trail(rule_id="DOUBLE", key_column="id")
+        def double_odd(data):
+            return [dict(row, value=row["value"] * 2) if row["id"] % 2 else row
+                    for row in data if row["id"] != 4]
+
+        double_odd([{"id": i, "value": i} for i in range(50)], provena_logger=logger)
+        record = logger.records[-1]
+        return (record.rows_modified, record.rows_deleted, record.hash_before,
+                record.hash_after)
+
+    assert run(2) == run(1)
@@ -0,0 +1,37 @@
+import io
+import json
+
+import pytest
+
+from provena import ProvenaLogger, audit_trail
+from provena.reporter import generate_json_report
+
+
+@pytest.fixture
+def logger():
+    logger = ProvenaLogger(pipeline_name="report_test")
+
+    @audit_trail(rule_id="DROP_EMPTY")
+    def drop_empty(data):
+        return [row for row in data if row["name"]]
+
+    drop_empty([{"name": "a"}, {"name": ""}], provena_logger=logger)
+    return logger
+
+
+def test_json_report_to_file_or_stream(logger, tmp_path):
+    path = tmp_path / "report.json"
+    text = generate_json_report(logger, filepath=str(path))
+    assert path.read_text(encoding="utf-8") == text
+
+    stream = io.StringIO()
+    assert generate_json_report(logger, stream=stream) is None
+    streamed = json.loads(stream.getvalue())
+    assert streamed["steps"] == json.loads(text)["steps"]
+
+
+def test_json_report_rejects_file_and_stream(logger, tmp_path):
+    path = tmp_path / "report.json"
+    with pytest.raises(ValueError):
+        generate_json_report(logger, filepath=str(path), stream=io.StringIO())
+    assert not path.exists()
@@ -0,0 +1,25 @@
+from provena import ProvenaLogger, audit_trail
+from provena.snapshot import row_fingerprint
+
+
+def test_fingerprint_tells_apart_values_hash_confuses():
+    assert row_fingerprint({"delta": -1}) != row_fingerprint({"delta": -2})
+    assert row_fingerprint({"flag": 1}) != row_fingerprint({"flag": True})
+    assert row_fingerprint({"a": 1, "b": 2}) == row_fingerprint({"b": 2, "a": 1})
+
+
+def test_cow_snapshot_sees_minus_one_to_minus_two():
+    logger = ProvenaLogger(pipeline_name="snapshot_test")
+
+    @audit_trail(rule_id="DECREMENT", snapshot="cow")
+    def decrement(data):
+        for row in data:
+            row["delta"] -= 1
+        return data
+
+    rows = [{"id": 1, "delta": -1}, {"id": 2, "delta": 5}]
+    output = decrement(rows, provena_logger=logger)
+
+    assert [row["delta"] for row in output] == [-2, 4]
+    assert rows[0]["delta"] == -1
+    assert logger.records[-1].rows_modified == 2